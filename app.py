@@ -2,12 +2,31 @@
 
 import streamlit as st
 import os
-from typing import Optional
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
-from modules.file_loader import load_documents
-from modules.embedder import create_vectorstore
-from modules.qa_chain import build_qa_chain
-from modules.memory_manager import load_chat_history, save_chat_history
+
+# Load environment variables before the modules below read their BRAINDOC_* settings.
+load_dotenv()
+
+from modules.chunker import chunking_id
+from modules.file_loader import read_upload_bytes
+from modules.embedder import detach_vectorstore, embedding_model_id, get_embeddings
+from modules.embedding_cache import get_embedding_cache
+from modules.index_factory import default_index_type
+from modules.index_cache import (
+    cache_stats,
+    corpus_fingerprint,
+    diff_manifest,
+    file_digest,
+    load_cached_index,
+    save_cached_index,
+)
+from modules.hybrid_retriever import as_hybrid_retriever
+from modules.ingest import ingest_uploads
+from modules.qa_chain import build_qa_chain, get_answer_cache
+from modules.memory_manager import HISTORY_PAGE_SIZE, append_chat_turn, get_history_store
+from modules.metrics import REGISTRY, export_metrics, start_metrics_server
+from modules.resources import resource_stats
 
 
 SUSPECT_PATTERNS = [
@@ -53,9 +72,27 @@ def is_question_safe(question: str, domain: Optional[str] = None):
 
     return True, ""
 
-# Load environment variables
-load_dotenv()
+
+def _load_more_history():
+    st.session_state.history_limit += HISTORY_PAGE_SIZE
+
+
+def _reset_history_pages():
+    st.session_state.history_limit = HISTORY_PAGE_SIZE
+
+
+def _errors_by_file(errors) -> Dict[str, List[str]]:
+    # Indexes cached before errors were keyed by file hold a flat list that cannot be attributed.
+    return dict(errors) if isinstance(errors, dict) else {"": list(errors or [])}
+
+
+def _flatten_errors(errors_by_file: Dict[str, List[str]]) -> List[str]:
+    return [msg for msgs in errors_by_file.values() for msg in msgs]
+
+
 openai_api_key = os.getenv("OPENAI_API_KEY")
+# No-op unless BRAINDOC_METRICS_PORT is set; runs once per process.
+start_metrics_server()
 
 st.set_page_config(page_title="BrainDoc AI - Document Intelligence", layout="wide")
 
@@ -211,13 +248,16 @@ st.markdown(
 st.title("🧠✨ BrainDoc AI")
 st.markdown('<p style="text-align: center; font-size: 1.15rem; color: #4f46e5; margin-top: -1rem; margin-bottom: 2.5rem; font-weight: 600;">Unlock Insights from Every Document</p>', unsafe_allow_html=True)
 
-# Load chat history into session
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = load_chat_history()
+# History is read from the store a page at a time
+if "history_limit" not in st.session_state:
+    st.session_state.history_limit = HISTORY_PAGE_SIZE
 if "last_answer" not in st.session_state:
     st.session_state.last_answer = None
 if "last_question" not in st.session_state:
     st.session_state.last_question = None
+# (question, domain, corpus fingerprint, source filter) behind last_answer; the model is only called when it changes.
+if "last_query" not in st.session_state:
+    st.session_state.last_query = None
 
 # Layout: controls on the left, chat on the right
 controls_col, chat_col = st.columns([1, 1.6], gap="large")
@@ -253,14 +293,84 @@ with chat_col:
     elif not openai_api_key:
         st.warning("Set OPENAI_API_KEY in your .env to generate answers.")
     else:
-        with st.spinner("Indexing documents... (parsing & embedding)"):
-            all_docs, load_errors = load_documents(uploaded_files)
-
-        retriever = None
-        embed_errors = []
+        file_manifest = {f.name: file_digest(read_upload_bytes(f)) for f in uploaded_files}
+        embeddings = get_embeddings(openai_api_key)
+        # The backend's model id keys the index, so switching backends never reuses foreign vectors.
+        model_id = embedding_model_id(embeddings)
+        # Chunk boundaries depend on the domain's chunking profile, so it keys the index too.
+        chunking = chunking_id(domain)
+        fingerprint = corpus_fingerprint(
+            list(file_manifest.values()),
+            namespace=f"{model_id}|{default_index_type()}|{chunking}",
+        )
+
+        cached = load_cached_index(fingerprint, embeddings)
+        if cached is not None:
+            retriever, index_info = cached
+        else:
+            # Only parse and embed the files that changed since the index this session last used.
+            previous_retriever, previous_info = st.session_state.get("active_index", (None, {}))
+            if previous_info.get("chunking") != chunking:
+                # Never mix chunks cut by different profiles in one index.
+                previous_retriever, previous_info = None, {}
+            added, removed = diff_manifest(previous_info.get("files", {}), file_manifest)
+            kept = [name for name in file_manifest if name not in added]
+            new_files = [f for f in uploaded_files if f.name in added]
+
+            progress = st.progress(0.0, text=f"Indexing {len(new_files)} file(s)... (parsing & embedding)")
+
+            # Errors are kept per file, so an incremental rebuild can drop exactly those of removed files.
+            load_errors_by_file = {
+                name: msgs for name, msgs in _errors_by_file(previous_info.get("load_errors")).items() if name in kept
+            }
+            embed_errors_by_file = {
+                name: msgs for name, msgs in _errors_by_file(previous_info.get("embed_errors")).items() if name in kept
+            }
+
+            def _show_progress(event):
+                if event["load_errors"]:
+                    load_errors_by_file[event["file"]] = event["load_errors"]
+                if event["embed_errors"]:
+                    embed_errors_by_file[event["file"]] = event["embed_errors"]
+                progress.progress(
+                    event["files_done"] / event["files_total"],
+                    text=f"Indexed {event['file']} ({event['chunks']} chunks) - "
+                    f"{event['files_done']}/{event['files_total']} files",
+                )
 
-        if all_docs:
-            retriever, embed_errors = create_vectorstore(all_docs, openai_api_key)
+            vectorstore, new_load_errors, _ = ingest_uploads(
+                new_files,
+                embeddings,
+                vectorstore=detach_vectorstore(previous_retriever, removed),
+                on_progress=_show_progress,
+                domain=domain,
+            )
+            progress.empty()
+            retriever = as_hybrid_retriever(vectorstore) if vectorstore is not None else None
+
+            # A parse failure outside any one file is reported for this run only.
+            attributed = set(_flatten_errors(load_errors_by_file))
+            unattributed = [msg for msg in new_load_errors if msg not in attributed]
+            if unattributed:
+                load_errors_by_file[""] = unattributed
+
+            index_info = {
+                "files": file_manifest,
+                "embedding_model": model_id,
+                "chunking": chunking,
+                "chunk_count": vectorstore.index.ntotal if vectorstore is not None else 0,
+                "load_errors": load_errors_by_file,
+                "embed_errors": embed_errors_by_file,
+            }
+            if retriever is not None:
+                save_cached_index(fingerprint, retriever, index_info)
+            export_metrics()
+
+        st.session_state.active_index = (retriever, index_info)
+
+        load_errors = _flatten_errors(_errors_by_file(index_info.get("load_errors")))
+        embed_errors = _flatten_errors(_errors_by_file(index_info.get("embed_errors")))
+        chunk_count = index_info.get("chunk_count", 0)
 
         if load_errors:
             st.warning("Some files could not be processed:\n" + "\n".join(load_errors))
@@ -268,42 +378,112 @@ with chat_col:
         if embed_errors:
             st.warning("Some chunks were skipped during embedding:\n" + "\n".join(embed_errors))
 
-        if not all_docs or retriever is None:
+        if not chunk_count or retriever is None:
             st.error("No documents were processed successfully.")
         else:
-            qa_chain = build_qa_chain(retriever, openai_api_key, domain)
-
+            # Reuse the chain (and its model client) across reruns until the corpus or domain changes.
+            chain_key = (fingerprint, domain)
+            if st.session_state.get("qa_chain_key") != chain_key:
+                st.session_state.qa_chain = build_qa_chain(retriever, openai_api_key, domain, corpus_id=fingerprint)
+                st.session_state.qa_chain_key = chain_key
+            qa_chain = st.session_state.qa_chain
+
+            index_stats = cache_stats()
             st.sidebar.markdown("### Session Metrics")
             st.sidebar.metric("Documents Uploaded", len(uploaded_files))
-            st.sidebar.metric("Chunks Indexed", len(all_docs))
-            st.sidebar.metric("Total Questions Asked", len(st.session_state.chat_history))
+            st.sidebar.metric("Chunks Indexed", chunk_count)
+            # Every browser session shares one history log; an indexed COUNT per render keeps them all in step.
+            st.sidebar.metric("Total Questions Asked", get_history_store().count())
+            # Caches, shared indexes and the metrics registry are shared by every session in this process.
+            st.sidebar.markdown("### Process Metrics (all sessions)")
+            st.sidebar.metric("Index Cache Hits", index_stats["hits"])
+            st.sidebar.metric("Index Cache Misses", index_stats["misses"])
+            shared = resource_stats()
+            st.sidebar.metric(
+                "Shared Indexes (resident MB)",
+                f"{shared['indexes']} ({shared['resident_bytes'] / 2**20:.1f} / {shared['budget_bytes'] / 2**20:.0f})",
+            )
+            embedding_cache = get_embedding_cache()
+            st.sidebar.metric("Embedding Cache Hit Rate", f"{embedding_cache.hit_rate():.0%}")
+            st.sidebar.metric("Embedding Tokens Saved", embedding_cache.stats["tokens_saved"])
+            answer_stats = get_answer_cache().stats
+            st.sidebar.metric("Answer Cache Hits", answer_stats["hits"] + answer_stats["similar_hits"])
+            pipeline = REGISTRY.snapshot()
+            counters = pipeline["counters"]
+            st.sidebar.metric(
+                "LLM Tokens (prompt / completion)",
+                f"{int(counters.get('prompt_tokens', 0))} / {int(counters.get('completion_tokens', 0))}",
+            )
+            st.sidebar.metric("Estimated Cost", f"${counters.get('cost_usd', 0.0):.4f}")
+            if pipeline["stages"]:
+                with st.sidebar.expander("Stage Timings"):
+                    st.table(
+                        [
+                            {
+                                "stage": stage,
+                                "calls": entry["count"],
+                                "total ms": round(entry["total_ms"], 1),
+                                "avg ms": round(entry["total_ms"] / entry["count"], 1),
+                                "p95 ms": round(entry["p95_ms"], 1),
+                            }
+                            for stage, entry in pipeline["stages"].items()
+                        ]
+                    )
             if load_errors:
                 st.sidebar.write(f"File warnings: {len(load_errors)}")
 
-            # Chat input always visible when docs are ready
-            user_question = st.text_input(
-                "Type your question",
-                placeholder="Ask about your documents...",
-                label_visibility="collapsed",
-            )
+            selected_sources = []
+            if len(file_manifest) > 1:
+                selected_sources = st.multiselect(
+                    "Search only these documents",
+                    options=list(file_manifest),
+                    help="Leave empty to search every uploaded document.",
+                )
 
-            if user_question:
+            # Chat input always visible when docs are ready. A form only reruns the
+            # question on submit, not on every unrelated widget interaction.
+            with st.form("question_form"):
+                user_question = st.text_input(
+                    "Type your question",
+                    placeholder="Ask about your documents...",
+                    label_visibility="collapsed",
+                ).strip()
+                asked = st.form_submit_button("Ask")
+
+            query = (user_question, domain, fingerprint, tuple(sorted(selected_sources)))
+            if asked and user_question and query != st.session_state.last_query:
                 is_safe, reason = is_question_safe(user_question, domain)
                 if not is_safe:
                     st.warning(f"Question blocked for safety: {reason}")
                 else:
-                    with st.spinner("Retrieving answer..."):
-                        try:
-                            result = qa_chain.run(user_question)
-                            answer = result["answer"] if isinstance(result, dict) and "answer" in result else result
-                            sources = result["sources"] if isinstance(result, dict) and "sources" in result else []
-                            st.session_state.chat_history.append((user_question, answer))
-                            save_chat_history(st.session_state.chat_history)
-                            st.session_state.last_question = user_question
-                            st.session_state.last_answer = answer
-                            st.session_state.last_sources = sources
-                        except Exception as exc:
-                            st.error(f"Could not generate an answer: {exc}")
+                    stream_box = st.empty()
+                    stream_box.caption("Retrieving answer...")
+                    try:
+                        answer_parts = []
+                        for event in qa_chain.stream(user_question, sources=selected_sources):
+                            if event["type"] == "sources":
+                                sources = event["sources"]
+                            elif event["type"] == "token":
+                                answer_parts.append(event["text"])
+                                stream_box.markdown(
+                                    f'<div class="qa-bubble" style="background:#f7f8fa;"><div class="qa-label">Answer</div><div class="qa-text">{"".join(answer_parts)}▌</div></div>',
+                                    unsafe_allow_html=True,
+                                )
+                            else:
+                                answer = event["answer"]
+                                answered_from_cache = event.get("cached", False)
+                        # The finished answer is shown in "Latest Answer" below and saved exactly once.
+                        stream_box.empty()
+                        append_chat_turn(user_question, answer)
+                        export_metrics()
+                        st.session_state.last_question = user_question
+                        st.session_state.last_answer = answer
+                        st.session_state.last_sources = sources
+                        st.session_state.last_cached = answered_from_cache
+                        st.session_state.last_query = query
+                    except Exception as exc:
+                        stream_box.empty()
+                        st.error(f"Could not generate an answer: {exc}")
             # Show the most recent answer prominently before history
             if st.session_state.last_answer:
                 st.markdown("---")
@@ -316,22 +496,39 @@ with chat_col:
                     f'<div class="qa-bubble" style="background:#f7f8fa;"><div class="qa-label">Answer</div><div class="qa-text">{st.session_state.last_answer}</div></div>',
                     unsafe_allow_html=True,
                 )
+                if st.session_state.get("last_cached"):
+                    st.caption("⚡ Answered from cache")
                 if "last_sources" in st.session_state and st.session_state.last_sources:
                     st.markdown("**📄 Sources Used:**")
                     for i, doc in enumerate(st.session_state.last_sources, 1):
                         preview = doc.page_content[:150] + "..." if len(doc.page_content) > 150 else doc.page_content
-                        st.caption(f"**Chunk {i}:** {preview}")
-            # Show previous conversations as expandable dropdowns with full text
-            if st.session_state.chat_history:
+                        score = doc.metadata.get("relevance_score")
+                        label = f"Chunk {i} (relevance {score:.2f})" if score is not None else f"Chunk {i}"
+                        st.caption(f"**{label}:** {preview}")
+            # Previous conversations are paged from the history store; an answer is
+            # only fetched once its expander is opened, so reruns stay flat as history grows.
+            history_store = get_history_store()
+            history_search = st.session_state.get("history_search", "")
+            shown = st.session_state.history_limit
+            turns = history_store.page(limit=shown + 1, query=history_search, answers=False)
+            if turns or history_search:
                 st.markdown("---")
                 st.markdown("#### Previous Conversations")
-                history = list(reversed(st.session_state.chat_history))
-                for idx, (q, a) in enumerate(history, 1):
+                st.text_input("Search past questions", key="history_search", on_change=_reset_history_pages)
+                if not turns:
+                    st.caption("No past questions match your search.")
+                for idx, turn in enumerate(turns[:shown], 1):
+                    q = turn["question"]
                     label_q = q if len(q) <= 90 else q[:90] + "..."
-                    with st.expander(f"Conversation {idx}: {label_q}", expanded=False):
-                        st.markdown("**Question**")
-                        st.write(q)
-                        st.markdown("**Answer**")
-                        st.write(a)
+                    expander = st.expander(f"Conversation {idx}: {label_q}", key=f"history_turn_{turn['id']}", on_change="rerun")
+                    with expander:
+                        if expander.open:
+                            stored = history_store.get_turn(turn["id"]) or {}
+                            st.markdown("**Question**")
+                            st.write(q)
+                            st.markdown("**Answer**")
+                            st.write(stored.get("answer", ""))
+                if len(turns) > shown:
+                    st.button("Load more", on_click=_load_more_history)
 
 
@@ -0,0 +1 @@
+# BrainDoc AI benchmarks package marker
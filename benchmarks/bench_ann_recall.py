@@ -0,0 +1,98 @@
+"""Recall@k vs query latency for the index types in modules.index_factory.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_ann_recall --size 100000 --dim 384
+
+The corpus is a synthetic mixture of Gaussian clusters (normalized, like
+OpenAI embeddings). Ground truth comes from the flat index; latency is the
+mean over single-query searches, which is how the app queries.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from modules.index_factory import build_index, new_index, resolve_index_spec
+
+SWEEPS = [
+    {"type": "flat"},
+    {"type": "ivf_flat", "nprobe": 4},
+    {"type": "ivf_flat", "nprobe": 16},
+    {"type": "ivf_flat", "nprobe": 64},
+    {"type": "hnsw", "ef_search": 16},
+    {"type": "hnsw", "ef_search": 64},
+    {"type": "hnsw", "ef_search": 128},
+    {"type": "ivf_pq", "nprobe": 16},
+    {"type": "ivf_pq", "nprobe": 64},
+]
+
+
+def synthetic_corpus(size: int, dim: int, clusters: int, queries: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size)
+    corpus = centers[labels] + 0.6 * rng.standard_normal((size, dim)).astype(np.float32)
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+
+    picks = rng.choice(size, queries, replace=False)
+    query_vectors = corpus[picks] + 0.05 * rng.standard_normal((queries, dim)).astype(np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    return corpus, query_vectors.astype(np.float32)
+
+
+def _apply_search_params(index, spec):
+    """Search-time knobs can change without retraining, so sweeps reuse one trained index."""
+    import faiss
+
+    if spec["type"] == "hnsw":
+        faiss.downcast_index(index).hnsw.efSearch = int(spec["ef_search"])
+    elif "nprobe" in spec:
+        faiss.extract_index_ivf(index).nprobe = int(spec["nprobe"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, nargs="+", default=[4, 10])
+    args = parser.parse_args()
+
+    corpus, queries = synthetic_corpus(args.size, args.dim, args.clusters, args.queries)
+    max_k = max(args.k)
+
+    truth_index = new_index(resolve_index_spec("flat", args.size, args.dim), args.dim)
+    truth_index.add(corpus)
+    _, truth = truth_index.search(queries, max_k)
+
+    built = {}
+    header = f"{'index':<10} {'params':<40} {'build s':>8} {'ms/query':>9}"
+    header += "".join(f" {f'recall@{k}':>10}" for k in args.k)
+    print(header)
+    for sweep in SWEEPS:
+        spec = resolve_index_spec(sweep, args.size, args.dim)
+        if spec["type"] not in built:
+            started = time.perf_counter()
+            built[spec["type"]] = (build_index(corpus, spec), time.perf_counter() - started)
+        index, build_seconds = built[spec["type"]]
+        _apply_search_params(index, spec)
+
+        found = np.empty((len(queries), max_k), dtype=np.int64)
+        started = time.perf_counter()
+        for row, query in enumerate(queries):
+            found[row] = index.search(query[None, :], max_k)[1][0]
+        latency_ms = (time.perf_counter() - started) * 1000 / len(queries)
+
+        params = ", ".join(f"{key}={value}" for key, value in spec.items() if key != "type")
+        line = f"{spec['type']:<10} {params:<40} {build_seconds:>8.2f} {latency_ms:>9.3f}"
+        for k in args.k:
+            hits = sum(len(set(found[row, :k]) & set(truth[row, :k])) for row in range(len(queries)))
+            line += f" {hits / (k * len(queries)):>10.3f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Chunk count, embedding tokens and retrieval hit-rate: structure-aware chunking vs the old splitter.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_chunking --k 3
+
+Every text file in `samples/` is chunked several ways and indexed together with
+the offline `local` embedding backend:
+
+- baseline: `RecursiveCharacterTextSplitter(chunk_size=700, chunk_overlap=100)`, the previous splitter
+- default:  `chunker.chunk_text` with the default profile for every file
+- legal-clauses / education-sections / finance-tables: the default profile,
+  except that one domain's files use that stricter profile
+
+At 256 tokens the default profile scores 33 chunks / 92% hybrid hit against
+43 / 81% for the baseline. No stricter profile beats it (legal 33 / 92%,
+education 31 / 88%, finance 34 / 92%), which is why every domain uses the
+default profile.
+
+A question counts as a hit when one of its top `k` chunks contains the
+expected fact (whitespace-insensitive). Hit-rate is reported for hybrid
+retrieval and for dense retrieval alone.
+"""
+
+import argparse
+import os
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from modules import embedder
+from modules.chunker import (
+    EDUCATION_CHUNK_PROFILE,
+    FINANCE_CHUNK_PROFILE,
+    LEGAL_CHUNK_PROFILE,
+    chunk_profile,
+    chunk_text,
+)
+from modules.file_loader import _decode_text
+from modules.tokenizer import _get_encoding, count_tokens, normalize_text
+
+SAMPLES_DIR = "samples"
+SAMPLE_DOMAINS = {
+    "COURSE_SYLLABUS.txt": "Education",
+    "course_outline.txt": "Education",
+    "SOFTWARE_LICENSE_AGREEMENT.txt": "Legal",
+    "legal_contract.txt": "Legal",
+    "FINANCIAL_REPORT.txt": "Finance",
+    "finance_example.txt": "Finance",
+    "MEDICAL_REPORT.txt": "Healthcare",
+    "healthcare_sample.txt": "Healthcare",
+}
+# (question, fact its answer must contain)
+QUESTIONS = [
+    ("How many computers may the licensee install the software on?", "up to five (5) computers or servers"),
+    ("What is the initial license fee?", "initial license fee of $50,000"),
+    ("What penalty applies to late license payments?", "penalty of 1.5% per month"),
+    ("What is the cap on the licensor's liability?", "in the twelve (12) months preceding the claim"),
+    ("How much notice is needed to terminate the license for convenience?", "Licensee may terminate this Agreement with ninety (90) days' written notice"),
+    ("Which law governs the software license agreement?", "governed by the laws of the State of California"),
+    ("How much will the client pay for the IT consulting services?", "Client agrees to pay $5,000 total"),
+    ("How can either party terminate the service agreement?", "15 days written notice"),
+    ("What was CloudSoft's long-term debt in 2025?", "Long-term Debt $65,000,000"),
+    ("How much revenue came from software subscriptions in 2025?", "Software Subscriptions $285,400,000"),
+    ("What was the diluted EPS?", "Diluted EPS $4.48"),
+    ("What is the debt-to-equity ratio?", "Debt-to-Equity Ratio: 0.49"),
+    ("What share of revenue comes from the top 10 customers?", "approximately 28% of annual revenue"),
+    ("What revenue growth does management expect for 2026?", "Revenue growth of 12-15% year-over-year"),
+    ("What was NovaTech's net profit for the quarter?", "Net Profit: $730,000"),
+    ("How much are the programming assignments worth?", "Programming Assignments (6): 40%"),
+    ("What is the late penalty for programming assignments?", "10% penalty per day late"),
+    ("When is the midterm exam?", "Wednesday, March 12, 2026"),
+    ("What is covered in weeks 9-10?", "Week 9-10: Attention Mechanisms and Transformers"),
+    ("When is the project proposal due?", "Project proposal (due Week 10): 5%"),
+    ("How is the data science course assessed?", "Homework (30%)"),
+    ("What was the patient's hemoglobin A1c?", "Hemoglobin A1c: 8.2%"),
+    ("What does the echocardiogram show for Michael Johnson?", "Ejection fraction 50% (borderline low)"),
+    ("What medication dose change is recommended for blood pressure?", "Increase Lisinopril to 20mg daily"),
+    ("What did John Doe's ECG show?", "ECG shows signs of left ventricular hypertrophy"),
+    ("What was John Doe's LDL cholesterol?", "LDL cholesterol: 162 mg/dL"),
+]
+CANDIDATE_PROFILES = {
+    "Legal": LEGAL_CHUNK_PROFILE,
+    "Education": EDUCATION_CHUNK_PROFILE,
+    "Finance": FINANCE_CHUNK_PROFILE,
+}
+
+
+def _read_samples():
+    texts = {}
+    for name in sorted(SAMPLE_DOMAINS):
+        with open(os.path.join(SAMPLES_DIR, name), "rb") as handle:
+            texts[name] = _decode_text(handle.read())
+    return texts
+
+
+def _baseline(texts):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=700, chunk_overlap=100)
+    return [Document(page_content=piece, metadata={"source": name}) for name, text in texts.items() for piece in splitter.split_text(text)]
+
+
+def _chunked(texts, overrides=None):
+    """Chunk with each file's domain profile, with `overrides` (`{domain: profile}`) applied on top."""
+    docs = []
+    for name, text in texts.items():
+        profile = chunk_profile(SAMPLE_DOMAINS[name], ".txt")
+        override = (overrides or {}).get(SAMPLE_DOMAINS[name])
+        if override is not None:
+            profile = dict(override, tokens=profile["tokens"], overlap=profile["overlap"])
+        docs.extend(chunk_text(text, {"source": name}, profile))
+    return docs
+
+
+def _hit_rate(retriever, k: int) -> float:
+    hits = 0
+    for question, fact in QUESTIONS:
+        wanted = normalize_text(fact).lower()
+        found = retriever.invoke(question, k=k)
+        hits += any(wanted in normalize_text(doc.page_content).lower() for doc in found)
+    return hits / len(QUESTIONS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--k", type=int, default=3)
+    args = parser.parse_args()
+
+    texts = _read_samples()
+    print(f"files={len(texts)} questions={len(QUESTIONS)} k={args.k} tokenizer={'tiktoken' if _get_encoding() else 'chars/4 estimate'}")
+    print(f"{'strategy':<18} {'chunks':>6} {'per doc':>8} {'tokens':>7} {'hybrid hit':>11} {'dense hit':>10}")
+    runs = [("baseline", _baseline(texts)), ("default", _chunked(texts))]
+    runs += [(profile["name"], _chunked(texts, {domain: profile})) for domain, profile in CANDIDATE_PROFILES.items()]
+    for label, docs in runs:
+        retriever, _ = embedder.create_vectorstore(docs, None, embedding_backend="local")
+        tokens = sum(count_tokens(doc.page_content) for doc in docs)
+        hybrid = _hit_rate(retriever, args.k)
+        dense = _hit_rate(retriever.model_copy(update={"weights": (1.0, 0.0)}), args.k)
+        print(f"{label:<18} {len(docs):>6} {len(docs) / len(texts):>8.1f} {tokens:>7} {hybrid:>11.0%} {dense:>10.0%}")
+
+
+if __name__ == "__main__":
+    main()
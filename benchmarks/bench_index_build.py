@@ -0,0 +1,97 @@
+"""Index build time and peak Python memory: per-batch merge_from vs single build.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_index_build --sizes 1000 10000 100000
+
+Embeddings are synthetic (seeded NumPy vectors returned as lists, like the
+OpenAI client), so the numbers isolate indexing overhead from network time.
+Each measurement runs in a fresh process; memory is the growth in peak RSS
+during the build, so FAISS's native buffers are included.
+"""
+
+import argparse
+import multiprocessing
+import resource
+import time
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from modules import embedder
+
+
+class SyntheticEmbeddings(Embeddings):
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def embed_documents(self, texts):
+        rng = np.random.default_rng(len(texts))
+        return rng.standard_normal((len(texts), self.dim), dtype=np.float32).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def _documents(count: int):
+    return [
+        Document(page_content=f"synthetic chunk {i} " * 8, metadata={"source": f"file{i % 50}.txt"})
+        for i in range(count)
+    ]
+
+
+def build_merge_from(documents, embeddings, batch_size: int = 32):
+    """The original create_vectorstore loop: one FAISS store per batch, merged into the first."""
+    vectorstore = None
+    for start in range(0, len(documents), batch_size):
+        tmp_store = FAISS.from_documents(documents[start : start + batch_size], embeddings)
+        if vectorstore is None:
+            vectorstore = tmp_store
+        else:
+            vectorstore.merge_from(tmp_store)
+    return vectorstore
+
+
+def build_single(documents, embeddings, batch_size: int = 32):
+    vectorstore, _ = embedder.add_documents(None, documents, embeddings)
+    return vectorstore
+
+
+BUILDERS = {"merge_from": build_merge_from, "single": build_single}
+
+
+def _measure(name: str, size: int, dim: int):
+    # Synthetic embeddings have no upstream quota; keep the shared buckets out of the timing.
+    embedder.configure_rate_limits(float("inf"), float("inf"))
+    documents = _documents(size)
+    embeddings = SyntheticEmbeddings(dim)
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    store = BUILDERS[name](documents, embeddings)
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    assert store.index.ntotal == size
+    # ru_maxrss is reported in KiB on Linux.
+    return elapsed, (peak - baseline) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dim", type=int, default=384)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print(f"{'chunks':>8} {'path':<12} {'seconds':>9} {'peak MiB':>9}")
+    for size in args.sizes:
+        for name in BUILDERS:
+            with context.Pool(1) as pool:
+                elapsed, peak_mib = pool.apply(_measure, (name, size, args.dim))
+            print(f"{size:>8} {name:<12} {elapsed:>9.3f} {peak_mib:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""BM25 build time and per-query latency on a synthetic corpus.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_lexical_search --chunks 100000
+
+Chunks are ~110 words drawn from a Zipf-distributed 50k-term vocabulary
+(roughly a 700-character splitter chunk). Queries mix frequent and rare terms.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from modules.lexical_index import BM25Index
+
+
+def _corpus(chunks: int, vocabulary: int, words: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    terms = np.array([f"t{i}" for i in range(vocabulary)])
+    ids = np.minimum(rng.zipf(1.2, size=(chunks, words)) - 1, vocabulary - 1)
+    return [" ".join(terms[row]) for row in ids], terms, rng
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    args = parser.parse_args()
+
+    texts, terms, rng = _corpus(args.chunks, args.vocabulary, 110)
+    started = time.perf_counter()
+    index = BM25Index.from_texts([str(i) for i in range(len(texts))], texts)
+    tokenized = time.perf_counter() - started
+    started = time.perf_counter()
+    index.search("t0", 1)
+    postings = time.perf_counter() - started
+
+    queries = [" ".join(terms[rng.integers(0, 2000, size=5)]) for _ in range(args.queries)]
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query, args.k)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    print(f"chunks={args.chunks} add={tokenized:.2f}s postings={postings:.2f}s")
+    print(f"query ms: p50={np.percentile(latencies, 50):.2f} p95={np.percentile(latencies, 95):.2f} max={max(latencies):.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Answer latency percentiles with and without hedged model calls.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_llm_hedging --questions 400
+
+The model is simulated: most calls take ~0.1s (lognormal), and a
+`--slow-rate` fraction stall for `--stall` seconds, like a hung upstream
+response. Retrieval runs for real against a small local-backend index.
+"""
+
+import argparse
+import asyncio
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage
+
+from modules import qa_chain
+from modules.embedder import create_vectorstore
+
+
+class _SimulatedModel:
+    def __init__(self, name: str, slow_rate: float, stall: float, seed: int):
+        self.model_name = name
+        self.slow_rate = slow_rate
+        self.stall = stall
+        self.rng = np.random.default_rng(seed)
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        self.calls += 1
+        delay = self.stall if self.rng.random() < self.slow_rate else float(self.rng.lognormal(np.log(0.1), 0.3))
+        await asyncio.sleep(delay)
+        return AIMessage(content="ok")
+
+
+async def _run(chain, questions: int, concurrency: int, hedge: bool):
+    slots = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def _one(i: int):
+        async with slots:
+            started = time.perf_counter()
+            await chain.arun(f"question {i}", hedge=hedge, retries=0)
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(_one(i) for i in range(questions)))
+    return np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--slow-rate", type=float, default=0.03)
+    parser.add_argument("--stall", type=float, default=3.0)
+    args = parser.parse_args()
+
+    docs = [Document(page_content=f"Clause {i} sets renewal terms.", metadata={"source": "a.txt"}) for i in range(50)]
+    retriever, _ = create_vectorstore(docs, None, embedding_backend="local")
+    for hedge in (False, True):
+        model = _SimulatedModel(f"simulated-{hedge}", args.slow_rate, args.stall, seed=0)
+        chain = qa_chain.build_qa_chain(retriever, None, "Legal", max_source_docs=2, llm=model)
+        latencies = asyncio.run(_run(chain, args.questions, args.concurrency, hedge))
+        extra = model.calls / args.questions - 1
+        print(
+            f"hedge={'on ' if hedge else 'off'} p50={np.percentile(latencies, 50):.0f}ms "
+            f"p95={np.percentile(latencies, 95):.0f}ms p99={np.percentile(latencies, 99):.0f}ms "
+            f"max={latencies.max():.0f}ms extra_calls={extra:.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Document loading throughput: inline vs process-pool parsing.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_load_documents --copies 300 --workers 1 2 4
+
+The files in `samples/` are replicated (under distinct names) until there are
+`--copies` uploads. `samples/blank.pdf` is included, so the image-only PDF
+fallback path is part of the measurement. Pool timings include worker start-up;
+the small-input inline shortcut is disabled so every count above 1 uses the pool.
+"""
+
+import argparse
+import os
+import time
+from types import SimpleNamespace
+
+from modules import file_loader
+
+SAMPLES_DIR = "samples"
+
+
+def _uploads(copies: int):
+    samples = []
+    for name in sorted(os.listdir(SAMPLES_DIR)):
+        with open(os.path.join(SAMPLES_DIR, name), "rb") as f:
+            samples.append((name, f.read()))
+
+    uploads = []
+    for i in range(copies):
+        name, data = samples[i % len(samples)]
+        stem, suffix = os.path.splitext(name)
+        uploads.append(SimpleNamespace(name=f"{stem}-{i}{suffix}", getvalue=lambda data=data: data))
+    return uploads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--copies", type=int, default=300)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+
+    file_loader.LOADER_POOL_MIN_BYTES = 0
+    uploads = _uploads(args.copies)
+    print(f"{os.cpu_count()} CPU(s), {len(uploads)} files")
+    print(f"{'workers':>8} {'seconds':>9} {'files/s':>9} {'chunks':>8} {'errors':>7}")
+    for workers in args.workers:
+        started = time.perf_counter()
+        docs, errors = file_loader.load_documents(uploads, workers=workers)
+        elapsed = time.perf_counter() - started
+        print(f"{workers:>8} {elapsed:>9.3f} {len(uploads) / elapsed:>9.1f} {len(docs):>8} {len(errors):>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Peak RSS while parsing one large PDF: temp-file loader vs in-memory streaming.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_pdf_memory --pages 500
+
+A text-heavy PDF is generated with PyMuPDF. Each path runs in a fresh process
+and reports the growth in peak RSS over a baseline taken after the upload's
+bytes are already in memory (as they are in Streamlit):
+
+- tempfile: the original loader (write a temp file, PyPDFLoader, split the full page list)
+- list:     load_documents, which parses from memory but still returns every chunk
+- stream:   iter_documents, consumed chunk by chunk as the embedding pipeline does
+"""
+
+import argparse
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+from types import SimpleNamespace
+
+import pymupdf
+
+WORDS = "tenant landlord premises covenant indemnity termination notice payment schedule clause".split()
+
+
+def _pdf_bytes(pages: int) -> bytes:
+    line = " ".join(WORDS * 2)
+    with pymupdf.open() as pdf:
+        for number in range(pages):
+            page = pdf.new_page()
+            text = "\n".join(f"{number}.{row} {line}" for row in range(70))
+            page.insert_text((36, 40), text, fontsize=7)
+        return pdf.tobytes()
+
+
+def run_tempfile(data: bytes) -> int:
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=700, chunk_overlap=100)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
+        tmp_file.write(data)
+        tmp_path = tmp_file.name
+    try:
+        return len(splitter.split_documents(PyPDFLoader(tmp_path).load()))
+    finally:
+        os.remove(tmp_path)
+
+
+def run_list(data: bytes) -> int:
+    from modules.file_loader import load_documents
+
+    docs, _ = load_documents([SimpleNamespace(name="big.pdf", getvalue=lambda: data)])
+    return len(docs)
+
+
+def run_stream(data: bytes) -> int:
+    from modules.file_loader import iter_documents
+
+    return sum(1 for _ in iter_documents([SimpleNamespace(name="big.pdf", getvalue=lambda: data)], []))
+
+
+PATHS = {"tempfile": run_tempfile, "list": run_list, "stream": run_stream}
+
+
+def _measure(name: str, pages: int):
+    data = _pdf_bytes(pages)
+    # Import parsers up front so library code is part of the baseline, not the measurement.
+    import langchain_community.document_loaders  # noqa: F401
+    import modules.file_loader  # noqa: F401
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    chunks = PATHS[name](data)
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in KiB on Linux.
+    return chunks, elapsed, (peak - baseline) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=500)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print(f"{'path':<10} {'chunks':>7} {'seconds':>9} {'peak MiB':>9}")
+    for name in PATHS:
+        with context.Pool(1) as pool:
+            chunks, elapsed, peak_mib = pool.apply(_measure, (name, args.pages))
+        print(f"{name:<10} {chunks:>7} {elapsed:>9.3f} {peak_mib:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Cost of MMR re-ranking on stored vectors, per question.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_rerank --chunks 20000 --dim 1536 --candidates 24
+
+Each round takes `--candidates` chunks as a retriever would return them,
+reads their vectors back from the index and picks a diverse `--k`. The
+first round also builds the store's doc-id lookup, which is reported
+separately since it is paid once per index version, not per question.
+"""
+
+import argparse
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from modules import embedder
+from modules.hybrid_retriever import as_hybrid_retriever
+from modules.reranker import diversify
+
+
+class _RandomEmbeddings(Embeddings):
+    # Local, so the upstream rate limits are not applied.
+    remote = False
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.rng = np.random.default_rng(0)
+
+    def embed_documents(self, texts):
+        return self.rng.standard_normal((len(texts), self.dim), dtype=np.float32).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=20_000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[24, 48, 96])
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--index", default="flat", help="flat, ivf_flat, hnsw or ivf_pq")
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+
+    docs = [Document(page_content=f"chunk {i}", metadata={"source": f"file-{i % 20}.pdf"}) for i in range(args.chunks)]
+    store, _ = embedder.add_documents(None, docs, _RandomEmbeddings(args.dim), index_spec=args.index)
+    retriever = as_hybrid_retriever(store)
+    stored = list(store.docstore._dict.values())
+    rng = np.random.default_rng(1)
+
+    started = time.perf_counter()
+    retriever.stored_vectors(stored[:1])
+    print(f"chunks={args.chunks} dim={args.dim} index={args.index} k={args.k}")
+    print(f"doc-id lookup build (once per index version): {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    for count in args.candidates:
+        lookup, select = [], []
+        for _ in range(args.rounds):
+            candidates = [stored[i] for i in rng.choice(len(stored), size=count, replace=False)]
+            relevance = np.sort(rng.random(count))[::-1]
+            started = time.perf_counter()
+            vectors = retriever.stored_vectors(candidates)
+            middle = time.perf_counter()
+            diversify(candidates, vectors, args.k, relevance)
+            finished = time.perf_counter()
+            lookup.append((middle - started) * 1e6)
+            select.append((finished - middle) * 1e6)
+        total = np.add(lookup, select)
+        print(
+            f"candidates={count:<4} vectors p50={np.percentile(lookup, 50):.0f}us  "
+            f"mmr p50={np.percentile(select, 50):.0f}us  "
+            f"total p50={np.percentile(total, 50):.0f}us p99={np.percentile(total, 99):.0f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()
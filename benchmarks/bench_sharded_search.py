@@ -0,0 +1,92 @@
+"""Query latency of one index vs per-source shards, with and without a source filter.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_sharded_search --chunks 100000 --sources 50
+
+Vectors are random (the search cost does not depend on their meaning) and
+chunk text is drawn from a small vocabulary so BM25 has work to do. Both
+layouts use flat indexes and hybrid fusion with the default weights.
+"""
+
+import argparse
+import time
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from modules import embedder
+from modules.hybrid_retriever import as_hybrid_retriever
+from modules.sharded_retriever import SHARD_SEARCH_WORKERS, as_sharded_retriever
+
+
+class _RandomEmbeddings(Embeddings):
+    # Local, so the upstream rate limits are not applied.
+    remote = False
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.rng = np.random.default_rng(0)
+
+    def embed_documents(self, texts):
+        return self.rng.standard_normal((len(texts), self.dim), dtype=np.float32).tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def _time(retriever, queries, k, **kwargs):
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        retriever.invoke(query, k=k, **kwargs)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--sources", type=int, default=50)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    words = np.array([f"w{i}" for i in range(5000)])
+    docs = [
+        Document(
+            page_content=" ".join(words[rng.integers(0, len(words), size=60)]),
+            metadata={"source": f"file-{i % args.sources:03d}.pdf"},
+        )
+        for i in range(args.chunks)
+    ]
+    embeddings = _RandomEmbeddings(args.dim)
+
+    started = time.perf_counter()
+    single, _ = embedder.add_documents(None, docs, embeddings, index_spec="flat")
+    single = as_hybrid_retriever(single)
+    single_build = time.perf_counter() - started
+    started = time.perf_counter()
+    shards, _ = embedder.add_shards({}, docs, embeddings, "source", index_spec="flat")
+    sharded = as_sharded_retriever(shards, embeddings)
+    sharded_build = time.perf_counter() - started
+
+    queries = [" ".join(words[rng.integers(0, 500, size=4)]) for _ in range(args.queries)]
+    one_source = {"file-000.pdf"}
+    print(f"chunks={args.chunks} shards={len(shards)} workers={SHARD_SEARCH_WORKERS}")
+    print(f"build s: single={single_build:.1f} sharded={sharded_build:.1f}")
+    for label, retriever, kwargs in (
+        ("single, all sources", single, {}),
+        ("sharded, all sources", sharded, {}),
+        ("single, one source", single, {"sources": one_source}),
+        ("sharded, one source", sharded, {"sources": one_source}),
+    ):
+        p50, p95 = _time(retriever, queries, args.k, **kwargs)
+        print(f"{label:<22} p50={p50:.1f}ms p95={p95:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""Headless batch question answering over a fixed document set.
+
+    python -m modules.batch_qa docs/ questions.jsonl -o answers.jsonl --domain Legal
+
+Each questions line is `{"question": ..., "id": ..., "domain": ...}` (only
+`question` is required). Answers are written one JSON object per line in
+input order, with the sources that were packed into the prompt.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import re
+import sys
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+from langchain_core.language_models import SimpleChatModel
+
+from modules.domain_prompts import DOMAIN_TEMPLATES
+from modules.embedder import create_vectorstore
+from modules.file_loader import load_documents
+from modules.metrics import export_metrics, span
+from modules.qa_chain import build_qa_chain
+from modules.resources import run_on_shared_loop
+
+SUPPORTED_SUFFIXES = (".pdf", ".docx", ".txt")
+DEFAULT_BATCH_DOMAIN = "Education"
+STUB_ANSWER_CHARS = 300
+
+_CONTEXT_RE = re.compile(r"Context:\n(.*?)\n\nQuestion:", re.DOTALL)
+
+
+def batch_concurrency() -> int:
+    """Model calls in flight at once: BRAINDOC_BATCH_CONCURRENCY (8). Read per call so `.env` applies."""
+    return int(os.getenv("BRAINDOC_BATCH_CONCURRENCY", "8"))
+
+
+class StubChatModel(SimpleChatModel):
+    """Offline stand-in for the chat model: answers with the start of the packed context.
+
+    Retrieval, packing and the output format are exercised exactly as in a real
+    run, so a nightly job can check them without network access or API spend.
+    """
+
+    max_chars: int = STUB_ANSWER_CHARS
+
+    @property
+    def _llm_type(self) -> str:
+        return "braindoc-stub"
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs) -> str:
+        match = _CONTEXT_RE.search(str(messages[-1].content))
+        context = match.group(1).strip() if match else ""
+        return context[: self.max_chars] or "No relevant context found."
+
+
+class _LocalUpload(io.BytesIO):
+    """A file on disk that looks like a Streamlit upload to `load_documents`."""
+
+    def __init__(self, path: str, name: str):
+        with open(path, "rb") as handle:
+            super().__init__(handle.read())
+        self.name = name
+        self.size = len(self.getbuffer())
+
+
+def read_directory(directory: str) -> List[_LocalUpload]:
+    """Every supported document under `directory`, named by relative path, in sorted order."""
+    uploads = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for filename in sorted(files):
+            if os.path.splitext(filename)[1].lower() in SUPPORTED_SUFFIXES:
+                path = os.path.join(root, filename)
+                uploads.append(_LocalUpload(path, os.path.relpath(path, directory).replace(os.sep, "/")))
+    return uploads
+
+
+def read_questions(path: str) -> List[Dict]:
+    """Parse a questions JSONL file; blank lines are skipped and ids default to the line number."""
+    questions = []
+    with open(path, "r", encoding="utf-8") as handle:
+        for number, line in enumerate(handle, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"question": record}
+            if not str(record.get("question") or "").strip():
+                raise ValueError(f"{path}:{number}: missing question")
+            record.setdefault("id", number)
+            questions.append(record)
+    return questions
+
+
+def _source_record(doc) -> Dict:
+    metadata = doc.metadata
+    record = {"source": metadata.get("source"), "content": doc.page_content}
+    if "page" in metadata:
+        record["page"] = metadata["page"]
+    return record
+
+
+def answer_questions(
+    retriever,
+    questions: List[Dict],
+    openai_api_key=None,
+    domain: str = DEFAULT_BATCH_DOMAIN,
+    max_concurrency: Optional[int] = None,
+    max_source_docs: int = 8,
+    llm=None,
+) -> List[Dict]:
+    """Answer every question against one retriever, returning records in input order.
+
+    All questions are embedded in a single batched call and searched as one
+    matrix; only the model calls run per question, `max_concurrency` at a time
+    (`batch_concurrency()` when None) on the shared event loop, each with the chain's deadline and retries.
+    A failed question gets an `error` field instead of stopping the batch.
+    """
+    if not questions:
+        return []
+    texts = [str(record["question"]) for record in questions]
+    with span("embed_questions", questions=len(texts)):
+        embeddings = getattr(retriever, "embedding_function", None) or retriever.vectorstore.embedding_function
+        vectors = embeddings.embed_documents(texts)
+
+    domains = [record.get("domain") or domain for record in questions]
+    chains = {
+        name: build_qa_chain(retriever, openai_api_key, name, max_source_docs=max_source_docs, llm=llm)
+        for name in dict.fromkeys(domains)
+    }
+    # Fusion weights differ per domain, so each domain's questions are searched as one batch.
+    candidates: List = [None] * len(questions)
+    for name, chain in chains.items():
+        positions = [pos for pos, record_domain in enumerate(domains) if record_domain == name]
+        with span("retrieve", questions=len(positions), domain=name):
+            found = chain.retriever.batch_retrieve(
+                [texts[pos] for pos in positions], [vectors[pos] for pos in positions], k=chain.candidate_docs
+            )
+        for pos, docs in zip(positions, found):
+            candidates[pos] = docs
+
+    async def _answer(position: int, slots: asyncio.Semaphore) -> Dict:
+        result = {"id": questions[position]["id"], "question": texts[position], "domain": domains[position]}
+        try:
+            async with slots:
+                answer = await chains[domains[position]].arun(texts[position], docs=candidates[position])
+        except Exception as exc:  # one bad call should not sink a nightly run
+            result.update(answer=None, sources=[], error=str(exc) or type(exc).__name__)
+            return result
+        result.update(answer=answer["answer"], sources=[_source_record(doc) for doc in answer["sources"]])
+        return result
+
+    async def _answer_all() -> List[Dict]:
+        slots = asyncio.Semaphore(max(1, batch_concurrency() if max_concurrency is None else max_concurrency))
+        return await asyncio.gather(*(_answer(position, slots) for position in range(len(questions))))
+
+    return run_on_shared_loop(_answer_all())
+
+
+def run_batch(
+    documents_dir: str,
+    questions_path: str,
+    output_path: Optional[str] = None,
+    openai_api_key=None,
+    domain: str = DEFAULT_BATCH_DOMAIN,
+    max_concurrency: Optional[int] = None,
+    max_source_docs: int = 8,
+    embedding_backend: Optional[str] = None,
+    llm=None,
+    shard_by=None,
+) -> Dict:
+    """Index `documents_dir`, answer `questions_path` and write JSONL to `output_path` (stdout if None).
+
+    `shard_by` is passed to `create_vectorstore`. Returns a summary with the
+    answer records and any load/embedding errors.
+    """
+    uploads = read_directory(documents_dir)
+    questions = read_questions(questions_path)
+    docs, load_errors = load_documents(uploads, domain=domain)
+    retriever, embed_errors = create_vectorstore(
+        docs, openai_api_key, embedding_backend=embedding_backend, shard_by=shard_by
+    )
+    if retriever is None:
+        raise RuntimeError(f"No documents could be indexed from {documents_dir}")
+
+    results = answer_questions(
+        retriever,
+        questions,
+        openai_api_key,
+        domain=domain,
+        max_concurrency=max_concurrency,
+        max_source_docs=max_source_docs,
+        llm=llm,
+    )
+    lines = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in results)
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as handle:
+            handle.write(lines)
+    else:
+        sys.stdout.write(lines)
+    return {
+        "files": len(uploads),
+        "chunks": len(docs),
+        "results": results,
+        "load_errors": load_errors,
+        "embed_errors": embed_errors,
+    }
+
+
+def main(argv=None) -> int:
+    # Settings below and in the modules this run calls are read from the environment, so `.env` goes first.
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions against a directory of documents.")
+    parser.add_argument("documents", help="directory of .pdf, .docx and .txt files")
+    parser.add_argument("questions", help="JSONL file with one {\"question\": ...} per line")
+    parser.add_argument("-o", "--output", help="answers JSONL path (default: stdout)")
+    parser.add_argument("--domain", default=DEFAULT_BATCH_DOMAIN, choices=sorted(DOMAIN_TEMPLATES))
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=batch_concurrency(),
+        help="model calls in flight at once (an asyncio semaphore on the shared event loop)",
+    )
+    parser.add_argument(
+        "--max-source-docs",
+        "--k",
+        dest="max_source_docs",
+        type=int,
+        default=8,
+        help="chunks packed into each prompt, chosen from the retrieved candidates (--k is the old name)",
+    )
+    parser.add_argument("--embedding-backend", help="overrides BRAINDOC_EMBEDDING_BACKEND")
+    parser.add_argument(
+        "--shard-by",
+        type=lambda value: int(value) if value.isdigit() else value,
+        help='"source" for one index per file, or a chunk count per shard',
+    )
+    parser.add_argument("--stub-llm", action="store_true", help="answer offline from retrieved context")
+    parser.add_argument("--metrics-file", help="write stage timings, tokens and cost in Prometheus text format")
+    args = parser.parse_args(argv)
+
+    summary = run_batch(
+        args.documents,
+        args.questions,
+        args.output,
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        domain=args.domain,
+        max_concurrency=args.concurrency,
+        max_source_docs=args.max_source_docs,
+        embedding_backend=args.embedding_backend,
+        llm=StubChatModel() if args.stub_llm else None,
+        shard_by=args.shard_by,
+    )
+    export_metrics(args.metrics_file)
+    failed = sum(1 for record in summary["results"] if record.get("error"))
+    for error in summary["load_errors"] + summary["embed_errors"]:
+        print(f"warning: {error}", file=sys.stderr)
+    print(
+        f"{len(summary['results'])} questions answered ({failed} failed) "
+        f"from {summary['files']} files / {summary['chunks']} chunks",
+        file=sys.stderr,
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
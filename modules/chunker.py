@@ -0,0 +1,248 @@
+import bisect
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from modules.tokenizer import count_tokens
+
+# Bump when the rules below change, so indexes cached with the old boundaries are rebuilt.
+CHUNKER_VERSION = 1
+
+# All-caps titles ("GRANT OF LICENSE") and markdown headings.
+_HEADING = r"#{1,6}[ \t]+\S[^\n]*|(?=[^a-z\n]*[A-Z]{3})[A-Z][A-Z0-9 ,&/'().\-]{2,80}"
+# "1.", "4.2 Feedback.", "Article IV", "Section 12": each clause starts a section.
+_CLAUSE = r"(?:(?:ARTICLE|Article|SECTION|Section|Clause)[ \t]+[\dIVXLC]+|\d{1,3}(?:\.\d{1,3})*\.?)[ \t]+\S[^\n]*"
+# Syllabus units ("Week 3-5: CNNs") and labelled blocks ("Grading Breakdown:").
+_UNIT = r"(?:Week|Module|Unit|Lesson|Chapter|Part)[ \t]+\d[^\n]*|[A-Z][A-Za-z0-9 ,&/()'\-]{2,60}:"
+
+
+def _line_pattern(*alternatives: str) -> "re.Pattern":
+    return re.compile(r"^[ \t]*(?:" + "|".join(alternatives) + r")[ \t]*$", re.MULTILINE)
+
+
+# `tokens` and `overlap` come from `chunk_sizes()` when a profile is looked up.
+DEFAULT_CHUNK_PROFILE: Dict = {
+    "name": "default",
+    "sections": _line_pattern(_HEADING),
+    # Keep numeric tables whole where possible and repeat their column header when they are split.
+    "tables": False,
+    # Single line breaks are structure (lists, rows) rather than wrapping.
+    "lines": True,
+}
+# Stricter structure rules for contracts, syllabi and statements. None beats the default profile
+# on `benchmarks/bench_chunking.py`: clauses and tables leave the hit-rate unchanged and units
+# lose a hit, so no domain uses them until one wins; pass one to `chunk_text` to try it.
+LEGAL_CHUNK_PROFILE = dict(DEFAULT_CHUNK_PROFILE, name="legal-clauses", sections=_line_pattern(_HEADING, _CLAUSE))
+EDUCATION_CHUNK_PROFILE = dict(DEFAULT_CHUNK_PROFILE, name="education-sections", sections=_line_pattern(_HEADING, _UNIT))
+FINANCE_CHUNK_PROFILE = dict(DEFAULT_CHUNK_PROFILE, name="finance-tables", tables=True)
+# Domain -> profile overrides; domains not listed use the default profile.
+CHUNK_PROFILES: Dict[str, Dict] = {}
+# PDF text extraction breaks every visual line, so lines there say nothing about structure.
+FORMAT_CHUNK_OPTIONS: Dict[str, Dict] = {
+    ".pdf": {"lines": False},
+}
+
+_PARAGRAPH_BREAK_RE = re.compile(r"\n[ \t]*\n\s*")
+_LINE_BREAK_RE = re.compile(r"\n")
+_SENTENCE_BREAK_RE = re.compile(r"(?<=[.!?;])\s+(?=\S)")
+_WORD_RE = re.compile(r"\S+")
+# A row ends in a number, amount or percentage set off by a column gap, or is a `| a | b |` row.
+_TABLE_ROW_RE = re.compile(r"\S(?:[ \t]{2,}|\t|[ \t]\|[ \t]*)\(?[-+$€£]?\d[\d,.]*%?\)?[ \t]*$|^[ \t]*\|.*\|[ \t]*$")
+_TABLE_LABEL_RE = re.compile(r"^[ \t]*(?:[^\n]{1,60}:|[^a-z\n]{1,60})[ \t]*$")
+_MIN_TABLE_ROWS = 2
+# Clause headings are whole sentences; `section` metadata keeps their start.
+SECTION_TITLE_CHARS = 80
+
+# `(start, end, prefix, tokens)`: `text[start:end]` plus a repeated table header in `prefix`.
+_Span = Tuple[int, int, str, int]
+
+
+def chunk_sizes() -> Tuple[int, int]:
+    """`(tokens, overlap)`: BRAINDOC_CHUNK_TOKENS (256) and BRAINDOC_CHUNK_OVERLAP_TOKENS (24).
+
+    Only chunks cut inside a paragraph overlap; structural cuts (sections,
+    paragraphs, table groups) do not. Read per call so `.env` applies.
+    """
+    return int(os.getenv("BRAINDOC_CHUNK_TOKENS", "256")), int(os.getenv("BRAINDOC_CHUNK_OVERLAP_TOKENS", "24"))
+
+
+def chunk_profile(domain: Optional[str] = None, suffix: Optional[str] = None) -> Dict:
+    """The chunking rules for a domain's documents of one file type (`.pdf`, `.txt`, ...)."""
+    tokens, overlap = chunk_sizes()
+    options = FORMAT_CHUNK_OPTIONS.get((suffix or "").lower(), {})
+    return dict(CHUNK_PROFILES.get(domain, DEFAULT_CHUNK_PROFILE), tokens=tokens, overlap=overlap, **options)
+
+
+def chunking_id(domain: Optional[str] = None) -> str:
+    """Identifies the chunk boundaries a domain produces, for index cache keys."""
+    profile = chunk_profile(domain)
+    return f"chunks-v{CHUNKER_VERSION}:{profile['name']}:{profile['tokens']}/{profile['overlap']}"
+
+
+def _table_regions(text: str) -> List[Tuple[int, int]]:
+    """`(start, end)` of every run of table rows, with the blank and label lines between them."""
+    regions = []
+    start = last_row_end = None
+    rows = 0
+    position = 0
+    for line in text.splitlines(keepends=True):
+        line_start, position = position, position + len(line)
+        if _TABLE_ROW_RE.search(line.rstrip("\n")):
+            if start is None:
+                start, rows = line_start, 0
+            rows += 1
+            last_row_end = line_start + len(line.rstrip("\r\n"))
+        elif start is not None and not (not line.strip() or _TABLE_LABEL_RE.match(line.rstrip("\r\n"))):
+            if rows >= _MIN_TABLE_ROWS:
+                regions.append((start, last_row_end))
+            start = None
+    if start is not None and rows >= _MIN_TABLE_ROWS:
+        regions.append((start, last_row_end))
+    return regions
+
+
+def _inside(regions: List[Tuple[int, int]], position: int) -> bool:
+    index = bisect.bisect_right(regions, (position, float("inf"))) - 1
+    return index >= 0 and regions[index][0] < position < regions[index][1]
+
+
+def _cuts(text: str, start: int, end: int, level: str, profile: Dict, tables) -> List[int]:
+    """Positions strictly inside `(start, end)` where `level` allows a chunk to break."""
+    if level == "sections":
+        found = (match.start() for match in profile["sections"].finditer(text, start, end))
+        return [position for position in found if start < position and not _inside(tables, position)]
+    if level == "tables":
+        edges = [edge for region in tables for edge in region]
+        return [position for position in edges if start < position < end]
+    if level == "paragraphs":
+        found = (match.end() for match in _PARAGRAPH_BREAK_RE.finditer(text, start, end))
+        return [position for position in found if position < end and not _inside(tables, position)]
+    if level == "lines":
+        return [match.end() for match in _LINE_BREAK_RE.finditer(text, start, end) if match.end() < end]
+    if level == "sentences":
+        return [match.end() for match in _SENTENCE_BREAK_RE.finditer(text, start, end) if match.end() < end]
+    return [match.start() for match in _WORD_RE.finditer(text, start, end) if match.start() > start]
+
+
+def _is_title(text: str, span: _Span) -> bool:
+    """A lone heading line ("2. PAYMENT", "Grading Breakdown:") that introduces what follows."""
+    content = text[span[0] : span[1]].strip()
+    return 0 < len(content) <= SECTION_TITLE_CHARS and "\n" not in content and not content.endswith((".", "!", "?", ";"))
+
+
+def _merge(text: str, children: List[_Span], limit: int, overlap: int) -> List[_Span]:
+    """Greedily join neighbouring spans up to `limit` tokens; with `overlap`, each chunk
+    repeats the previous chunk's trailing pieces worth at most that many tokens.
+    A title left at the end of a chunk moves on to the text it introduces.
+    """
+    groups: List[List[_Span]] = []
+    current: List[_Span] = []
+    used = 0
+    for child in children:
+        if current and not child[2] and used + child[3] <= limit:
+            current.append(child)
+            used += child[3]
+            continue
+        if current:
+            groups.append(current)
+        current, used = [child], child[3]
+        if child[2] or not groups:
+            continue
+        previous = groups[-1]
+        if len(previous) > 1 and _is_title(text, previous[-1]) and previous[-1][3] + child[3] <= limit:
+            current = [previous.pop(), child]
+            used += current[0][3]
+        elif overlap:
+            tail: List[_Span] = []
+            carried = 0
+            for piece in reversed(previous[1:]):
+                if carried + piece[3] > overlap:
+                    break
+                tail.insert(0, piece)
+                carried += piece[3]
+            if tail and carried + child[3] <= limit:
+                current = tail + [child]
+                used += carried
+    if current:
+        groups.append(current)
+    return [(group[0][0], group[-1][1], group[0][2], sum(span[3] for span in group)) for group in groups]
+
+
+_LEVELS = ("sections", "tables", "paragraphs", "lines", "sentences", "words")
+
+
+def _split(text: str, start: int, end: int, levels, profile: Dict, tables, limit: int) -> List[_Span]:
+    tokens = count_tokens(text[start:end])
+    if tokens <= limit:
+        return [(start, end, "", tokens)]
+    if not levels:
+        # One "word" longer than a chunk (a URL, base64): cut it into equal slices.
+        step = max(1, (end - start) * limit // tokens)
+        return [(cut, min(cut + step, end), "", count_tokens(text[cut : cut + step])) for cut in range(start, end, step)]
+    level = levels[0]
+    cuts = _cuts(text, start, end, level, profile, tables)
+    if not cuts:
+        return _split(text, start, end, levels[1:], profile, tables, limit)
+
+    children: List[_Span] = []
+    for piece_start, piece_end in zip([start] + cuts, cuts + [end]):
+        if level == "words":
+            # Inline the leaf case; most words are far below the limit.
+            word_tokens = count_tokens(text[piece_start:piece_end])
+            if word_tokens <= limit:
+                children.append((piece_start, piece_end, "", word_tokens))
+            else:
+                children.extend(_split(text, piece_start, piece_end, (), profile, tables, limit))
+        elif level == "tables" and (piece_start, piece_end) in tables:
+            children.extend(_split_table(text, piece_start, piece_end, profile, tables, limit))
+        else:
+            children.extend(_split(text, piece_start, piece_end, levels[1:], profile, tables, limit))
+    # Only cuts inside a paragraph lose context worth repeating.
+    overlap = profile["overlap"] if level in ("sentences", "words") else 0
+    return _merge(text, children, limit, overlap)
+
+
+def _split_table(text: str, start: int, end: int, profile: Dict, tables, limit: int) -> List[_Span]:
+    """Split a table by row groups, then rows; continuation chunks repeat its column header."""
+    first_line = text[start:end].split("\n", 1)[0]
+    header = first_line + "\n" if not re.search(r"[$€£]|[a-z]", first_line) or "|" in first_line else ""
+    budget = max(limit - count_tokens(header), 1)
+    chunks = _split(text, start, end, ("paragraphs", "lines"), profile, [], budget)
+    if not header:
+        return chunks
+    return chunks[:1] + [(chunk_start, chunk_end, header, tokens) for chunk_start, chunk_end, _, tokens in chunks[1:]]
+
+
+def chunk_text(text: str, metadata: Dict, profile: Optional[Dict] = None) -> List[Document]:
+    """Split `text` into chunks of at most `profile["tokens"]` tokens along its structure.
+
+    Cuts prefer section headings, then table edges, paragraphs, lines and
+    sentences, and neighbouring small pieces are packed together. Each chunk's
+    metadata adds `start_index`/`end_index` (character offsets of its text in
+    `text`) and, when it falls under a heading, `section`.
+    """
+    profile = profile or chunk_profile()
+    tables = _table_regions(text) if profile["tables"] else []
+    levels = [level for level in _LEVELS if profile.get(level, True)]
+    headings = [
+        (match.start(), match.group().strip()[:SECTION_TITLE_CHARS])
+        for match in profile["sections"].finditer(text)
+        if not _inside(tables, match.start())
+    ]
+    heading_starts = [position for position, _ in headings]
+
+    docs = []
+    for start, end, prefix, _ in _split(text, 0, len(text), levels, profile, tables, profile["tokens"]):
+        body = text[start:end]
+        stripped = body.strip()
+        if not stripped:
+            continue
+        start += len(body) - len(body.lstrip())
+        chunk_metadata = dict(metadata, start_index=start, end_index=start + len(stripped))
+        index = bisect.bisect_right(heading_starts, start) - 1
+        if index >= 0:
+            chunk_metadata["section"] = headings[index][1]
+        docs.append(Document(page_content=prefix + stripped, metadata=chunk_metadata))
+    return docs
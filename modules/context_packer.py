@@ -0,0 +1,150 @@
+import re
+from typing import Dict, List, Optional, Tuple
+
+from modules.tokenizer import count_tokens
+
+# Total prompt tokens spent on retrieved context per question: 8 chunks of up to 256 tokens.
+# Chains size theirs from `max_source_docs` and the configured chunk size instead.
+CONTEXT_TOKEN_BUDGET = 2048
+# Chunks with `start_index`/`end_index` are neighbours when only this much whitespace separates them.
+MAX_GAP_CHARS = 4
+# Chunks without offsets fall back to text overlap; shorter suffix/prefix matches are coincidence.
+MIN_OVERLAP_CHARS = 20
+MAX_OVERLAP_CHARS = 300
+BLOCK_SEPARATOR = "\n\n"
+
+_SENTENCE_END_RE = re.compile(r"[.!?](?:\s|$)|\n")
+
+
+def _overlap(left: str, right: str) -> int:
+    """Length of the longest suffix of `left` that is also a prefix of `right`."""
+    limit = min(len(left), len(right), MAX_OVERLAP_CHARS)
+    for size in range(limit, MIN_OVERLAP_CHARS - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def _span(metadata: Dict, text: str) -> Optional[Tuple[int, int]]:
+    """`(start_index, end_index)` of a chunk's own text, which ends `text` (after any repeated table header)."""
+    start, end = metadata.get("start_index"), metadata.get("end_index")
+    if isinstance(start, int) and isinstance(end, int) and 0 <= end - start <= len(text):
+        return start, end
+    return None
+
+
+def _join_spans(left: Dict, right: Dict) -> Optional[Dict]:
+    """Merge two chunks of one page by their offsets when they overlap or are adjacent, else None."""
+    if right["span"][0] < left["span"][0]:
+        left, right = right, left
+    (start, end), (right_start, right_end) = left["span"], right["span"]
+    gap = right_start - end
+    if gap > MAX_GAP_CHARS:
+        return None
+    if right_end <= end:
+        return dict(left)
+    body = right["text"][len(right["text"]) - (right_end - right_start) :]
+    if gap > 0:
+        # The whitespace between them was trimmed from both chunks.
+        text = left["text"] + ("\n" if gap > 1 else " ") + body
+    else:
+        text = left["text"] + body[-gap:]
+    return dict(left, span=(start, right_end), text=text)
+
+
+def _combine(block: Dict, chunk: Dict) -> Optional[Dict]:
+    """`block` grown by `chunk` when both are neighbouring text of one source, else None."""
+    if block["source"] != chunk["source"]:
+        return None
+    if block["span"] and chunk["span"]:
+        return _join_spans(block, chunk) if block["page"] == chunk["page"] else None
+    merged = _join(block["text"], chunk["text"])
+    return dict(block, span=None, text=merged) if merged else None
+
+
+def _join(left: str, right: str) -> str:
+    """Merge two chunks of one source when they overlap in either order, else ''."""
+    if left in right:
+        return right
+    size = _overlap(left, right)
+    if size:
+        return left + right[size:]
+    size = _overlap(right, left)
+    if size:
+        return right + left[size:]
+    return ""
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """Cut `text` to at most `budget` tokens, ending on a sentence boundary when one is close."""
+    tokens = count_tokens(text)
+    if tokens <= budget:
+        return text
+    end = max(1, len(text) * budget // tokens)
+    while end > 1 and count_tokens(text[:end]) > budget:
+        end = end * 9 // 10
+    cut = text[:end]
+    boundaries = [match.end() for match in _SENTENCE_END_RE.finditer(cut)]
+    # Only back off to a sentence end if that keeps most of the allowance.
+    if boundaries and boundaries[-1] >= len(cut) // 2:
+        cut = cut[: boundaries[-1]]
+    return cut.rstrip()
+
+
+def pack_context(docs, token_budget: int = CONTEXT_TOKEN_BUDGET) -> Tuple[str, List]:
+    """Fill a token budget with the best retrieved chunks, most relevant first.
+
+    `docs` must already be ordered by retrieval score. Chunks whose text is
+    already packed are dropped, and neighbouring chunks of the same source and
+    page (by their `start_index`/`end_index`, or by overlapping text when they
+    have no offsets) are merged into one block, so shared and adjoining text
+    reads as one passage and is paid for once. A chunk that does not fit is
+    skipped in favour of smaller, lower-ranked ones; only a lone oversized top
+    chunk is truncated. Returns `(context, used_docs)` with `used_docs` in rank order.
+    """
+    blocks: List[Dict] = []
+    used_docs = []
+    used_tokens = 0
+
+    for doc in docs:
+        text = (getattr(doc, "page_content", "") or "").strip()
+        if not text or any(text in block["text"] for block in blocks):
+            continue
+        metadata = getattr(doc, "metadata", None) or {}
+        chunk = {"source": metadata.get("source"), "page": metadata.get("page"), "span": _span(metadata, text), "text": text}
+
+        target = None
+        for block in blocks:
+            merged = _combine(block, chunk)
+            if merged:
+                target, chunk = block, merged
+                break
+        if target is not None and chunk["text"] == target["text"]:
+            # Its offsets fall inside text already packed.
+            continue
+
+        tokens = count_tokens(chunk["text"])
+        cost = tokens - (target["tokens"] if target else 0)
+        if used_tokens + cost > token_budget:
+            if blocks:
+                continue
+            chunk["text"], chunk["span"] = truncate_to_tokens(chunk["text"], token_budget), None
+            tokens = cost = count_tokens(chunk["text"])
+        chunk["tokens"] = tokens
+
+        if target is None:
+            blocks.append(chunk)
+        else:
+            target.update(chunk)
+            # The grown block may now bridge the gap to another block of the same source.
+            for other in [block for block in blocks if block is not target and block["source"] == target["source"]]:
+                merged = _combine(target, other)
+                if merged:
+                    merged["tokens"] = count_tokens(merged["text"])
+                    cost += merged["tokens"] - target["tokens"] - other["tokens"]
+                    target.update(merged)
+                    blocks.remove(other)
+        used_tokens += cost
+        used_docs.append(doc)
+
+    return BLOCK_SEPARATOR.join(block["text"] for block in blocks), used_docs
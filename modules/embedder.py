@@ -1,44 +1,501 @@
-from langchain_openai import OpenAIEmbeddings
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.faiss import dependable_faiss_import
 
+from modules.embedding_backends import create_embedding_backend, is_remote
+from modules.embedding_cache import CachedEmbeddings, get_embedding_cache
+from modules.hybrid_retriever import as_hybrid_retriever
+from modules.index_factory import (
+    build_index,
+    new_index,
+    remove_positions,
+    resolve_index_spec,
+)
+from modules.lexical_index import BM25Index, get_lexical_index
+from modules.sharded_retriever import ShardedRetriever, as_sharded_retriever, plan_shards
+from modules.metrics import count, record_embedding_usage, span
+from modules.rate_limiter import TokenBucket, backoff_delay, is_transient_error
+from modules.resources import shared_client
+from modules.tokenizer import count_tokens
+
+EMBED_BATCH_SIZE = 32
+EMBED_MAX_CONCURRENCY = 4
+# Defaults sit below the usual OpenAI embedding tier limits; tune per account.
+EMBED_REQUESTS_PER_MINUTE = 3000
+EMBED_TOKENS_PER_MINUTE = 1_000_000
+EMBED_MAX_RETRIES = 3
+EMBED_BACKOFF_BASE_SECONDS = 0.5
+EMBED_BACKOFF_MAX_SECONDS = 20.0
+
+_limiter_lock = threading.Lock()
+_request_limiter: Optional[TokenBucket] = None
+_token_limiter: Optional[TokenBucket] = None
+
+
+def embedding_model_id(embeddings) -> str:
+    """Identifier stored alongside cached vectors so different models never mix."""
+    model_id = getattr(embeddings, "model_id", None)
+    if model_id:
+        return model_id
+    return f"{type(embeddings).__name__}:{getattr(embeddings, 'model', '')}"
+
+
+def get_embeddings(openai_api_key=None, use_cache: Optional[bool] = None, backend: Optional[str] = None):
+    """Embeddings for the configured backend (see modules.embedding_backends).
+
+    Remote backends are wrapped in the shared vector cache by default; local
+    ones recompute faster than a cache lookup, so they are not. One instance
+    per backend and API key is shared by every session in the process.
+    """
+    return shared_client(
+        ("embeddings", backend, use_cache), openai_api_key, lambda: _build_embeddings(openai_api_key, use_cache, backend)
+    )
+
+
+def _build_embeddings(openai_api_key, use_cache: Optional[bool], backend: Optional[str]):
+    embeddings = create_embedding_backend(backend, openai_api_key)
+    if use_cache is None:
+        use_cache = is_remote(embeddings)
+    if not use_cache:
+        return embeddings
+    return CachedEmbeddings(embeddings, get_embedding_cache(), embedding_model_id(embeddings))
 
-def create_vectorstore(documents, openai_api_key):
-    """Create FAISS retriever with batched embedding and granular fallback on failures."""
-    embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key)
-    skipped = []
-    vectorstore = None
-    batch_size = 32
 
-    def _label(doc, idx):
-        label = doc.metadata.get("source") if hasattr(doc, "metadata") else None
-        return label or f"document #{idx + 1}"
+def _shared_limiters() -> Tuple[TokenBucket, TokenBucket]:
+    """Request and token buckets shared by every session in the process, like the upstream quota."""
+    global _request_limiter, _token_limiter
+    with _limiter_lock:
+        if _request_limiter is None:
+            _request_limiter = TokenBucket(EMBED_REQUESTS_PER_MINUTE)
+            _token_limiter = TokenBucket(EMBED_TOKENS_PER_MINUTE)
+        return _request_limiter, _token_limiter
 
-    for start in range(0, len(documents), batch_size):
-        batch = documents[start : start + batch_size]
+
+def configure_rate_limits(requests_per_minute: float, tokens_per_minute: float) -> None:
+    """Replace the shared buckets, e.g. to match a different account tier."""
+    global _request_limiter, _token_limiter
+    with _limiter_lock:
+        _request_limiter = TokenBucket(requests_per_minute)
+        _token_limiter = TokenBucket(tokens_per_minute)
+
+
+def _embed_batch(client, texts: List[str], request_limiter, token_limiter) -> Tuple[List, Dict[int, str]]:
+    """Embed one batch, retrying with backoff before splitting it in half.
+
+    A single bad text therefore costs O(log n) extra calls instead of one call per text.
+    Returns vectors aligned with `texts` (None where failed) and `{offset: error}`.
+    """
+    last_exc = None
+    # Local backends run without limiters and are not billed, so their tokens are never counted.
+    tokens = sum(count_tokens(text) for text in texts) if request_limiter is not None else 0
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        if request_limiter is not None:
+            request_limiter.acquire(1)
+            token_limiter.acquire(tokens)
         try:
-            tmp_store = FAISS.from_documents(batch, embeddings)
-            if vectorstore is None:
-                vectorstore = tmp_store
+            vectors = list(client.embed_documents(texts))
+            record_embedding_usage(getattr(client, "model", None), tokens)
+            return vectors, {}
+        except Exception as exc:
+            last_exc = exc
+            if not is_transient_error(exc) or attempt == EMBED_MAX_RETRIES:
+                break
+            time.sleep(backoff_delay(attempt, EMBED_BACKOFF_BASE_SECONDS, EMBED_BACKOFF_MAX_SECONDS))
+
+    if len(texts) == 1:
+        return [None], {0: str(last_exc)}
+
+    mid = len(texts) // 2
+    left, left_failures = _embed_batch(client, texts[:mid], request_limiter, token_limiter)
+    right, right_failures = _embed_batch(client, texts[mid:], request_limiter, token_limiter)
+    failures = dict(left_failures)
+    failures.update({mid + offset: error for offset, error in right_failures.items()})
+    return left + right, failures
+
+
+class _RowSink:
+    """Float32 output matrix shared by the embedding workers, allocated once the width is known."""
+
+    def __init__(self, rows: int, allocate: Callable[[int, int], np.ndarray]):
+        self.rows = rows
+        self.allocate = allocate
+        self.matrix = None
+        self._lock = threading.Lock()
+
+    def ensure(self, dim: int) -> np.ndarray:
+        with self._lock:
+            if self.matrix is None:
+                self.matrix = self.allocate(self.rows, dim)
+        return self.matrix
+
+    def write(self, positions: List[int], block: np.ndarray) -> None:
+        # Batches own disjoint rows, so writes need no lock once the matrix exists.
+        self.ensure(block.shape[1])[positions] = block
+
+
+def _zeros(rows: int, dim: int) -> np.ndarray:
+    return np.zeros((rows, dim), dtype=np.float32)
+
+
+def _embed_concurrently(client, texts: List[str], batch_size: int, max_concurrency: int, write) -> Dict[int, str]:
+    """Embed `texts` on a thread pool, handing each batch's rows to `write(offsets, block)` as it lands.
+
+    Per-batch Python lists are released as soon as their batch is written. Local
+    backends skip the upstream rate limits. Returns `{offset: error}`.
+    """
+    request_limiter, token_limiter = _shared_limiters() if is_remote(client) else (None, None)
+
+    def _run(start: int) -> Dict[int, str]:
+        batch_vectors, batch_failures = _embed_batch(
+            client, texts[start : start + batch_size], request_limiter, token_limiter
+        )
+        offsets = [offset for offset, vector in enumerate(batch_vectors) if vector is not None]
+        if offsets:
+            block = np.asarray([batch_vectors[offset] for offset in offsets], dtype=np.float32)
+            write([start + offset for offset in offsets], block)
+        return {start + offset: error for offset, error in batch_failures.items()}
+
+    failures = {}
+    starts = list(range(0, len(texts), batch_size))
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(starts) or 1))) as pool:
+        for batch_failures in pool.map(_run, starts):
+            failures.update(batch_failures)
+    return failures
+
+
+def embed_texts(
+    texts: List[str],
+    embeddings,
+    batch_size: int = EMBED_BATCH_SIZE,
+    max_concurrency: int = EMBED_MAX_CONCURRENCY,
+    allocate: Optional[Callable[[int, int], np.ndarray]] = None,
+) -> Tuple[Optional[np.ndarray], Dict[int, str]]:
+    """Embed `texts` in concurrent, rate-limited batches into one preallocated float32 matrix.
+
+    `allocate(rows, dim)` supplies that matrix (zeros by default), so callers can
+    hand out storage they already own. Cached embeddings only send their misses
+    upstream. Returns the matrix aligned with `texts` (None when nothing was
+    embedded; zero rows where failed) and `{index: error}`.
+    """
+    sink = _RowSink(len(texts), allocate or _zeros)
+    if not isinstance(embeddings, CachedEmbeddings):
+        failures = _embed_concurrently(embeddings, texts, batch_size, max_concurrency, sink.write)
+        return sink.matrix, failures
+
+    keys, cached, missing_keys, missing_texts = embeddings.lookup(texts)
+    rows_by_key = defaultdict(list)
+    for idx, key in enumerate(keys):
+        rows_by_key[key].append(idx)
+
+    if cached:
+        matrix = sink.ensure(len(next(iter(cached.values()))))
+        for key, vector in cached.items():
+            matrix[rows_by_key[key]] = vector
+
+    def _write_missing(offsets: List[int], block: np.ndarray) -> None:
+        # Duplicate texts were embedded once; fan each vector out to every row that needs it.
+        rows = [rows_by_key[missing_keys[offset]] for offset in offsets]
+        sink.write([row for group in rows for row in group], np.repeat(block, [len(group) for group in rows], axis=0))
+
+    fresh_failures = _embed_concurrently(
+        embeddings.underlying, missing_texts, batch_size, max_concurrency, _write_missing
+    )
+    fresh = {
+        key: sink.matrix[rows_by_key[key][0]]
+        for offset, key in enumerate(missing_keys)
+        if offset not in fresh_failures
+    }
+    embeddings.store(texts, keys, missing_keys, fresh)
+
+    failed_keys = {missing_keys[offset]: error for offset, error in fresh_failures.items()}
+    failures = {idx: failed_keys[key] for idx, key in enumerate(keys) if key in failed_keys}
+    return sink.matrix, failures
+
+
+def _flat_index_storage(index, rows: int, dim: int) -> np.ndarray:
+    """Size a fresh IndexFlat for `rows` vectors and return a writable view of its storage.
+
+    Writing embeddings straight into the index avoids holding a second copy of the corpus.
+    """
+    faiss = dependable_faiss_import()
+    index.codes.resize(rows * dim * np.dtype(np.float32).itemsize)
+    index.ntotal = rows
+    return faiss.rev_swig_ptr(index.get_xb(), rows * dim).reshape(rows, dim)
+
+
+def _docstore_entries(documents) -> Tuple[List[str], Dict[str, Document]]:
+    ids = [str(uuid.uuid4()) for _ in documents]
+    entries = {
+        doc_id: Document(id=doc_id, page_content=doc.page_content, metadata=doc.metadata)
+        for doc_id, doc in zip(ids, documents)
+    }
+    return ids, entries
+
+
+def _wrap_index(index, documents, embeddings):
+    """Build the docstore, id mapping and BM25 index for an already populated index in one pass."""
+    ids, entries = _docstore_entries(documents)
+    vectorstore = FAISS(embeddings, index, InMemoryDocstore(entries), dict(enumerate(ids)))
+    vectorstore.lexical_index = BM25Index.from_texts(ids, (doc.page_content for doc in documents))
+    return vectorstore
+
+
+def _skipped_messages(documents, failures: Dict[int, str]) -> List[str]:
+    messages = []
+    for idx in sorted(failures):
+        label = documents[idx].metadata.get("source") if hasattr(documents[idx], "metadata") else None
+        messages.append(f"{label or f'document #{idx + 1}'}: {failures[idx]}")
+    return messages
+
+
+def append_vectors(vectorstore, documents, matrix: np.ndarray) -> None:
+    """Add pre-computed rows to an existing store without re-embedding or re-copying it."""
+    start = len(vectorstore.index_to_docstore_id)
+    vectorstore.index.add(np.ascontiguousarray(matrix, dtype=np.float32))
+    ids, entries = _docstore_entries(documents)
+    vectorstore.docstore.add(entries)
+    vectorstore.index_to_docstore_id.update({start + offset: doc_id for offset, doc_id in enumerate(ids)})
+    get_lexical_index(vectorstore).add(ids, (doc.page_content for doc in documents))
+
+
+def add_documents(
+    vectorstore,
+    documents,
+    embeddings,
+    max_concurrency: int = EMBED_MAX_CONCURRENCY,
+    index_spec=None,
+):
+    """Embed `documents` into `vectorstore` (created when None); failed chunks are skipped and reported.
+
+    `index_spec` (see modules.index_factory) only applies when a new store is created.
+    """
+    skipped = []
+    new_store = {}
+
+    def _allocate_index(rows: int, dim: int) -> np.ndarray:
+        spec = resolve_index_spec(index_spec, rows, dim)
+        new_store["spec"] = spec
+        if spec["type"] != "flat":
+            # ANN indexes are trained on the finished matrix, so embed into plain memory first.
+            return _zeros(rows, dim)
+        new_store["index"] = new_index(spec, dim)
+        return _flat_index_storage(new_store["index"], rows, dim)
+
+    texts = [doc.page_content for doc in documents]
+    with span("embed", chunks=len(texts)) as stage:
+        matrix, failures = embed_texts(
+            texts,
+            embeddings,
+            max_concurrency=max_concurrency,
+            allocate=_allocate_index if vectorstore is None else None,
+        )
+        stage.set(failed=len(failures))
+    count("chunks_embedded", len(texts) - len(failures))
+    skipped.extend(_skipped_messages(documents, failures))
+
+    if matrix is None:
+        return vectorstore, skipped
+    kept = [idx for idx in range(len(documents)) if idx not in failures]
+    kept_documents = [documents[idx] for idx in kept] if failures else documents
+
+    with span("index_build", chunks=len(kept_documents), new=vectorstore is None):
+        if vectorstore is None:
+            index = new_store.get("index")
+            if index is None:
+                index = build_index(matrix[kept] if failures else matrix, new_store["spec"])
+            elif failures:
+                # Flat removal compacts rows in order, keeping them aligned with kept_documents.
+                index.remove_ids(np.fromiter(sorted(failures), dtype=np.int64))
+            vectorstore = _wrap_index(index, kept_documents, embeddings)
+        else:
+            append_vectors(vectorstore, kept_documents, matrix[kept] if failures else matrix)
+    return vectorstore, skipped
+
+
+def remove_sources(vectorstore, sources) -> int:
+    """Delete every vector whose `metadata["source"]` is in `sources`; returns the count removed."""
+    sources = set(sources)
+    if vectorstore is None or not sources:
+        return 0
+
+    ids = []
+    positions = []
+    for position, doc_id in vectorstore.index_to_docstore_id.items():
+        doc = vectorstore.docstore.search(doc_id)
+        if getattr(doc, "metadata", {}).get("source") in sources:
+            ids.append(doc_id)
+            positions.append(position)
+    if not ids:
+        return 0
+
+    get_lexical_index(vectorstore).remove(ids)
+    vectorstore.index = remove_positions(vectorstore.index, positions)
+    vectorstore.docstore.delete(ids)
+    dropped = set(positions)
+    remaining = [doc_id for position, doc_id in sorted(vectorstore.index_to_docstore_id.items()) if position not in dropped]
+    vectorstore.index_to_docstore_id = dict(enumerate(remaining))
+    return len(ids)
+
+
+def clone_vectorstore(vectorstore):
+    """Shallow copy safe to mutate without touching a store another rerun or cache entry holds."""
+    faiss = dependable_faiss_import()
+    if getattr(vectorstore, "memory_mapped", False):
+        # clone_index would keep viewing the read-only mapping, and FAISS aborts on writes to it.
+        index = faiss.deserialize_index(faiss.serialize_index(vectorstore.index))
+    else:
+        index = faiss.clone_index(vectorstore.index)
+    clone = FAISS(
+        vectorstore.embedding_function,
+        index,
+        InMemoryDocstore(dict(vectorstore.docstore._dict)),
+        dict(vectorstore.index_to_docstore_id),
+    )
+    clone.lexical_index = get_lexical_index(vectorstore).copy()
+    return clone
+
+
+def detach_vectorstore(retriever, removed_sources):
+    """Private copy of the retriever's store minus `removed_sources`, or None if nothing is left."""
+    vectorstore = getattr(retriever, "vectorstore", None)
+    if vectorstore is None:
+        return None
+    vectorstore = clone_vectorstore(vectorstore)
+    remove_sources(vectorstore, removed_sources)
+    if vectorstore.index.ntotal == 0:
+        return None
+    return vectorstore
+
+
+def reindex(vectorstore, index_spec=None):
+    """Move a store built incrementally on a flat index to the index `index_spec` picks for its final size."""
+    index = vectorstore.index
+    spec = resolve_index_spec(index_spec, index.ntotal, index.d)
+    if spec["type"] != "flat":
+        with span("index_build", chunks=index.ntotal, index_type=spec["type"]):
+            vectorstore.index = build_index(index.reconstruct_n(0, index.ntotal), spec)
+    return vectorstore
+
+
+def add_shards(shards: Dict[str, object], documents, embeddings, shard_by="source", max_concurrency: int = EMBED_MAX_CONCURRENCY, index_spec=None):
+    """Embed `documents` in one pass and index them as shards (see `plan_shards`), returning
+    `(shards, skipped)` where `shards` is a new dict that shares every untouched store.
+
+    A shard whose key already exists (a file re-added under the same name) is copied
+    before the new rows are appended; each new shard gets the index `index_spec` picks for its size.
+    """
+    shards = dict(shards)
+    texts = [doc.page_content for doc in documents]
+    with span("embed", chunks=len(texts)) as stage:
+        matrix, failures = embed_texts(texts, embeddings, max_concurrency=max_concurrency)
+        stage.set(failed=len(failures))
+    count("chunks_embedded", len(texts) - len(failures))
+    skipped = _skipped_messages(documents, failures)
+    if matrix is None:
+        return shards, skipped
+
+    plan = plan_shards(documents, shard_by)
+    with span("index_build", chunks=len(texts) - len(failures), shards=len(plan)):
+        for key, positions in plan.items():
+            kept = [position for position in positions if position not in failures]
+            if not kept:
+                continue
+            shard_documents = [documents[position] for position in kept]
+            if key in shards:
+                shards[key] = clone_vectorstore(shards[key])
+                append_vectors(shards[key], shard_documents, matrix[kept])
             else:
-                vectorstore.merge_from(tmp_store)
-            continue
-        except Exception:
-            # Fall back to per-doc embedding within a failed batch.
-            pass
-
-        for offset, doc in enumerate(batch):
-            idx = start + offset
-            label = _label(doc, idx)
-            try:
-                tmp_store = FAISS.from_documents([doc], embeddings)
-                if vectorstore is None:
-                    vectorstore = tmp_store
-                else:
-                    vectorstore.merge_from(tmp_store)
-            except Exception as exc:  # keep going on single-doc failures
-                skipped.append(f"{label}: {exc}")
+                spec = resolve_index_spec(index_spec, len(kept), matrix.shape[1])
+                shards[key] = _wrap_index(build_index(matrix[kept], spec), shard_documents, embeddings)
+    return shards, skipped
+
+
+def _update_shards(retriever: ShardedRetriever, added_documents, removed_sources, embeddings, max_concurrency, index_spec):
+    removed = set(removed_sources)
+    shards = {}
+    for key, store in retriever.shards.items():
+        names = retriever.shard_sources.get(key, frozenset())
+        if not names & removed:
+            # Untouched shards are shared with the previous retriever, not copied.
+            shards[key] = store
+        elif not names <= removed:
+            store = clone_vectorstore(store)
+            remove_sources(store, removed)
+            shards[key] = store
+    shards, skipped = add_shards(
+        shards, added_documents, embeddings, retriever.shard_by, max_concurrency=max_concurrency, index_spec=index_spec
+    )
+    updated = as_sharded_retriever(
+        shards, embeddings, shard_by=retriever.shard_by, search_kwargs=retriever.search_kwargs, weights=retriever.weights
+    )
+    return updated, skipped
+
+
+def create_vectorstore(
+    documents,
+    openai_api_key=None,
+    max_concurrency: int = EMBED_MAX_CONCURRENCY,
+    index_spec=None,
+    embedding_backend: Optional[str] = None,
+    shard_by=None,
+):
+    """Create a hybrid FAISS + BM25 retriever with concurrent, rate-limited embedding; failed chunks are skipped and reported.
+
+    `index_spec` picks flat, IVF, HNSW or IVF-PQ search (automatic by corpus size when omitted).
+    `embedding_backend` overrides BRAINDOC_EMBEDDING_BACKEND; "local" needs no API key.
+    `shard_by` ("source", or a chunk count per shard) builds a ShardedRetriever whose
+    shards are searched in parallel and can be filtered or replaced per file.
+    """
+    embeddings = get_embeddings(openai_api_key, backend=embedding_backend)
+    if shard_by:
+        shards, skipped = add_shards(
+            {}, documents, embeddings, shard_by, max_concurrency=max_concurrency, index_spec=index_spec
+        )
+        return as_sharded_retriever(shards, embeddings, shard_by=shard_by), skipped
+
+    vectorstore, skipped = add_documents(
+        None, documents, embeddings, max_concurrency=max_concurrency, index_spec=index_spec
+    )
+
+    if vectorstore is None:
+        return None, skipped
+
+    return as_hybrid_retriever(vectorstore), skipped
+
+
+def update_vectorstore(
+    retriever,
+    added_documents,
+    removed_sources,
+    openai_api_key=None,
+    max_concurrency: int = EMBED_MAX_CONCURRENCY,
+    index_spec=None,
+    embedding_backend: Optional[str] = None,
+):
+    """Apply a per-file diff to an existing index instead of re-embedding the whole corpus.
+
+    The previous store is cloned first, so the retriever passed in stays valid.
+    A ShardedRetriever only copies the shards holding removed files and adds
+    new shards for added ones. Returns `(retriever, skipped)` like `create_vectorstore`.
+    """
+    embeddings = get_embeddings(openai_api_key, backend=embedding_backend)
+    if isinstance(retriever, ShardedRetriever):
+        return _update_shards(retriever, added_documents, removed_sources, embeddings, max_concurrency, index_spec)
+    vectorstore = detach_vectorstore(retriever, removed_sources)
+    vectorstore, skipped = add_documents(
+        vectorstore, added_documents, embeddings, max_concurrency=max_concurrency, index_spec=index_spec
+    )
 
     if vectorstore is None:
         return None, skipped
 
-    return vectorstore.as_retriever(), skipped
+    return as_hybrid_retriever(vectorstore), skipped
@@ -0,0 +1,115 @@
+import os
+import re
+import threading
+import zlib
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from modules.resources import get_http_client
+
+LOCAL_EMBEDDING_DIM = 384
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.'][a-z0-9]+)*")
+
+
+@lru_cache(maxsize=200_000)
+def _hash_feature(feature: str, dim: int) -> Tuple[int, float]:
+    # crc32 is stable across processes, unlike hash(), so vectors survive restarts.
+    digest = zlib.crc32(feature.encode("utf-8"))
+    return digest % dim, 1.0 if digest & 0x80000000 else -1.0
+
+
+class HashingEmbeddings(Embeddings):
+    """Local CPU embeddings from signed feature hashing of word unigrams and bigrams.
+
+    Term counts are damped with log1p and rows are L2-normalized, so FAISS L2
+    distance ranks like cosine similarity. Quality is below a neural model but
+    good enough for keyword-heavy documents, offline runs and tests.
+    """
+
+    remote = False
+
+    def __init__(self, dim: int = LOCAL_EMBEDDING_DIM):
+        self.dim = dim
+        self.model_id = f"local-hashing:v1:{dim}"
+
+    def _features(self, text: str) -> List[str]:
+        tokens = _TOKEN_RE.findall(text.lower())
+        return tokens + [f"{left} {right}" for left, right in zip(tokens, tokens[1:])]
+
+    def embed_matrix(self, texts: List[str]) -> np.ndarray:
+        rows, cols, signs = [], [], []
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                col, sign = _hash_feature(feature, self.dim)
+                rows.append(row)
+                cols.append(col)
+                signs.append(sign)
+
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        np.add.at(matrix, (np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)), signs)
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_matrix(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_matrix([text])[0].tolist()
+
+
+def _openai_backend(openai_api_key: Optional[str]) -> Embeddings:
+    return OpenAIEmbeddings(openai_api_key=openai_api_key, http_client=get_http_client())
+
+
+def _local_backend(openai_api_key: Optional[str]) -> Embeddings:
+    return HashingEmbeddings()
+
+
+EMBEDDING_BACKENDS: Dict[str, Callable[[Optional[str]], Embeddings]] = {
+    "openai": _openai_backend,
+    "local": _local_backend,
+}
+# Backends that hold no per-key state are built once and shared by every session.
+SHARED_BACKENDS = {"local"}
+
+_shared_instances: Dict[str, Embeddings] = {}
+_shared_lock = threading.Lock()
+
+
+def register_embedding_backend(name: str, factory: Callable[[Optional[str]], Embeddings], shared: bool = False) -> None:
+    """Add a backend; `factory(openai_api_key)` returns a LangChain Embeddings object."""
+    EMBEDDING_BACKENDS[name] = factory
+    if shared:
+        SHARED_BACKENDS.add(name)
+
+
+def default_embedding_backend() -> str:
+    """BRAINDOC_EMBEDDING_BACKEND: "openai" (default) or "local", which needs no key or network.
+
+    Read on every call so a `.env` loaded after this module is imported still applies.
+    """
+    return os.getenv("BRAINDOC_EMBEDDING_BACKEND", "openai")
+
+
+def create_embedding_backend(name: Optional[str], openai_api_key: Optional[str] = None) -> Embeddings:
+    name = name or default_embedding_backend()
+    if name not in EMBEDDING_BACKENDS:
+        raise ValueError(f"Unknown embedding backend {name!r}; expected one of {', '.join(EMBEDDING_BACKENDS)}")
+    if name not in SHARED_BACKENDS:
+        return EMBEDDING_BACKENDS[name](openai_api_key)
+    with _shared_lock:
+        if name not in _shared_instances:
+            _shared_instances[name] = EMBEDDING_BACKENDS[name](openai_api_key)
+        return _shared_instances[name]
+
+
+def is_remote(embeddings) -> bool:
+    """Remote backends are worth caching and must respect upstream rate limits."""
+    return getattr(embeddings, "remote", True)
@@ -0,0 +1,157 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from modules.tokenizer import count_tokens, normalize_text
+
+EMBEDDING_CACHE_PATH = os.path.join(".braindoc_cache", "embeddings.sqlite3")
+# SQLite's default bound-parameter limit is 999 on older builds.
+_LOOKUP_CHUNK = 500
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite store of float32 vectors keyed by (model id, normalized text hash)."""
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " text_hash TEXT NOT NULL,"
+            " dim INTEGER NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, text_hash))"
+        )
+        self._conn.commit()
+        self.stats = {
+            "requested": 0,
+            "hits": 0,
+            "batch_duplicates": 0,
+            "misses": 0,
+            "tokens_saved": 0,
+        }
+
+    def get_many(self, model: str, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), _LOOKUP_CHUNK):
+                chunk = keys[start : start + _LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *chunk],
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model: str, items: Dict[str, List[float]]) -> None:
+        rows = []
+        for key, vector in items.items():
+            array = np.asarray(vector, dtype=np.float32)
+            rows.append((model, key, int(array.shape[0]), array.tobytes()))
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._conn.commit()
+
+    def hit_rate(self) -> float:
+        requested = self.stats["requested"]
+        if not requested:
+            return 0.0
+        return (self.stats["hits"] + self.stats["batch_duplicates"]) / requested
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that only sends unseen, de-duplicated texts upstream."""
+
+    def __init__(self, underlying: Embeddings, cache: EmbeddingCache, model_id: str):
+        self.underlying = underlying
+        self.cache = cache
+        self.model_id = model_id
+
+    def lookup(self, texts: List[str]) -> Tuple[List[str], Dict[str, np.ndarray], List[str], List[str]]:
+        """Split `texts` into cached vectors and the de-duplicated texts still to embed.
+
+        Returns `(keys, cached, missing_keys, missing_texts)` where `keys` is aligned with `texts`.
+        """
+        keys = [text_key(text) for text in texts]
+        # First occurrence of each key is the representative we may need to embed.
+        first_index = {}
+        for idx, key in enumerate(keys):
+            first_index.setdefault(key, idx)
+
+        cached = self.cache.get_many(self.model_id, list(first_index))
+        missing_keys = [key for key in first_index if key not in cached]
+        missing_texts = [texts[first_index[key]] for key in missing_keys]
+        return keys, cached, missing_keys, missing_texts
+
+    def store(self, texts: List[str], keys: List[str], missing_keys: List[str], fresh: Dict) -> Dict[str, np.ndarray]:
+        """Persist newly embedded vectors, update counters and return them as float32 arrays."""
+        # float32 throughout so results are identical whether or not they came from the cache.
+        fresh = {key: np.asarray(vector, dtype=np.float32) for key, vector in fresh.items()}
+        if fresh:
+            self.cache.put_many(self.model_id, fresh)
+
+        missing_set = set(missing_keys)
+        seen = set()
+        requested = hits = duplicates = tokens_saved = 0
+        for text, key in zip(texts, keys):
+            requested += 1
+            if key in seen:
+                duplicates += 1
+            else:
+                seen.add(key)
+                if key in missing_set:
+                    continue
+                hits += 1
+            tokens_saved += count_tokens(text)
+
+        with self.cache._lock:
+            stats = self.cache.stats
+            stats["requested"] += requested
+            stats["hits"] += hits
+            stats["batch_duplicates"] += duplicates
+            stats["misses"] += len(missing_keys)
+            stats["tokens_saved"] += tokens_saved
+        return fresh
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, vectors, missing_keys, missing_texts = self.lookup(texts)
+        embedded = self.underlying.embed_documents(missing_texts) if missing_texts else []
+        vectors.update(self.store(texts, keys, missing_keys, dict(zip(missing_keys, embedded))))
+        return [vectors[key].tolist() for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+
+_shared_cache: Optional[EmbeddingCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Process-wide cache so every session shares one connection and one set of counters."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = EmbeddingCache()
+        return _shared_cache
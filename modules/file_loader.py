@@ -1,89 +1,326 @@
+import codecs
+import functools
+import io
+import multiprocessing
 import os
-import tempfile
-from typing import List, Tuple
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
 
+import docx2txt
+import pdfplumber
+import pymupdf
+from langchain_core.documents import Document
+from pypdf import PdfReader
 from pypdf.errors import PdfReadError
-from langchain_community.document_loaders import (
-    PyPDFLoader,
-    PDFPlumberLoader,
-    PyMuPDFLoader,
-    TextLoader,
-    Docx2txtLoader,
-)
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from modules.chunker import chunk_profile, chunk_text
+from modules.metrics import count, observe, span
 
-def load_documents(uploaded_files) -> Tuple[List, List[str]]:
-    all_docs = []
-    load_errors = []
-    splitter = RecursiveCharacterTextSplitter(chunk_size=700, chunk_overlap=100)
+LOADER_WORKERS = min(4, os.cpu_count() or 1)
+LOADER_FILE_TIMEOUT_SECONDS = 120.0
+# Spawning workers costs around a second; below this much input, parsing inline is faster.
+LOADER_POOL_MIN_BYTES = 4 * 1024 * 1024
+# Streamlit runs scripts on threads, and forking a threaded process can deadlock.
+LOADER_START_METHOD = "spawn"
+_POOL_POLL_SECONDS = 0.05
 
+# Pages checked for fonts before deciding a PDF is image-only.
+PDF_PROBE_PAGES = 5
+TEXT_ENCODINGS = ("utf-8-sig", "cp1252")
+
+
+def read_upload_bytes(uploaded_file) -> bytes:
+    """Return the upload's bytes without consuming the stream when possible."""
+    getvalue = getattr(uploaded_file, "getvalue", None)
+    if callable(getvalue):
+        return getvalue()
+    return uploaded_file.read()
+
+
+def read_upload_buffer(uploaded_file):
+    """Zero-copy view of an in-memory upload (Streamlit's UploadedFile is a BytesIO), else its bytes."""
+    getbuffer = getattr(uploaded_file, "getbuffer", None)
+    if callable(getbuffer):
+        return getbuffer()
+    return read_upload_bytes(uploaded_file)
+
+
+def _upload_size(uploaded_file) -> int:
+    size = getattr(uploaded_file, "size", None)
+    return size if size is not None else len(read_upload_buffer(uploaded_file))
+
+
+def probe_pdf(data) -> Dict:
+    """Cheap pre-flight look at a PDF without extracting any text.
+
+    Returns `{"pages", "has_text", "encrypted"}`, where `has_text` means one of
+    the first PDF_PROBE_PAGES pages references a font (image-only scans have
+    none), or `{"error": ...}` when PyMuPDF cannot open the file at all.
+    """
+    try:
+        with pymupdf.open(stream=data, filetype="pdf") as pdf:
+            if pdf.needs_pass:
+                return {"pages": pdf.page_count, "has_text": False, "encrypted": True}
+            probe_pages = range(min(pdf.page_count, PDF_PROBE_PAGES))
+            has_text = any(pdf[page].get_fonts() for page in probe_pages)
+            return {"pages": pdf.page_count, "has_text": has_text, "encrypted": False}
+    except Exception as exc:
+        return {"error": str(exc)}
+
+
+def _pymupdf_pages(data) -> Iterator[Tuple[int, int, str]]:
+    with pymupdf.open(stream=data, filetype="pdf") as pdf:
+        for number, page in enumerate(pdf):
+            yield number, pdf.page_count, page.get_text()
+
+
+def _pypdf_pages(data) -> Iterator[Tuple[int, int, str]]:
+    reader = PdfReader(io.BytesIO(data))
+    for number, page in enumerate(reader.pages):
+        yield number, len(reader.pages), page.extract_text() or ""
+
+
+def _pdfplumber_pages(data) -> Iterator[Tuple[int, int, str]]:
+    with pdfplumber.open(io.BytesIO(data)) as pdf:
+        for number, page in enumerate(pdf.pages):
+            yield number, len(pdf.pages), page.extract_text() or ""
+            # pdfplumber caches every parsed object per page; drop them as we go.
+            page.close()
+
+
+# Each yields `(page_number, total_pages, text)` straight from memory. Tried in
+# order; a parser only runs when the ones before it failed or found no text.
+PDF_PARSERS = {
+    "pymupdf": _pymupdf_pages,
+    "pypdf": _pypdf_pages,
+    "pdfplumber": _pdfplumber_pages,
+}
+
+
+def _decode_text(data) -> str:
+    for encoding in TEXT_ENCODINGS:
+        try:
+            return codecs.decode(data, encoding)
+        except UnicodeDecodeError:
+            continue
+    try:
+        from charset_normalizer import from_bytes
+    except ImportError:
+        from_bytes = None
+    match = from_bytes(bytes(data)).best() if from_bytes else None
+    return str(match) if match is not None else codecs.decode(data, "latin-1")
+
+
+def _chunks(profile: Dict, text: str, metadata: Dict, timings: Optional[Dict] = None) -> Iterator[Document]:
+    started = time.perf_counter()
+    chunks = chunk_text(text, metadata, profile)
+    if timings is not None:
+        timings["split"] = timings.get("split", 0.0) + time.perf_counter() - started
+    yield from chunks
+
+
+def _iter_pdf(name: str, data, profile: Dict, errors: List[str], timings: Optional[Dict] = None) -> Iterator[Document]:
+    """Yield chunks page by page from the first parser the probe allows that finds text."""
+    probe = probe_pdf(data)
+    if probe.get("encrypted"):
+        errors.append(f"{name}: PDF is password-protected")
+        return
+    if "error" not in probe and not probe["has_text"]:
+        errors.append(f"{name}: no readable text found; PDF may be scanned/image-only")
+        return
+
+    # PyMuPDF is fastest; the others only run if it fails or finds nothing.
+    parsers = [parser for parser in PDF_PARSERS if parser != "pymupdf" or "error" not in probe]
+    last_error = None
+    for parser in parsers:
+        produced = False
+        try:
+            for page, total_pages, text in PDF_PARSERS[parser](data):
+                metadata = {"source": name, "page": page, "total_pages": total_pages, "parser": parser}
+                for chunk in _chunks(profile, text, metadata, timings):
+                    produced = True
+                    yield chunk
+        except Exception as exc:
+            if produced:
+                # Chunks already handed on cannot be retracted, so keep them and report the rest.
+                errors.append(f"{name}: stopped after page {page + 1} ({exc})")
+                return
+            last_error = exc
+            continue
+        if produced:
+            return
+
+    if isinstance(last_error, PdfReadError):
+        errors.append(f"{name}: could not read PDF ({last_error})")
+    else:
+        errors.append(f"{name}: no readable text found; PDF may be scanned/image-only")
+
+
+def iter_file_documents(
+    name: str, data, errors: List[str], timings: Optional[Dict] = None, domain: Optional[str] = None
+) -> Iterator[Document]:
+    """Parse one upload from memory, yielding chunks as each page is ready.
+
+    No temporary files are written and no full page list is built, so large
+    PDFs reach the embedder page by page. Chunks follow `domain`'s chunking
+    profile (see `chunker.chunk_profile`). Problems are appended to `errors`;
+    seconds spent splitting text are added to `timings["split"]` when given.
+    """
+    suffix = os.path.splitext(name)[1].lower()
+    profile = chunk_profile(domain, suffix)
+    produced = False
+    try:
+        if suffix == ".pdf":
+            chunks = _iter_pdf(name, data, profile, errors, timings)
+        elif suffix == ".docx":
+            chunks = _chunks(profile, docx2txt.process(io.BytesIO(data)), {"source": name, "parser": "docx2txt"}, timings)
+        elif suffix == ".txt":
+            chunks = _chunks(profile, _decode_text(data), {"source": name, "parser": "text"}, timings)
+        else:
+            errors.append(f"Unsupported file type for {name}")
+            return
+        for chunk in chunks:
+            produced = True
+            yield chunk
+    except PdfReadError as exc:
+        errors.append(f"{name}: could not read PDF ({exc})")
+        return
+    except Exception as exc:  # keep user-facing failures visible without crashing
+        errors.append(f"{name}: {exc}")
+        return
+
+    if not produced and suffix != ".pdf":
+        errors.append(f"{name}: no readable content found")
+
+
+def iter_documents(uploaded_files, errors: List[str], domain: Optional[str] = None) -> Iterator[Document]:
+    """Stream chunks from every upload in order, one file in memory at a time."""
     for uploaded_file in uploaded_files:
-        suffix = os.path.splitext(uploaded_file.name)[1].lower()
-        tmp_path = None
+        yield from iter_file_documents(uploaded_file.name, read_upload_buffer(uploaded_file), errors, domain=domain)
+
+
+def _load_file(name: str, data, domain: Optional[str] = None) -> Tuple[List, List[str]]:
+    """Parse and chunk one upload; module-level so pool workers can unpickle it.
+
+    Every chunk records the `parser` used, the file's `parse_time_ms` and the
+    part of it spent splitting, `split_time_ms`.
+    """
+    errors: List[str] = []
+    timings: Dict = {}
+    started = time.perf_counter()
+    docs = list(iter_file_documents(name, data, errors, timings, domain))
+    parse_time_ms = round((time.perf_counter() - started) * 1000, 1)
+    split_time_ms = round(timings.get("split", 0.0) * 1000, 1)
+    for doc in docs:
+        doc.metadata["parse_time_ms"] = parse_time_ms
+        doc.metadata["split_time_ms"] = split_time_ms
+    return docs, errors
+
+
+def record_parse_metrics(name: str, chunks: int, parse_time_ms: float, split_time_ms: float = 0.0) -> None:
+    """Report one file's extraction and splitting time (which may come from a worker process)."""
+    observe("parse", max(parse_time_ms - split_time_ms, 0.0) / 1000, file=name, chunks=chunks)
+    observe("split", split_time_ms / 1000, file=name, chunks=chunks)
+    count("files_parsed")
+    count("chunks_parsed", chunks)
+
+
+_file_started = None
 
+
+def _init_pool_worker(file_started) -> None:
+    global _file_started
+    _file_started = file_started
+
+
+def _run_timed(slot: int, load_file, name: str, data: bytes):
+    # Stamp the real start so queueing and worker start-up never count against the file.
+    _file_started[slot] = time.time()
+    return load_file(name, data)
+
+
+def _load_in_pool(items: List[Tuple[str, bytes]], workers: int, timeout: float, load_file) -> List[Tuple[List, List[str]]]:
+    """Run `load_file(name, data)` for every item on a process pool, keeping input order.
+
+    Each file gets `timeout` seconds from the moment a worker starts on it. A
+    file that overruns is reported and its pool terminated (the only way to
+    stop a worker stuck in native parser code); files that had not finished
+    yet are resubmitted to a fresh pool.
+    """
+    context = multiprocessing.get_context(LOADER_START_METHOD)
+    results: List = [None] * len(items)
+    pending = list(range(len(items)))
+
+    while pending:
+        file_started = context.RawArray("d", len(items))
+        pool = context.Pool(min(workers, len(pending)), initializer=_init_pool_worker, initargs=(file_started,))
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
-                tmp_file.write(uploaded_file.read())
-                tmp_path = tmp_file.name
-
-            if suffix == ".pdf":
-                docs = []
-
-                # Attempt 1: PyPDFLoader
-                try:
-                    docs = splitter.split_documents(PyPDFLoader(tmp_path).load())
-                except PdfReadError as exc:
-                    load_errors.append(f"{uploaded_file.name}: could not read PDF ({exc})")
-
-                # Attempt 2: PDFPlumberLoader
-                if not docs:
-                    try:
-                        docs = splitter.split_documents(PDFPlumberLoader(tmp_path).load())
-                    except Exception:
-                        pass
-
-                # Attempt 3: PyMuPDFLoader
-                if not docs:
-                    try:
-                        docs = splitter.split_documents(PyMuPDFLoader(tmp_path).load())
-                    except Exception:
-                        pass
-
-                if not docs:
-                    load_errors.append(
-                        f"{uploaded_file.name}: no readable text found; PDF may be scanned/image-only"
-                    )
+            futures = {idx: pool.apply_async(_run_timed, (idx, load_file, *items[idx])) for idx in pending}
+            retry = []
+            for position, idx in enumerate(pending):
+                future = futures[idx]
+                while not future.ready():
+                    began = file_started[idx]
+                    if began and time.time() - began > timeout:
+                        break
+                    future.wait(_POOL_POLL_SECONDS)
+                if future.ready():
+                    results[idx] = future.get()
                     continue
 
-            elif suffix == ".docx":
-                pages = Docx2txtLoader(tmp_path).load()
-                docs = splitter.split_documents(pages)
-            elif suffix == ".txt":
-                pages = TextLoader(tmp_path, autodetect_encoding=True).load()
-                docs = splitter.split_documents(pages)
-            else:
-                load_errors.append(f"Unsupported file type for {uploaded_file.name}")
-                continue
+                results[idx] = ([], [f"{items[idx][0]}: parsing timed out after {timeout:g}s"])
+                for later in pending[position + 1 :]:
+                    if futures[later].ready():
+                        results[later] = futures[later].get()
+                    else:
+                        retry.append(later)
+                break
+            pending = retry
+        finally:
+            pool.terminate()
+            pool.join()
 
-            if not docs:
-                load_errors.append(f"{uploaded_file.name}: no readable content found")
-                continue
+    return results
 
-            # Use original uploaded filename instead of temporary paths in metadata.
-            for doc in docs:
-                doc.metadata["source"] = uploaded_file.name
 
-            all_docs.extend(docs)
-        except PdfReadError as exc:
-            load_errors.append(f"{uploaded_file.name}: could not read PDF ({exc})")
-        except Exception as exc:  # keep user-facing failures visible without crashing
-            load_errors.append(f"{uploaded_file.name}: {exc}")
-        finally:
-            if tmp_path and os.path.exists(tmp_path):
-                try:
-                    os.remove(tmp_path)
-                except OSError:
-                    load_errors.append(f"Could not remove temp file for {uploaded_file.name}")
+def load_documents(
+    uploaded_files,
+    workers: Optional[int] = None,
+    timeout: float = LOADER_FILE_TIMEOUT_SECONDS,
+    domain: Optional[str] = None,
+) -> Tuple[List, List[str]]:
+    """Parse uploads into chunks, returning `(docs, errors)` in upload order.
 
+    Several files are parsed concurrently on `workers` processes (default
+    LOADER_WORKERS), each bounded by a per-file `timeout`. A single file,
+    `workers=1` or less than LOADER_POOL_MIN_BYTES of input is parsed inline,
+    where the pool start-up would cost more than it saves. `domain` selects
+    the chunking profile (clause-aware for Legal, section-aware for
+    Education, table-aware for Finance).
+    """
+    uploaded_files = list(uploaded_files)
+    workers = LOADER_WORKERS if workers is None else workers
+
+    with span("load_documents", files=len(uploaded_files)) as stage:
+        total_bytes = sum(_upload_size(uploaded_file) for uploaded_file in uploaded_files)
+        pooled = workers > 1 and len(uploaded_files) > 1 and total_bytes >= LOADER_POOL_MIN_BYTES
+        if pooled:
+            items = [(uploaded_file.name, read_upload_bytes(uploaded_file)) for uploaded_file in uploaded_files]
+            results = _load_in_pool(items, workers, timeout, functools.partial(_load_file, domain=domain))
+        else:
+            results = [
+                _load_file(uploaded_file.name, read_upload_buffer(uploaded_file), domain) for uploaded_file in uploaded_files
+            ]
+
+        all_docs = []
+        load_errors = []
+        for docs, errors in results:
+            if docs:
+                metadata = docs[0].metadata
+                record_parse_metrics(
+                    metadata.get("source"), len(docs), metadata.get("parse_time_ms", 0.0), metadata.get("split_time_ms", 0.0)
+                )
+            all_docs.extend(docs)
+            load_errors.extend(errors)
+        stage.set(bytes=total_bytes, pooled=pooled, chunks=len(all_docs), errors=len(load_errors))
     return all_docs, load_errors
@@ -0,0 +1,157 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from modules.lexical_index import get_lexical_index
+from modules.reranker import stored_vectors
+
+# Reciprocal rank fusion constant; 60 is the value from the original RRF paper.
+RRF_K = 60
+# Each ranker contributes this many candidates per requested result.
+FUSION_CANDIDATES_PER_RESULT = 4
+# (dense, lexical) weights. Legal, medical and finance questions lean on exact
+# clause numbers, lab names and tickers, so lexical matches count for more there.
+DEFAULT_FUSION_WEIGHTS = (1.0, 1.0)
+DOMAIN_FUSION_WEIGHTS = {
+    "Legal": (0.8, 1.2),
+    "Healthcare": (0.9, 1.1),
+    "Finance": (0.9, 1.1),
+    "Education": (1.2, 0.8),
+}
+
+
+# Filtered searches fetch this many times more candidates, since most hits may belong to other sources.
+SOURCE_FILTER_FETCH_FACTOR = 8
+
+
+def _doc_key(doc: Document):
+    return doc.id or id(doc)
+
+
+def doc_source(doc) -> Optional[str]:
+    return getattr(doc, "metadata", {}).get("source")
+
+
+def fuse_scored(
+    dense_docs: List[Document],
+    lexical_docs: List[Document],
+    k: int,
+    weights: Tuple[float, float] = DEFAULT_FUSION_WEIGHTS,
+    rrf_k: int = RRF_K,
+) -> List[Tuple[Document, float]]:
+    """Weighted reciprocal rank fusion of two best-first lists; the top `k` `(document, fused score)` pairs."""
+    dense_weight, lexical_weight = weights
+    scores: Dict[Any, float] = {}
+    docs: Dict[Any, Document] = {}
+    for weight, ranking in ((dense_weight, dense_docs), (lexical_weight, lexical_docs)):
+        if weight <= 0:
+            continue
+        for rank, doc in enumerate(ranking):
+            key = _doc_key(doc)
+            docs.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + weight / (rrf_k + rank + 1)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [(docs[key], scores[key]) for key in ranked]
+
+
+class HybridRetriever(BaseRetriever):
+    """Fuses FAISS similarity and BM25 rankings with weighted reciprocal rank fusion.
+
+    Exposes `vectorstore` and `search_kwargs` like LangChain's VectorStoreRetriever,
+    so callers that persist or tune the store keep working.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstore: Any
+    search_kwargs: Dict[str, Any] = {"k": 4}
+    weights: Tuple[float, float] = DEFAULT_FUSION_WEIGHTS
+    rrf_k: int = RRF_K
+
+    def for_domain(self, domain: Optional[str]) -> "HybridRetriever":
+        """Copy using that domain's fusion weights; the underlying indexes are shared."""
+        return self.model_copy(update={"weights": DOMAIN_FUSION_WEIGHTS.get(domain, DEFAULT_FUSION_WEIGHTS)})
+
+    def _candidates(self, k: int) -> int:
+        return max(k * FUSION_CANDIDATES_PER_RESULT, 20)
+
+    def _lexical_docs(self, query: str, k: int, sources=None) -> List[Document]:
+        lexical = get_lexical_index(self.vectorstore)
+        if self.weights[1] <= 0 or lexical is None:
+            return []
+        candidates = self._candidates(k)
+        fetch = candidates * SOURCE_FILTER_FETCH_FACTOR if sources else candidates
+        docs = []
+        for doc_id, _ in lexical.search(query, fetch):
+            doc = self.vectorstore.docstore.search(doc_id)
+            if isinstance(doc, Document) and (not sources or doc_source(doc) in sources):
+                docs.append(doc)
+        return docs[:candidates]
+
+    def _fuse(self, query: str, dense_docs: List[Document], k: int, sources=None) -> List[Tuple[Document, float]]:
+        return fuse_scored(dense_docs, self._lexical_docs(query, k, sources), k, self.weights, self.rrf_k)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun, **kwargs: Any
+    ) -> List[Document]:
+        """`sources` (a collection of `metadata["source"]` values) restricts results to those files."""
+        return [doc for doc, _ in self.search_with_scores(query, kwargs.get("k"), kwargs.get("sources"))]
+
+    def search_with_scores(
+        self, query: str, k: Optional[int] = None, sources=None, vector=None
+    ) -> List[Tuple[Document, float]]:
+        """Like `invoke`, but each document comes with its fused score (higher is better).
+
+        `vector` is the query's embedding if the caller already has it.
+        """
+        k = int(k or self.search_kwargs.get("k", 4))
+        sources = set(sources) if sources else None
+        dense = []
+        if self.weights[0] > 0:
+            candidates = self._candidates(k)
+            search_kwargs = {"k": candidates}
+            if sources:
+                search_kwargs.update(
+                    filter=lambda metadata: metadata.get("source") in sources,
+                    fetch_k=candidates * SOURCE_FILTER_FETCH_FACTOR,
+                )
+            if vector is None:
+                dense = self.vectorstore.similarity_search(query, **search_kwargs)
+            else:
+                dense = self.vectorstore.similarity_search_by_vector(vector, **search_kwargs)
+        return self._fuse(query, dense, k, sources)
+
+    def batch_retrieve(self, queries: List[str], vectors, k: Optional[int] = None) -> List[List[Document]]:
+        """Retrieve for many queries at once from their pre-computed embeddings.
+
+        All dense searches go to FAISS as one matrix, which is far cheaper than
+        one `similarity_search` per query; BM25 and fusion then run per query.
+        """
+        k = int(k or self.search_kwargs.get("k", 4))
+        if not queries:
+            return []
+        dense: List[List[Document]] = [[] for _ in queries]
+        if self.weights[0] > 0:
+            matrix = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(queries), -1)
+            if getattr(self.vectorstore, "_normalize_L2", False):
+                matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+            _, rows = self.vectorstore.index.search(matrix, self._candidates(k))
+            index_to_id = self.vectorstore.index_to_docstore_id
+            for position, hits in enumerate(rows):
+                for row in hits:
+                    doc = self.vectorstore.docstore.search(index_to_id[row]) if row in index_to_id else None
+                    if isinstance(doc, Document):
+                        dense[position].append(doc)
+        return [[doc for doc, _ in self._fuse(query, docs, k)] for query, docs in zip(queries, dense)]
+
+    def stored_vectors(self, docs: List[Document]):
+        """The index's own vectors for `docs` (see `reranker.stored_vectors`)."""
+        return stored_vectors([self.vectorstore], docs)
+
+
+def as_hybrid_retriever(vectorstore, **kwargs) -> HybridRetriever:
+    return HybridRetriever(vectorstore=vectorstore, **kwargs)
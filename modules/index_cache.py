@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from typing import Dict, List, Optional, Tuple
+
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.faiss import dependable_faiss_import
+
+from modules import resources
+from modules.hybrid_retriever import as_hybrid_retriever
+from modules.lexical_index import LEXICAL_INDEX_NAME, BM25Index, get_lexical_index
+from modules.metrics import count
+from modules.resources import get_shared_indexes
+
+INDEX_CACHE_DIR = os.path.join(".braindoc_cache", "indexes")
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+MAX_CACHE_AGE_SECONDS = 7 * 24 * 60 * 60
+MANIFEST_NAME = "manifest.json"
+# File names FAISS.save_local writes.
+FAISS_INDEX_NAME = "index.faiss"
+DOCSTORE_NAME = "index.pkl"
+
+_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+
+def file_digest(data: bytes) -> str:
+    """Content hash of a single upload."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def corpus_fingerprint(digests: List[str], namespace: str = "") -> str:
+    """Order-independent key for a set of uploads.
+
+    `namespace` folds in anything else that changes the index contents
+    (embedding model, chunking settings) so those never share an entry.
+    """
+    hasher = hashlib.sha256(namespace.encode("utf-8"))
+    for digest in sorted(digests):
+        hasher.update(digest.encode("ascii"))
+    return hasher.hexdigest()
+
+
+def diff_manifest(previous: Dict[str, str], current: Dict[str, str]) -> Tuple[List[str], List[str]]:
+    """Compare `{filename: digest}` manifests; a changed file is both removed and added."""
+    added = [name for name, digest in current.items() if previous.get(name) != digest]
+    removed = [name for name, digest in previous.items() if current.get(name) != digest]
+    return added, removed
+
+
+def _entry_path(fingerprint: str) -> str:
+    return os.path.join(INDEX_CACHE_DIR, fingerprint)
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _mmap_flags() -> int:
+    faiss = dependable_faiss_import()
+    # IO_FLAG_MMAP_IFC also maps flat vector storage; plain IO_FLAG_MMAP only maps IVF lists.
+    return getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+def _remember(fingerprint: str, retriever, manifest: dict, mapped: bool = False) -> None:
+    """Share the entry with every session; its size is approximated by its files on disk."""
+    path = _entry_path(fingerprint)
+    sizes = {}
+    for name in (FAISS_INDEX_NAME, DOCSTORE_NAME, LEXICAL_INDEX_NAME):
+        try:
+            sizes[name] = os.path.getsize(os.path.join(path, name))
+        except OSError:
+            sizes[name] = 0
+    index_bytes = sizes[FAISS_INDEX_NAME]
+    resident = sizes[DOCSTORE_NAME] + sizes[LEXICAL_INDEX_NAME] + (0 if mapped else index_bytes)
+    evicted = get_shared_indexes().put(fingerprint, (retriever, manifest), resident, index_bytes if mapped else 0)
+    count("index_memory_evictions", evicted)
+
+
+def _touch(fingerprint: str) -> None:
+    """Mark an entry as recently used; eviction goes by the manifest's mtime."""
+    try:
+        os.utime(os.path.join(_entry_path(fingerprint), MANIFEST_NAME), None)
+    except OSError:
+        # Not saved (yet) or already evicted by another process.
+        pass
+
+
+def load_cached_index(fingerprint: str, embeddings) -> Optional[Tuple[object, dict]]:
+    """Return `(retriever, manifest)` for a known corpus, or None on a miss.
+
+    Indexes already loaded by any session are shared. Otherwise the FAISS
+    index is memory-mapped from disk (BRAINDOC_INDEX_MMAP) so processes share
+    the OS page cache; a mapped store is read-only and is copied before edits.
+    """
+    shared = get_shared_indexes().get(fingerprint)
+    if shared is not None:
+        # Sessions served from memory still use the on-disk copy; keep age-based eviction off it.
+        _touch(fingerprint)
+        _stats["memory_hits"] += 1
+        return shared
+
+    path = _entry_path(fingerprint)
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        _stats["misses"] += 1
+        return None
+
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        mapped = resources.index_mmap()
+        # The docstore pickle is written by save_cached_index below, never by users.
+        vectorstore = FAISS.load_local(
+            path, embeddings, allow_dangerous_deserialization=True, io_flags=_mmap_flags() if mapped else 0
+        )
+        vectorstore.memory_mapped = mapped
+        # Entries saved before the lexical index existed rebuild it from the docstore on first use.
+        vectorstore.lexical_index = BM25Index.load(path)
+    except Exception:
+        # A half-written or stale entry is treated as a miss and rebuilt.
+        shutil.rmtree(path, ignore_errors=True)
+        _stats["misses"] += 1
+        return None
+
+    _touch(fingerprint)
+    retriever = as_hybrid_retriever(vectorstore)
+    _remember(fingerprint, retriever, manifest, mapped)
+    _stats["disk_hits"] += 1
+    return retriever, manifest
+
+
+def save_cached_index(fingerprint: str, retriever, manifest: Dict) -> None:
+    """Persist the retriever's FAISS store, BM25 index and manifest, then apply eviction."""
+    vectorstore = getattr(retriever, "vectorstore", None)
+    if vectorstore is None:
+        return
+
+    manifest = dict(manifest, fingerprint=fingerprint, created_at=time.time())
+    os.makedirs(INDEX_CACHE_DIR, exist_ok=True)
+    path = _entry_path(fingerprint)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+
+    try:
+        vectorstore.save_local(tmp_path)
+        get_lexical_index(vectorstore).save(tmp_path)
+        with open(os.path.join(tmp_path, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    _remember(fingerprint, retriever, manifest)
+    evict_cached_indexes()
+
+
+def evict_cached_indexes(
+    max_bytes: Optional[int] = None,
+    max_age_seconds: Optional[float] = None,
+) -> int:
+    """Drop entries older than the age limit, then least recently used ones until under the size limit."""
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    max_age_seconds = MAX_CACHE_AGE_SECONDS if max_age_seconds is None else max_age_seconds
+    if not os.path.isdir(INDEX_CACHE_DIR):
+        return 0
+
+    now = time.time()
+    entries = []
+    for name in os.listdir(INDEX_CACHE_DIR):
+        path = os.path.join(INDEX_CACHE_DIR, name)
+        manifest_path = os.path.join(path, MANIFEST_NAME)
+        if not os.path.isdir(path) or not os.path.exists(manifest_path):
+            continue
+        entries.append((os.path.getmtime(manifest_path), _dir_size(path), name, path))
+
+    # Oldest access first.
+    entries.sort()
+    total = sum(size for _, size, _, _ in entries)
+    evicted = 0
+    for last_used, size, name, path in entries:
+        if now - last_used <= max_age_seconds and total <= max_bytes:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        get_shared_indexes().discard(name)
+        total -= size
+        evicted += 1
+
+    _stats["evictions"] += evicted
+    return evicted
+
+
+def cache_stats() -> Dict[str, int]:
+    stats = dict(_stats)
+    stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+    return stats
@@ -0,0 +1,165 @@
+import math
+import os
+from typing import Dict, Optional, Union
+
+import numpy as np
+from langchain_community.vectorstores.faiss import dependable_faiss_import
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+# Below this size brute force is both exact and fast enough.
+AUTO_FLAT_MAX_VECTORS = 20_000
+# Above this size the full-precision vectors dominate RAM, so compress with PQ.
+AUTO_IVF_FLAT_MAX_VECTORS = 500_000
+TRAINING_SAMPLE_SIZE = 50_000
+# FAISS wants roughly this many training points per IVF centroid.
+MIN_POINTS_PER_CENTROID = 39
+
+INDEX_DEFAULTS = {
+    "flat": {},
+    "ivf_flat": {"nlist": None, "nprobe": 16},
+    "hnsw": {"M": 32, "ef_construction": 80, "ef_search": 64},
+    "ivf_pq": {"nlist": None, "nprobe": 16, "m": None, "nbits": 8},
+}
+
+
+def default_index_type() -> str:
+    """`"auto"` (pick by corpus size) or one of INDEX_TYPES, from BRAINDOC_INDEX_TYPE.
+
+    Read on every call so a `.env` loaded after this module is imported still applies.
+    """
+    return os.getenv("BRAINDOC_INDEX_TYPE", "auto")
+
+
+def resolve_index_spec(spec: Union[None, str, Dict], n_vectors: int, dim: int) -> Dict:
+    """Turn `None`, `"auto"`, a type name or a partial dict into a complete spec.
+
+    Unset sizes (`nlist`, PQ `m`) are derived from the corpus so explicit
+    specs only need the knobs someone actually wants to pin.
+    """
+    if spec is None:
+        spec = default_index_type()
+    if isinstance(spec, str):
+        spec = {"type": spec}
+    spec = dict(spec)
+
+    index_type = spec.get("type", "auto")
+    if index_type == "auto":
+        if n_vectors <= AUTO_FLAT_MAX_VECTORS:
+            index_type = "flat"
+        elif n_vectors <= AUTO_IVF_FLAT_MAX_VECTORS:
+            index_type = "ivf_flat"
+        else:
+            index_type = "ivf_pq"
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {index_type!r}; expected one of {', '.join(INDEX_TYPES)}")
+
+    resolved = dict(INDEX_DEFAULTS[index_type], **spec)
+    resolved["type"] = index_type
+
+    if "nlist" in resolved:
+        # sqrt(n) scaling is the usual starting point; never ask for more centroids than training can support.
+        nlist = resolved["nlist"] or int(4 * math.sqrt(max(n_vectors, 1)))
+        resolved["nlist"] = max(1, min(nlist, n_vectors // MIN_POINTS_PER_CENTROID or 1))
+        resolved["nprobe"] = max(1, min(int(resolved["nprobe"]), resolved["nlist"]))
+
+    if index_type == "ivf_pq":
+        if not resolved["m"]:
+            # At least 4 dimensions per sub-quantizer keeps recall reasonable at 1 byte per code.
+            resolved["m"] = next(m for m in (64, 48, 32, 24, 16, 8, 4, 2, 1) if dim % m == 0 and (dim // m >= 4 or m == 1))
+        if dim % resolved["m"]:
+            raise ValueError(f"PQ m={resolved['m']} must divide the embedding dimension {dim}")
+        # Each 2**nbits-entry code book needs MIN_POINTS_PER_CENTROID points per entry.
+        max_bits = int(math.log2(max(n_vectors // MIN_POINTS_PER_CENTROID, 2)))
+        resolved["nbits"] = max(1, min(int(resolved["nbits"]), max_bits))
+
+    return resolved
+
+
+def _factory_string(spec: Dict) -> str:
+    index_type = spec["type"]
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "ivf_flat":
+        return f"IVF{spec['nlist']},Flat"
+    if index_type == "hnsw":
+        return f"HNSW{spec['M']}"
+    return f"IVF{spec['nlist']},PQ{spec['m']}x{spec['nbits']}"
+
+
+def new_index(spec: Dict, dim: int):
+    """Create an empty, untrained FAISS index for a resolved spec with its search parameters applied."""
+    faiss = dependable_faiss_import()
+    index = faiss.index_factory(dim, _factory_string(spec), faiss.METRIC_L2)
+
+    if spec["type"] == "hnsw":
+        index.hnsw.efConstruction = int(spec["ef_construction"])
+        index.hnsw.efSearch = int(spec["ef_search"])
+    elif "nprobe" in spec:
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = int(spec["nprobe"])
+        # Lets reconstruct() read vectors back for rebuilds and re-ranking.
+        ivf.make_direct_map()
+        if spec["type"] == "ivf_pq":
+            # Polysemous codes only help Hamming pre-filtering, which search never enables,
+            # and their training dominates build time.
+            faiss.downcast_index(ivf).do_polysemous_training = False
+    return index
+
+
+def build_index(matrix: np.ndarray, spec: Dict, seed: int = 0):
+    """Train (on a sample for large corpora) and fill an index from a float32 matrix."""
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    index = new_index(spec, matrix.shape[1])
+    if not index.is_trained:
+        sample: Optional[np.ndarray] = matrix
+        if matrix.shape[0] > TRAINING_SAMPLE_SIZE:
+            rows = np.random.default_rng(seed).choice(matrix.shape[0], TRAINING_SAMPLE_SIZE, replace=False)
+            sample = matrix[np.sort(rows)]
+        index.train(sample)
+    index.add(matrix)
+    return index
+
+
+def remove_positions(index, positions):
+    """Remove rows and renumber the survivors 0..n-1, which LangChain's id mapping assumes.
+
+    Flat indexes already compact on `remove_ids`. IVF indexes keep their old
+    labels, so the inverted-list ids are rewritten in place (no re-encoding,
+    so PQ codes are untouched). HNSW cannot remove at all and is rebuilt from
+    its exact stored vectors. Returns the index to use afterwards.
+    """
+    faiss = dependable_faiss_import()
+    drop = np.unique(np.fromiter(positions, dtype=np.int64))
+    if not drop.size:
+        return index
+
+    if isinstance(faiss.downcast_index(index), faiss.IndexHNSW):
+        keep = np.ones(index.ntotal, dtype=bool)
+        keep[drop] = False
+        vectors = index.reconstruct_n(0, index.ntotal)[keep]
+        rebuilt = faiss.clone_index(index)
+        rebuilt.reset()
+        if len(vectors):
+            rebuilt.add(vectors)
+        return rebuilt
+
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is None:
+        index.remove_ids(drop)
+        return index
+
+    total = ivf.ntotal
+    ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+    ivf.remove_ids(drop)
+    keep = np.ones(total, dtype=bool)
+    keep[drop] = False
+    new_ids = np.cumsum(keep) - 1
+    invlists = ivf.invlists
+    for list_no in range(ivf.nlist):
+        size = invlists.list_size(list_no)
+        if size:
+            ids = faiss.rev_swig_ptr(invlists.get_ids(list_no), size)
+            ids[:] = new_ids[ids]
+    ivf.make_direct_map()
+    return index
@@ -0,0 +1,146 @@
+import queue
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from modules.embedder import EMBED_BATCH_SIZE, EMBED_MAX_CONCURRENCY, add_documents, reindex
+from modules.file_loader import iter_file_documents, read_upload_buffer, record_parse_metrics
+
+# One consumer step fills every embedding worker with a full batch.
+PIPELINE_BATCH_CHUNKS = EMBED_BATCH_SIZE * EMBED_MAX_CONCURRENCY
+# Parsing may run this far ahead of embedding before it blocks.
+PIPELINE_QUEUE_CHUNKS = 2 * PIPELINE_BATCH_CHUNKS
+_PUT_POLL_SECONDS = 0.1
+
+_FILE_DONE = "file_done"
+_END = "end"
+
+
+def _produce(
+    uploaded_files, chunks: "queue.Queue", load_errors: List[str], stop: threading.Event, domain: Optional[str] = None
+) -> None:
+    """Parse uploads in order, feeding chunks and one end-of-file marker per upload into `chunks`."""
+
+    def _put(item) -> bool:
+        while not stop.is_set():
+            try:
+                chunks.put(item, timeout=_PUT_POLL_SECONDS)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        for uploaded_file in uploaded_files:
+            name = uploaded_file.name
+            errors: List[str] = []
+            timings: Dict = {}
+            stream = iter_file_documents(name, read_upload_buffer(uploaded_file), errors, timings, domain)
+            count = 0
+            parse_seconds = 0.0
+            while True:
+                # Only time spent inside the parser counts; waiting on a full queue does not.
+                started = time.perf_counter()
+                doc = next(stream, None)
+                parse_seconds += time.perf_counter() - started
+                if doc is None:
+                    break
+                count += 1
+                if not _put(("chunk", doc)):
+                    return
+            load_errors.extend(errors)
+            parse_time_ms = round(parse_seconds * 1000, 1)
+            record_parse_metrics(name, count, parse_time_ms, round(timings.get("split", 0.0) * 1000, 1))
+            if not _put((_FILE_DONE, {"file": name, "chunks": count, "parse_time_ms": parse_time_ms, "load_errors": errors})):
+                return
+    except Exception as exc:  # surface unexpected producer failures instead of hanging the consumer
+        load_errors.append(f"Parsing stopped unexpectedly: {exc}")
+    finally:
+        _put((_END, None))
+
+
+def ingest_uploads(
+    uploaded_files,
+    embeddings,
+    vectorstore=None,
+    index_spec=None,
+    max_concurrency: int = EMBED_MAX_CONCURRENCY,
+    batch_chunks: int = PIPELINE_BATCH_CHUNKS,
+    queue_chunks: int = PIPELINE_QUEUE_CHUNKS,
+    on_progress: Optional[Callable[[Dict], None]] = None,
+    domain: Optional[str] = None,
+) -> Tuple[object, List[str], List[str]]:
+    """Parse and embed uploads as one pipeline, so parsing file N+1 overlaps embedding file N.
+
+    A background thread parses into a bounded queue; this thread embeds a batch
+    as soon as `batch_chunks` are waiting, and at each file boundary. After a
+    file is fully indexed, `on_progress` gets
+    `{"file", "chunks", "parse_time_ms", "load_errors", "embed_errors",
+    "files_done", "files_total"}`, where the error lists are that file's alone.
+    It is always called from the caller's thread, so it may update Streamlit widgets.
+
+    New stores are grown on a flat index and moved to the index `index_spec`
+    picks for their final size at the end. `domain` selects the chunking
+    profile. Returns `(vectorstore, load_errors, embed_errors)`.
+    """
+    uploaded_files = list(uploaded_files)
+    chunks: "queue.Queue" = queue.Queue(maxsize=max(1, queue_chunks))
+    load_errors: List[str] = []
+    embed_errors: List[str] = []
+    stop = threading.Event()
+    producer = threading.Thread(
+        target=_produce, args=(uploaded_files, chunks, load_errors, stop, domain), name="braindoc-ingest", daemon=True
+    )
+    created = vectorstore is None
+    batch: List = []
+    # Every batch is flushed at a file boundary, so skips since the last one belong to the current file.
+    file_embed_errors: List[str] = []
+    files_done = 0
+
+    def _flush() -> None:
+        nonlocal vectorstore
+        if not batch:
+            return
+        vectorstore, skipped = add_documents(
+            vectorstore,
+            batch,
+            embeddings,
+            max_concurrency=max_concurrency,
+            # The final size is unknown while streaming; see reindex below.
+            index_spec="flat",
+        )
+        embed_errors.extend(skipped)
+        file_embed_errors.extend(skipped)
+        batch.clear()
+
+    producer.start()
+    try:
+        while True:
+            kind, payload = chunks.get()
+            if kind == _END:
+                break
+            if kind == _FILE_DONE:
+                _flush()
+                files_done += 1
+                if on_progress is not None:
+                    on_progress(
+                        dict(
+                            payload,
+                            embed_errors=list(file_embed_errors),
+                            files_done=files_done,
+                            files_total=len(uploaded_files),
+                        )
+                    )
+                file_embed_errors.clear()
+                continue
+            batch.append(payload)
+            if len(batch) >= batch_chunks:
+                _flush()
+        _flush()
+    finally:
+        stop.set()
+        producer.join()
+
+    if created and vectorstore is not None:
+        vectorstore = reindex(vectorstore, index_spec)
+    return vectorstore, load_errors, embed_errors
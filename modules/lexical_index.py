@@ -0,0 +1,191 @@
+import os
+import re
+import threading
+from collections import Counter
+from itertools import filterfalse
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+LEXICAL_INDEX_NAME = "lexical.npz"
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Longer "terms" are almost always encoded blobs, not something anyone searches for.
+MAX_TERM_CHARS = 40
+
+# Keeps clause numbers (4.2), lab names (hba1c) and codes (10-k) as single terms.
+_TERM_RE = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+_PART_RE = re.compile(r"[.\-/]")
+
+
+def lexical_terms(text: str) -> List[str]:
+    """Lowercased search terms; compound terms also contribute their parts (appended at the end)."""
+    text = (text or "").lower()
+    terms = _TERM_RE.findall(text)
+    # Tokenizing dominates index builds, so keep the common paths in C-level builtins.
+    if terms and max(map(len, terms)) > MAX_TERM_CHARS:
+        terms = [term for term in terms if len(term) <= MAX_TERM_CHARS]
+    if "." in text or "-" in text or "/" in text:
+        for compound in list(filterfalse(str.isalnum, terms)):
+            terms.extend(part for part in _PART_RE.split(compound) if part)
+    return terms
+
+
+class BM25Index:
+    """Okapi BM25 over docstore ids, kept as flat NumPy arrays.
+
+    Per-document term counts are stored contiguously so adds append and
+    removals compact with a mask, without re-tokenizing anything. Term-major
+    postings with precomputed BM25 weights are rebuilt lazily after a change,
+    so a query is a handful of array slices and one `bincount`.
+    """
+
+    def __init__(self):
+        self.vocab: Dict[str, int] = {}
+        self.doc_ids: List[str] = []
+        self._doc_lengths = np.zeros(0, dtype=np.int32)
+        self._doc_offsets = np.zeros(1, dtype=np.int64)
+        self._entry_terms = np.zeros(0, dtype=np.int32)
+        self._entry_counts = np.zeros(0, dtype=np.int32)
+        self._postings: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    @classmethod
+    def from_texts(cls, doc_ids: List[str], texts: Iterable[str]) -> "BM25Index":
+        index = cls()
+        index.add(doc_ids, texts)
+        return index
+
+    def copy(self) -> "BM25Index":
+        clone = BM25Index()
+        clone.vocab = dict(self.vocab)
+        clone.doc_ids = list(self.doc_ids)
+        clone._doc_lengths = self._doc_lengths.copy()
+        clone._doc_offsets = self._doc_offsets.copy()
+        clone._entry_terms = self._entry_terms.copy()
+        clone._entry_counts = self._entry_counts.copy()
+        clone._postings = self._postings
+        return clone
+
+    def add(self, doc_ids: List[str], texts: Iterable[str]) -> None:
+        # Tokenizing is the slow part and needs no shared state; term ids are assigned under the lock.
+        counters = [Counter(lexical_terms(text)) for text in texts]
+        if not counters:
+            return
+
+        with self._lock:
+            terms = [
+                np.asarray([self.vocab.setdefault(term, len(self.vocab)) for term in counter], dtype=np.int32)
+                for counter in counters
+            ]
+            counts = [np.fromiter(counter.values(), dtype=np.int32, count=len(counter)) for counter in counters]
+            lengths = [sum(counter.values()) for counter in counters]
+            sizes = np.fromiter((len(ids) for ids in terms), dtype=np.int64, count=len(terms))
+            self._doc_offsets = np.concatenate([self._doc_offsets, self._doc_offsets[-1] + np.cumsum(sizes)])
+            self._entry_terms = np.concatenate([self._entry_terms, *terms])
+            self._entry_counts = np.concatenate([self._entry_counts, *counts])
+            self._doc_lengths = np.concatenate([self._doc_lengths, np.asarray(lengths, dtype=np.int32)])
+            self.doc_ids.extend(doc_ids)
+            self._postings = None
+
+    def remove(self, doc_ids: Iterable[str]) -> int:
+        drop = set(doc_ids)
+        keep = np.fromiter((doc_id not in drop for doc_id in self.doc_ids), dtype=bool, count=len(self.doc_ids))
+        removed = int((~keep).sum())
+        if not removed:
+            return 0
+
+        with self._lock:
+            sizes = np.diff(self._doc_offsets)
+            entry_keep = np.repeat(keep, sizes)
+            self._entry_terms = self._entry_terms[entry_keep]
+            self._entry_counts = self._entry_counts[entry_keep]
+            self._doc_offsets = np.concatenate([[0], np.cumsum(sizes[keep])]).astype(np.int64)
+            self._doc_lengths = self._doc_lengths[keep]
+            self.doc_ids = [doc_id for doc_id, kept in zip(self.doc_ids, keep) if kept]
+            self._postings = None
+        return removed
+
+    def _build_postings(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        n_docs = len(self.doc_ids)
+        rows = np.repeat(np.arange(n_docs, dtype=np.int32), np.diff(self._doc_offsets))
+        df = np.bincount(self._entry_terms, minlength=len(self.vocab))
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        lengths = self._doc_lengths.astype(np.float32)
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / max(float(lengths.mean()) if n_docs else 1.0, 1e-9))
+        tf = self._entry_counts.astype(np.float32)
+        weights = idf[self._entry_terms] * tf * (BM25_K1 + 1) / (tf + norm[rows])
+
+        order = np.argsort(self._entry_terms, kind="stable")
+        indptr = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(df, out=indptr[1:])
+        return indptr, rows[order], weights[order]
+
+    def _get_postings(self):
+        with self._lock:
+            if self._postings is None:
+                self._postings = self._build_postings()
+            return self._postings
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Top `k` `(doc_id, score)` pairs for `query`, best first."""
+        term_ids = {self.vocab[term] for term in lexical_terms(query) if term in self.vocab}
+        if not term_ids or not self.doc_ids:
+            return []
+        indptr, rows, weights = self._get_postings()
+        slices = [slice(indptr[term], indptr[term + 1]) for term in term_ids]
+        hit_rows = np.concatenate([rows[part] for part in slices])
+        if not hit_rows.size:
+            return []
+        scores = np.bincount(hit_rows, weights=np.concatenate([weights[part] for part in slices]), minlength=len(self.doc_ids))
+
+        k = min(k, int((scores > 0).sum()))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.doc_ids[row], float(scores[row])) for row in top]
+
+    def save(self, directory: str) -> None:
+        terms = sorted(self.vocab, key=self.vocab.get)
+        np.savez(
+            os.path.join(directory, LEXICAL_INDEX_NAME),
+            vocab=np.asarray(terms, dtype=str),
+            doc_ids=np.asarray(self.doc_ids, dtype=str),
+            doc_lengths=self._doc_lengths,
+            doc_offsets=self._doc_offsets,
+            entry_terms=self._entry_terms,
+            entry_counts=self._entry_counts,
+        )
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["BM25Index"]:
+        path = os.path.join(directory, LEXICAL_INDEX_NAME)
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            index = cls()
+            index.vocab = {str(term): idx for idx, term in enumerate(data["vocab"])}
+            index.doc_ids = [str(doc_id) for doc_id in data["doc_ids"]]
+            index._doc_lengths = data["doc_lengths"]
+            index._doc_offsets = data["doc_offsets"]
+            index._entry_terms = data["entry_terms"]
+            index._entry_counts = data["entry_counts"]
+        return index
+
+
+def get_lexical_index(vectorstore) -> Optional[BM25Index]:
+    """The BM25 index kept alongside a FAISS store, built from its docstore on first use if missing."""
+    if vectorstore is None:
+        return None
+    index = getattr(vectorstore, "lexical_index", None)
+    if index is None:
+        doc_ids = [doc_id for _, doc_id in sorted(vectorstore.index_to_docstore_id.items())]
+        texts = [vectorstore.docstore.search(doc_id).page_content for doc_id in doc_ids]
+        index = BM25Index.from_texts(doc_ids, texts)
+        vectorstore.lexical_index = index
+    return index
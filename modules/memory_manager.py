@@ -1,9 +1,22 @@
 import os
 import pickle
-from typing import List, Tuple
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
 
+# Legacy whole-file pickle; imported into the store once, then renamed.
 HISTORY_PATH = "chat_history.pkl"
+HISTORY_DB_PATH = os.path.join(".braindoc_cache", "history.sqlite3")
+DEFAULT_SESSION = "default"
+# Recent turns loaded into a session at startup; older turns stay on disk and are paged in.
 MAX_HISTORY_ITEMS = 200
+HISTORY_PAGE_SIZE = 20
+# How long a writer waits for another process's transaction before giving up.
+HISTORY_BUSY_TIMEOUT_SECONDS = 5.0
+
+_SEARCH_TERM_RE = re.compile(r"\w+")
 
 
 def _normalize_history(raw_history) -> List[Tuple[str, str]]:
@@ -20,18 +33,176 @@ def _normalize_history(raw_history) -> List[Tuple[str, str]]:
     return normalized
 
 
-def load_chat_history() -> List[Tuple[str, str]]:
-    if os.path.exists(HISTORY_PATH):
+class HistoryStore:
+    """Append-only SQLite log of question/answer turns, partitioned by session.
+
+    Appending a turn is one INSERT regardless of history length. WAL mode lets
+    readers run alongside a writer, and the busy timeout makes writers from
+    other processes queue instead of failing. Reads page backwards by turn id.
+    """
+
+    def __init__(self, path: str = HISTORY_DB_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=HISTORY_BUSY_TIMEOUT_SECONDS, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " session TEXT NOT NULL,"
+            " question TEXT NOT NULL,"
+            " answer TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS turns_session_id ON turns (session, id)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS migrations (name TEXT PRIMARY KEY, applied_at REAL NOT NULL)")
+        self.full_text = self._create_search_index()
+        self._conn.commit()
+
+    def _create_search_index(self) -> bool:
+        """FTS5 index over questions, kept in sync by a trigger; False where SQLite lacks FTS5."""
+        exists = self._conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'turns_fts'").fetchone()
         try:
-            with open(HISTORY_PATH, "rb") as f:
-                return _normalize_history(pickle.load(f))[-MAX_HISTORY_ITEMS:]
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5(question, content='turns', content_rowid='id')"
+            )
+        except sqlite3.OperationalError:
+            return False
+        self._conn.execute(
+            "CREATE TRIGGER IF NOT EXISTS turns_fts_insert AFTER INSERT ON turns BEGIN"
+            " INSERT INTO turns_fts (rowid, question) VALUES (new.id, new.question); END"
+        )
+        if not exists:
+            # Index turns written before search existed.
+            self._conn.execute("INSERT INTO turns_fts (turns_fts) VALUES ('rebuild')")
+        return True
+
+    def append(self, question: str, answer: str, session: str = DEFAULT_SESSION) -> int:
+        """Store one turn and return its id."""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO turns (session, question, answer, created_at) VALUES (?, ?, ?, ?)",
+                (session, question, answer, time.time()),
+            )
+        return cursor.lastrowid
+
+    def page(
+        self,
+        session: str = DEFAULT_SESSION,
+        limit: int = HISTORY_PAGE_SIZE,
+        before_id: Optional[int] = None,
+        query: Optional[str] = None,
+        answers: bool = True,
+    ) -> List[Dict]:
+        """Up to `limit` turns of `session`, newest first, older than `before_id` when given.
+
+        Pass the last returned `id` as `before_id` to fetch the next page.
+        `query` keeps turns whose question contains every word (as a prefix);
+        `answers=False` leaves answers on disk for callers that show them lazily.
+        """
+        columns = "t.id, t.question, t.created_at" + (", t.answer" if answers else "")
+        sql = f"SELECT {columns} FROM turns t"
+        where = ["t.session = ?"]
+        params: list = [session]
+        terms = _SEARCH_TERM_RE.findall(query or "")
+        if terms and self.full_text:
+            sql += " JOIN turns_fts ON turns_fts.rowid = t.id"
+            where.append("turns_fts MATCH ?")
+            params.append(" ".join(f'"{term}"*' for term in terms))
+        elif terms:
+            for term in terms:
+                where.append("t.question LIKE ?")
+                params.append(f"%{term}%")
+        if before_id is not None:
+            where.append("t.id < ?")
+            params.append(before_id)
+        sql += " WHERE " + " AND ".join(where) + " ORDER BY t.id DESC LIMIT ?"
+        params.append(int(limit))
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        keys = ("id", "question", "created_at", "answer")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def get_turn(self, turn_id: int) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, session, question, answer, created_at FROM turns WHERE id = ?", (turn_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("id", "session", "question", "answer", "created_at"), row))
+
+    def recent(self, session: str = DEFAULT_SESSION, limit: int = MAX_HISTORY_ITEMS) -> List[Tuple[str, str]]:
+        """The last `limit` turns as `(question, answer)` tuples, oldest first."""
+        return [(turn["question"], turn["answer"]) for turn in reversed(self.page(session, limit))]
+
+    def count(self, session: str = DEFAULT_SESSION) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM turns WHERE session = ?", (session,)).fetchone()[0]
+
+    def sessions(self) -> List[str]:
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT session FROM turns ORDER BY session")]
+
+    def import_pickle(self, path: str = HISTORY_PATH, session: str = DEFAULT_SESSION) -> int:
+        """Copy a legacy pickle history into `session` once, then rename the file.
+
+        The migration is recorded in the same transaction as the rows, so a
+        crash or a concurrent process can never import the file twice.
+        Returns the number of turns imported.
+        """
+        if not os.path.exists(path):
+            return 0
+        try:
+            with open(path, "rb") as f:
+                turns = _normalize_history(pickle.load(f))
         except Exception:
             # Corrupted history should not break app startup.
-            return []
-    return []
+            turns = []
+
+        name = f"pickle:{os.path.abspath(path)}"
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute("INSERT OR IGNORE INTO migrations VALUES (?, ?)", (name, now))
+            if cursor.rowcount:
+                self._conn.executemany(
+                    "INSERT INTO turns (session, question, answer, created_at) VALUES (?, ?, ?, ?)",
+                    [(session, question, answer, now) for question, answer in turns],
+                )
+            imported = len(turns) if cursor.rowcount else 0
+        try:
+            os.replace(path, f"{path}.migrated")
+        except OSError:
+            pass
+        return imported
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_history_stores: Dict[str, HistoryStore] = {}
+_history_stores_lock = threading.Lock()
+
+
+def get_history_store(path: Optional[str] = None) -> HistoryStore:
+    """Process-wide store per database path; the legacy pickle is migrated on first use."""
+    path = path or HISTORY_DB_PATH
+    with _history_stores_lock:
+        store = _history_stores.get(path)
+        if store is None:
+            store = _history_stores[path] = HistoryStore(path)
+            store.import_pickle(HISTORY_PATH)
+        return store
+
+
+def load_chat_history(session: str = DEFAULT_SESSION) -> List[Tuple[str, str]]:
+    """The most recent MAX_HISTORY_ITEMS turns of `session`, oldest first."""
+    return get_history_store().recent(session, MAX_HISTORY_ITEMS)
 
 
-def save_chat_history(history) -> None:
-    trimmed_history = history[-MAX_HISTORY_ITEMS:]
-    with open(HISTORY_PATH, "wb") as f:
-        pickle.dump(trimmed_history, f)
+def append_chat_turn(question: str, answer: str, session: str = DEFAULT_SESSION) -> int:
+    return get_history_store().append(question, answer, session)
@@ -0,0 +1,266 @@
+import json
+import logging
+import os
+import threading
+import math
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+# BRAINDOC_METRICS (on unless "off"), BRAINDOC_METRICS_FILE and BRAINDOC_METRICS_PORT are
+# read at call time so values loaded from .env after import still apply.
+_DISABLED_VALUES = ("0", "off", "false", "no")
+METRICS_PREFIX = "braindoc"
+# Recent durations kept per stage for percentiles; old samples age out as upstream latency drifts.
+LATENCY_WINDOW_SIZE = 512
+LATENCY_QUANTILES = (0.5, 0.95, 0.99)
+
+# Estimated USD per 1M tokens as (input, output); unknown models cost 0.
+MODEL_PRICES_PER_MILLION = {
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "text-embedding-ada-002": (0.10, 0.0),
+    "text-embedding-3-small": (0.02, 0.0),
+    "text-embedding-3-large": (0.13, 0.0),
+}
+
+logger = logging.getLogger("braindoc.metrics")
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def estimate_cost(model: Optional[str], input_tokens: int, output_tokens: int = 0) -> float:
+    input_price, output_price = MODEL_PRICES_PER_MILLION.get(model or "", (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+class LatencyWindow:
+    """Sliding window of the last `size` durations with nearest-rank percentiles."""
+
+    def __init__(self, size: int = LATENCY_WINDOW_SIZE):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, quantile: float) -> Optional[float]:
+        """Seconds at `quantile` (0-1) of the window, or None while it is empty."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples), max(1, math.ceil(quantile * len(samples)))) - 1]
+
+
+class MetricsRegistry:
+    """Thread-safe totals: per-stage call counts, wall time and recent percentiles, plus named counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, list] = {}
+        self._windows: Dict[str, LatencyWindow] = {}
+        self._counters: Dict[str, float] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            entry = self._stages.setdefault(stage, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            window = self._windows.get(stage)
+            if window is None:
+                window = self._windows[stage] = LatencyWindow()
+            window.add(seconds)
+
+    def percentile(self, stage: str, quantile: float) -> Optional[float]:
+        """Recent `stage` duration in seconds at `quantile`, or None before any call."""
+        window = self._windows.get(stage)
+        return window.percentile(quantile) if window is not None else None
+
+    def add(self, name: str, value: float) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def snapshot(self) -> Dict:
+        """`{"stages": {stage: {"count", "total_ms", "max_ms", "p50_ms", "p95_ms", "p99_ms"}}, "counters": {...}}`.
+
+        Percentiles cover the last LATENCY_WINDOW_SIZE calls of each stage.
+        """
+        with self._lock:
+            stages = {
+                stage: {"count": count, "total_ms": total * 1000, "max_ms": longest * 1000}
+                for stage, (count, total, longest) in self._stages.items()
+            }
+            windows = dict(self._windows)
+            counters = dict(self._counters)
+        for stage, entry in stages.items():
+            for quantile in LATENCY_QUANTILES:
+                entry[f"p{quantile * 100:g}_ms"] = windows[stage].percentile(quantile) * 1000
+        return {"stages": stages, "counters": counters}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages.clear()
+            self._windows.clear()
+            self._counters.clear()
+
+    def to_prometheus(self, prefix: str = METRICS_PREFIX) -> str:
+        snapshot = self.snapshot()
+        stages = sorted(snapshot["stages"].items())
+        lines = []
+        for family, kind, field, scale in (
+            ("stage_calls_total", "counter", "count", 1),
+            ("stage_seconds_total", "counter", "total_ms", 1000),
+            ("stage_seconds_max", "gauge", "max_ms", 1000),
+        ):
+            lines.append(f"# TYPE {prefix}_{family} {kind}")
+            lines.extend(
+                f'{prefix}_{family}{{stage="{stage}"}} {_format_value(entry[field] / scale)}' for stage, entry in stages
+            )
+        lines.append(f"# TYPE {prefix}_stage_seconds gauge")
+        lines.extend(
+            f'{prefix}_stage_seconds{{stage="{stage}",quantile="{quantile:g}"}} '
+            f'{_format_value(entry[f"p{quantile * 100:g}_ms"] / 1000)}'
+            for stage, entry in stages
+            for quantile in LATENCY_QUANTILES
+        )
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class _Span:
+    __slots__ = ("stage", "fields", "_started")
+
+    def __init__(self, stage: str, fields: Dict):
+        self.stage = stage
+        self.fields = fields
+
+    def set(self, **fields) -> None:
+        """Attach values (counts, sizes) to the structured log line for this span."""
+        self.fields.update(fields)
+
+    def __enter__(self) -> "_Span":
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        observe(self.stage, time.perf_counter() - self._started, error=exc_type.__name__ if exc_type else None, **self.fields)
+
+
+class _DisabledSpan:
+    __slots__ = ()
+
+    def set(self, **fields) -> None:
+        pass
+
+    def __enter__(self) -> "_DisabledSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_DISABLED_SPAN = _DisabledSpan()
+
+
+def metrics_enabled() -> bool:
+    """Lets callers skip work (such as token counting) that only feeds metrics."""
+    return os.environ.get("BRAINDOC_METRICS", "on").lower() not in _DISABLED_VALUES
+
+
+def span(stage: str, **fields):
+    """Time a block as `stage`: `with span("embed", chunks=n) as s: ...; s.set(tokens=t)`.
+
+    When metrics are disabled this returns a shared no-op object, so the cost
+    is an environment lookup and no timing, locking or logging.
+    """
+    if not metrics_enabled():
+        return _DISABLED_SPAN
+    return _Span(stage, fields)
+
+
+def observe(stage: str, seconds: float, **fields) -> None:
+    """Record a duration measured elsewhere (e.g. in a worker process) and log it."""
+    if not metrics_enabled():
+        return
+    REGISTRY.observe(stage, seconds)
+    if logger.isEnabledFor(logging.INFO):
+        record = {"event": "stage", "stage": stage, "ms": round(seconds * 1000, 3)}
+        record.update((key, value) for key, value in fields.items() if value is not None)
+        logger.info(json.dumps(record, default=str))
+
+
+def count(name: str, value: float = 1) -> None:
+    if value and metrics_enabled():
+        REGISTRY.add(name, value)
+
+
+def record_embedding_usage(model: Optional[str], tokens: int) -> None:
+    count("embedding_tokens", tokens)
+    count("cost_usd", estimate_cost(model, tokens))
+
+
+def record_llm_usage(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> None:
+    count("llm_calls")
+    count("prompt_tokens", prompt_tokens)
+    count("completion_tokens", completion_tokens)
+    count("cost_usd", estimate_cost(model, prompt_tokens, completion_tokens))
+
+
+def export_metrics(path: Optional[str] = None) -> Optional[str]:
+    """Write the Prometheus text format to `path` (default BRAINDOC_METRICS_FILE) atomically."""
+    path = path or os.getenv("BRAINDOC_METRICS_FILE")
+    if not path or not metrics_enabled():
+        return None
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as handle:
+        handle.write(REGISTRY.to_prometheus())
+    os.replace(tmp_path, path)
+    return path
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = REGISTRY.to_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_metrics_server: Optional[ThreadingHTTPServer] = None
+_metrics_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: Optional[int] = None, host: str = "127.0.0.1") -> Optional[ThreadingHTTPServer]:
+    """Serve the registry for Prometheus scrapes on a daemon thread, once per process."""
+    global _metrics_server
+    port = int(os.getenv("BRAINDOC_METRICS_PORT") or 0) if port is None else port
+    if not port or not metrics_enabled():
+        return None
+    with _metrics_server_lock:
+        if _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_metrics_server.serve_forever, daemon=True).start()
+        return _metrics_server
@@ -1,6 +1,239 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
 from langchain_openai import ChatOpenAI
+from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
+from modules.chunker import chunk_sizes
+from modules.context_packer import pack_context
 from modules.domain_prompts import get_domain_prompt
+from modules.metrics import LatencyWindow, count, metrics_enabled, observe, record_llm_usage, span
+from modules.rate_limiter import backoff_delay, is_transient_error
+from modules.reranker import RERANK_CANDIDATES_PER_RESULT, diversify
+from modules.resources import (
+    get_async_http_client,
+    get_event_loop,
+    get_http_client,
+    on_shared_loop,
+    run_on_shared_loop,
+    shared_client,
+)
+from modules.tokenizer import count_tokens, normalize_text
+
+ANSWER_CACHE_PATH = os.path.join(".braindoc_cache", "answers.sqlite3")
+ANSWER_CACHE_TTL_SECONDS = 24 * 60 * 60
+ANSWER_CACHE_MAX_ENTRIES = 2000
+# Cosine similarity above which a differently worded question reuses an answer; None (the
+# default) disables it. Questions that differ in one word ("terminated by the tenant" vs
+# "by the landlord") embed well above 0.95, so only enable it for corpora where that is safe.
+ANSWER_SIMILARITY_THRESHOLD: Optional[float] = None
+LLM_BACKOFF_BASE_SECONDS = 0.5
+LLM_BACKOFF_MAX_SECONDS = 8.0
+# Hedging races a duplicate request against one that has outlived the recent p95 and
+# keeps whichever answers first, trading roughly 5% more calls for a shorter tail.
+LLM_HEDGE_QUANTILE = 0.95
+# Until a model has this many timed calls, hedges fire after the fixed delay instead.
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_HEDGE_DEFAULT_DELAY_SECONDS = 4.0
+
+_llm_latencies: Dict[str, LatencyWindow] = {}
+_llm_latencies_lock = threading.Lock()
+
+
+def normalize_question(question: str) -> str:
+    """Case, spacing and trailing punctuation do not change what is being asked."""
+    return normalize_text(question).lower().rstrip("?!. ")
+
+
+def _source_records(docs) -> str:
+    return json.dumps(
+        [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs],
+        default=str,
+    )
+
+
+class AnswerCache:
+    """SQLite store of answers keyed by (corpus fingerprint, domain, normalized question).
+
+    Entries expire after `ttl_seconds`; beyond `max_entries` the least recently
+    used are dropped. With a `similarity_threshold`, stored question vectors also
+    allow near-duplicate lookups within the same corpus and scope.
+    """
+
+    def __init__(
+        self,
+        path: str = ANSWER_CACHE_PATH,
+        ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        similarity_threshold: Optional[float] = ANSWER_SIMILARITY_THRESHOLD,
+    ):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " corpus TEXT NOT NULL,"
+            " domain TEXT NOT NULL,"
+            " question_key TEXT NOT NULL,"
+            " question TEXT NOT NULL,"
+            " vector BLOB,"
+            " answer TEXT NOT NULL,"
+            " sources TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (corpus, domain, question_key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+        self._conn.commit()
+        self.stats = {"hits": 0, "similar_hits": 0, "misses": 0}
+
+    @staticmethod
+    def _key(question: str) -> str:
+        return hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
+
+    def get(self, corpus: str, domain: str, question: str, vector=None) -> Optional[Dict]:
+        """Return `{"answer", "sources"}` for an exact or near-duplicate question, or None.
+
+        `vector` may be a callable so the question is only embedded after an exact miss;
+        it is called without holding the lock, since every session shares this cache.
+        """
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT question_key, answer, sources FROM answers"
+                " WHERE corpus = ? AND domain = ? AND question_key = ? AND created_at >= ?",
+                (corpus, domain, self._key(question), cutoff),
+            ).fetchone()
+        stat = "hits"
+        if row is None and self.similarity_threshold is not None:
+            if callable(vector):
+                vector = vector()
+            if vector is not None:
+                with self._lock:
+                    row = self._most_similar(corpus, domain, np.asarray(vector, dtype=np.float32), cutoff)
+                stat = "similar_hits"
+
+        with self._lock:
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            key, answer, sources = row
+            self._conn.execute(
+                "UPDATE answers SET last_used = ? WHERE corpus = ? AND domain = ? AND question_key = ?",
+                (time.time(), corpus, domain, key),
+            )
+            self._conn.commit()
+            self.stats[stat] += 1
+        return {"answer": answer, "sources": [Document(**record) for record in json.loads(sources)]}
+
+    def _most_similar(self, corpus: str, domain: str, vector: np.ndarray, cutoff: float):
+        rows = self._conn.execute(
+            "SELECT question_key, answer, sources, vector FROM answers"
+            " WHERE corpus = ? AND domain = ? AND created_at >= ? AND vector IS NOT NULL",
+            (corpus, domain, cutoff),
+        ).fetchall()
+        rows = [row for row in rows if len(row[3]) == vector.nbytes]
+        if not rows:
+            return None
+        matrix = np.frombuffer(b"".join(row[3] for row in rows), dtype=np.float32).reshape(len(rows), -1)
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(vector) or 1.0)
+        scores = (matrix @ vector) / np.where(norms > 0, norms, 1.0)
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity_threshold:
+            return None
+        return rows[best][:3]
+
+    def put(self, corpus: str, domain: str, question: str, answer: str, sources, vector=None) -> None:
+        now = time.time()
+        blob = np.asarray(vector, dtype=np.float32).tobytes() if vector is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (corpus, domain, self._key(question), question, blob, answer, _source_records(sources), now, now),
+            )
+            self._conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl_seconds,))
+            self._conn.execute(
+                "DELETE FROM answers WHERE rowid IN"
+                " (SELECT rowid FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_shared_answer_cache: Optional[AnswerCache] = None
+_shared_answer_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> AnswerCache:
+    """Process-wide cache so every session shares one connection and one set of counters."""
+    global _shared_answer_cache
+    with _shared_answer_cache_lock:
+        if _shared_answer_cache is None:
+            _shared_answer_cache = AnswerCache()
+        return _shared_answer_cache
+
+
+def get_chat_model(openai_api_key, temperature: float = 0.3):
+    """Chat client shared by every session with the same key, over the pooled HTTP connections.
+
+    Lower temperature improves factual consistency for document QA.
+    """
+    return shared_client(
+        ("chat", temperature),
+        openai_api_key,
+        lambda: ChatOpenAI(
+            temperature=temperature,
+            openai_api_key=openai_api_key,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client(),
+        ),
+    )
+
+
+def llm_call_policy() -> Tuple[float, int, bool]:
+    """`(timeout, retries, hedge)` for model calls, from the environment at call time so `.env` applies.
+
+    BRAINDOC_LLM_TIMEOUT (30s) is the deadline that turns a hung upstream into a retry
+    instead of a stalled user; BRAINDOC_LLM_RETRIES (2) bounds the retries and
+    BRAINDOC_LLM_HEDGE (off) enables hedged requests.
+    """
+    return (
+        float(os.getenv("BRAINDOC_LLM_TIMEOUT", "30")),
+        int(os.getenv("BRAINDOC_LLM_RETRIES", "2")),
+        os.getenv("BRAINDOC_LLM_HEDGE", "off").lower() in ("1", "on", "true", "yes"),
+    )
+
+
+def llm_latency(model: Optional[str]) -> LatencyWindow:
+    """Durations of recent first attempts at calling `model` (cancelled ones as lower bounds); they set the hedging delay."""
+    with _llm_latencies_lock:
+        return _llm_latencies.setdefault(model or "", LatencyWindow())
+
+
+def hedge_delay(model: Optional[str]) -> float:
+    """Seconds to wait on a call before hedging it: the model's recent p95, once known."""
+    window = llm_latency(model)
+    if len(window) < LLM_HEDGE_MIN_SAMPLES:
+        return LLM_HEDGE_DEFAULT_DELAY_SECONDS
+    return window.percentile(LLM_HEDGE_QUANTILE)
 
 
 class SimpleQAChain:
@@ -9,69 +242,382 @@ class SimpleQAChain:
         retriever,
         openai_api_key,
         domain,
-        max_source_docs: int = 4,
-        max_context_chars_per_doc: int = 1800,
+        max_source_docs: int = 8,
+        context_token_budget: Optional[int] = None,
+        corpus_id: Optional[str] = None,
+        answer_cache: Optional[AnswerCache] = None,
+        llm=None,
+        sources: Optional[Iterable[str]] = None,
+        rerank: bool = True,
     ):
+        """Up to `max_source_docs` chunks are chosen from the retrieved candidates; as
+        many as fit `context_token_budget` (default: room for all of them at the
+        configured chunk size) are packed into the prompt and returned as sources.
+        With `rerank`, candidates are over-fetched and narrowed by MMR on their stored
+        vectors, so near-identical chunks do not crowd out other evidence.
+        `llm` replaces the default ChatOpenAI model (e.g. an offline stub).
+        `sources` restricts every question to those files unless a call passes its own.
+        """
         prompts = get_domain_prompt(domain)
         # Use a single system instruction for more consistent model behavior.
         system_prompt = f"{prompts['prefix']}\n\n{prompts['suffix']}"
 
-        self.retriever = retriever
+        # Hybrid retrievers weight lexical vs dense matches per domain.
+        self.retriever = retriever.for_domain(domain) if hasattr(retriever, "for_domain") else retriever
+        self.domain = domain
+        # Answers are only cached when the corpus they were drawn from is identified.
+        self.corpus_id = corpus_id
+        self.answer_cache = answer_cache if corpus_id else None
         self.max_source_docs = max(1, int(max_source_docs))
-        self.max_context_chars_per_doc = max(200, int(max_context_chars_per_doc))
+        self.rerank = rerank and hasattr(self.retriever, "stored_vectors")
+        # Chunks retrieved per question; `_select_sources` narrows them to `max_source_docs`.
+        self.candidate_docs = self.max_source_docs * RERANK_CANDIDATES_PER_RESULT if self.rerank else self.max_source_docs
+        if context_token_budget is None:
+            context_token_budget = self.max_source_docs * chunk_sizes()[0]
+        self.context_token_budget = max(1, int(context_token_budget))
         self.prompt = ChatPromptTemplate.from_messages([
             ("system", system_prompt),
             ("human", "Context:\n{context}\n\nQuestion: {question}"),
         ])
-        # Lower temperature improves factual consistency for document QA.
-        self.llm = ChatOpenAI(temperature=0.3, openai_api_key=openai_api_key)
+        self.llm = llm if llm is not None else get_chat_model(openai_api_key)
+        self.sources = frozenset(sources) if sources else None
+
+    def _sources(self, sources) -> Optional[frozenset]:
+        return frozenset(sources) if sources else self.sources
+
+    def _retrieve(self, question: str, sources: Optional[frozenset] = None, vector=None):
+        """`(docs, relevance)`: candidates best first, with the retriever's scores when it reports them.
 
-    def _retrieve(self, question: str):
+        `vector`, the question's embedding when the answer cache already made it, saves embedding it again.
+        """
+        if hasattr(self.retriever, "search_with_scores"):
+            scored = self.retriever.search_with_scores(question, k=self.candidate_docs, sources=sources, vector=vector)
+            return [doc for doc, _ in scored], [score for _, score in scored]
+        if hasattr(self.retriever, "search_kwargs"):
+            # Fetch enough candidates for the context packer to choose from.
+            if sources:
+                return self.retriever.invoke(question, k=self.candidate_docs, sources=sources), None
+            return self.retriever.invoke(question, k=self.candidate_docs), None
         if hasattr(self.retriever, "get_relevant_documents"):
-            return self.retriever.get_relevant_documents(question)
-        if hasattr(self.retriever, "invoke"):
-            return self.retriever.invoke(question)
-        return []
-
-    def _build_context(self, docs) -> str:
-        if not docs:
-            return "No relevant context found."
-
-        chunks = []
-        for doc in docs:
-            content = getattr(doc, "page_content", "") or ""
-            chunks.append(content[: self.max_context_chars_per_doc])
-        return "\n\n".join(chunks)
-
-    def _select_sources(self, docs):
-        return docs[: self.max_source_docs]
-
-    def run(self, question: str) -> dict:
-        docs = self._retrieve(question)
+            docs = self.retriever.get_relevant_documents(question)
+        elif hasattr(self.retriever, "invoke"):
+            docs = self.retriever.invoke(question)
+        else:
+            return [], None
+        if sources:
+            docs = [doc for doc in docs if getattr(doc, "metadata", {}).get("source") in sources]
+        return docs, None
+
+    def _build_context(self, docs):
+        """Return `(context, used_docs)` packed into the token budget."""
+        context, used_docs = pack_context(docs, self.context_token_budget)
+        if not context:
+            return "No relevant context found.", []
+        return context, used_docs
+
+    def _select_sources(self, docs, relevance=None):
+        """The best `max_source_docs` of `docs`, diversified when the index can supply their vectors."""
+        if not self.rerank or len(docs) <= 1:
+            return docs[: self.max_source_docs]
+        with span("rerank") as stage:
+            vectors = self.retriever.stored_vectors(docs)
+            if vectors is None:
+                # Documents from elsewhere (or an index without them) keep the retrieval order.
+                return docs[: self.max_source_docs]
+            selected = diversify(docs, vectors, self.max_source_docs, relevance)
+            stage.set(candidates=len(docs), selected=len(selected))
+        return selected
+
+    def _prepare(self, question: str, docs=None, sources: Optional[frozenset] = None, vector=None):
+        relevance = None
+        if docs is None:
+            with span("retrieve") as stage:
+                docs, relevance = self._retrieve(question, sources, vector)
+                stage.set(docs=len(docs) if isinstance(docs, list) else None)
         if docs is None:
             docs = []
         elif hasattr(docs, "page_content"):
             docs = [docs]
 
-        selected_docs = self._select_sources(docs)
-        context = self._build_context(selected_docs)
-        messages = self.prompt.format_messages(context=context, question=question)
-        response = self.llm.invoke(messages)
+        with span("prompt") as stage:
+            context, selected_docs = self._build_context(self._select_sources(list(docs), relevance))
+            messages = self.prompt.format_messages(context=context, question=question)
+            stage.set(candidates=len(docs), packed=len(selected_docs))
+        return selected_docs, messages
+
+    def _model_name(self) -> Optional[str]:
+        return getattr(self.llm, "model_name", None) or getattr(self.llm, "model", None)
+
+    def _record_usage(self, messages, answer: str, usage=None) -> None:
+        """Count prompt/completion tokens, from the provider's usage report when there is one."""
+        if not metrics_enabled():
+            return
+        usage = usage or {}
+        prompt_tokens = usage.get("input_tokens") or sum(count_tokens(str(message.content)) for message in messages)
+        completion_tokens = usage.get("output_tokens") or count_tokens(answer)
+        record_llm_usage(self._model_name(), prompt_tokens, completion_tokens)
+
+    def _question_vector(self, question: str):
+        """The question embedded as retrieval would embed it, so a cache miss can reuse it."""
+        if self.answer_cache is None or self.answer_cache.similarity_threshold is None:
+            return None
+        embeddings = getattr(self.retriever, "embedding_function", None) or getattr(
+            getattr(self.retriever, "vectorstore", None), "embedding_function", None
+        )
+        if embeddings is None:
+            return None
+        try:
+            return embeddings.embed_query(question)
+        except Exception:
+            # A failed lookup embedding only costs the near-duplicate match.
+            return None
+
+    def _cache_scope(self, sources: Optional[frozenset]) -> str:
+        """Answers restricted to some files are cached apart from whole-corpus answers."""
+        if not sources:
+            return self.domain
+        digest = hashlib.sha256("\n".join(sorted(sources)).encode("utf-8")).hexdigest()[:16]
+        return f"{self.domain}|sources:{digest}"
+
+    def _cached(self, question: str, sources: Optional[frozenset] = None):
+        """Return `(cached_result, question_vector)`; the vector is reused when storing a miss."""
+        if self.answer_cache is None:
+            return None, None
+        vectors = []
+
+        def _vector():
+            vectors.append(self._question_vector(question))
+            return vectors[0]
+
+        with span("answer_cache") as stage:
+            hit = self.answer_cache.get(self.corpus_id, self._cache_scope(sources), question, _vector)
+            stage.set(hit=hit is not None)
+        return hit, vectors[0] if vectors else None
+
+    def _remember(self, question: str, answer: str, docs, vector, sources: Optional[frozenset] = None) -> None:
+        if self.answer_cache is not None:
+            self.answer_cache.put(self.corpus_id, self._cache_scope(sources), question, answer, docs, vector)
+
+    async def _timed_call(self, messages, window: Optional[LatencyWindow] = None):
+        """One model call, timed into `window` whether it answers or is cancelled (by a
+        winning hedge or the deadline); a cancelled call's elapsed time is a lower bound
+        on its latency, and leaving it out would pull the hedging p95 down.
+        """
+        started = time.perf_counter()
+        try:
+            response = await self.llm.ainvoke(messages)
+        except asyncio.CancelledError:
+            if window is not None:
+                window.add(time.perf_counter() - started)
+            raise
+        if window is not None:
+            window.add(time.perf_counter() - started)
+        return response
+
+    async def _hedged_call(self, messages, hedge: bool):
+        """One model call; with `hedge`, a duplicate starts after `hedge_delay` and the first answer wins.
+
+        Only the first request is timed, so the window keeps describing un-hedged latency.
+        """
+        model = self._model_name()
+        window = llm_latency(model)
+        if not hedge:
+            return await self._timed_call(messages, window)
+        tasks = [asyncio.ensure_future(self._timed_call(messages, window))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay(model))
+            if not done:
+                count("llm_hedges")
+                tasks.append(asyncio.ensure_future(self._timed_call(messages)))
+            error = None
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    return await next_done
+                except Exception as exc:
+                    # The other request may still succeed.
+                    error = error or exc
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _ainvoke(self, messages, timeout: float, retries: int, hedge: bool):
+        for attempt in range(retries + 1):
+            try:
+                return await asyncio.wait_for(on_shared_loop(self._hedged_call(messages, hedge)), timeout)
+            except Exception as exc:
+                if isinstance(exc, asyncio.TimeoutError):
+                    exc = TimeoutError(f"Model did not answer within {timeout:g}s")
+                if not is_transient_error(exc) or attempt == retries:
+                    raise exc
+                count("llm_retries")
+                await asyncio.sleep(backoff_delay(attempt, LLM_BACKOFF_BASE_SECONDS, LLM_BACKOFF_MAX_SECONDS))
+
+    def _stream_chunks(self, messages, timeout: float, retries: int) -> Iterator:
+        """Model output chunks, streamed on the shared loop under `arun`'s deadline and retry policy.
+
+        Until the first text arrives nothing has been shown, so a timeout or transient
+        failure is retried like any other call; after that, tokens cannot be taken back
+        and a stream that stalls for `timeout` raises TimeoutError instead.
+        """
+        loop = get_event_loop()
+        end = object()
+
+        def _next(chunks):
+            return asyncio.run_coroutine_threadsafe(asyncio.wait_for(anext(chunks, end), timeout), loop).result()
+
+        def _close(chunks):
+            try:
+                asyncio.run_coroutine_threadsafe(chunks.aclose(), loop).result()
+            except Exception:
+                pass
+
+        for attempt in range(retries + 1):
+            chunks = self.llm.astream(messages)
+            pending = []
+            try:
+                # Buffer up to the first chunk with text; until then a retry is invisible.
+                chunk = _next(chunks)
+                while chunk is not end:
+                    pending.append(chunk)
+                    if getattr(chunk, "content", chunk):
+                        break
+                    chunk = _next(chunks)
+                break
+            except Exception as exc:
+                _close(chunks)
+                if isinstance(exc, TimeoutError):
+                    exc = TimeoutError(f"Model did not start answering within {timeout:g}s")
+                if not is_transient_error(exc) or attempt == retries:
+                    raise exc
+                count("llm_retries")
+                time.sleep(backoff_delay(attempt, LLM_BACKOFF_BASE_SECONDS, LLM_BACKOFF_MAX_SECONDS))
+
+        try:
+            yield from pending
+            while chunk is not end:
+                try:
+                    chunk = _next(chunks)
+                except TimeoutError:
+                    raise TimeoutError(f"Model stopped answering for {timeout:g}s") from None
+                if chunk is not end:
+                    yield chunk
+        finally:
+            _close(chunks)
+
+    async def arun(
+        self,
+        question: str,
+        docs=None,
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        hedge: Optional[bool] = None,
+        sources: Optional[Iterable[str]] = None,
+    ) -> dict:
+        """Async `run`; `sources` restricts retrieval to those files. Each model call must finish within `timeout` seconds, transient
+        failures and timeouts are retried up to `retries` times, and `hedge` races a slow
+        call against a duplicate (defaults: `llm_call_policy()`).
+
+        Model calls go through the shared event loop and connection pool whichever
+        loop awaits this; blocking cache and retrieval work runs in worker threads.
+        """
+        default_timeout, default_retries, default_hedge = llm_call_policy()
+        timeout = default_timeout if timeout is None else timeout
+        retries = default_retries if retries is None else max(0, int(retries))
+        hedge = default_hedge if hedge is None else hedge
+        sources = self._sources(sources)
+
+        hit, vector = await asyncio.to_thread(self._cached, question, sources)
+        if hit is not None:
+            return dict(hit, cached=True)
+
+        selected_docs, messages = await asyncio.to_thread(self._prepare, question, docs, sources, vector)
+        with span("llm", model=self._model_name()):
+            response = await self._ainvoke(messages, timeout, retries, hedge)
         answer = response.content if hasattr(response, "content") else str(response)
-        return {"answer": answer, "sources": selected_docs}
+        self._record_usage(messages, answer, getattr(response, "usage_metadata", None))
+        await asyncio.to_thread(self._remember, question, answer, selected_docs, vector, sources)
+        return {"answer": answer, "sources": selected_docs, "cached": False}
+
+    def run(self, question: str, docs=None, **options) -> dict:
+        """Answer `question`; `docs` are pre-retrieved candidates that skip the retriever.
+
+        Blocks on `arun` (and accepts its `timeout`, `retries`, `hedge` and `sources` options).
+        """
+        return run_on_shared_loop(self.arun(question, docs, **options))
+
+    def stream(
+        self,
+        question: str,
+        sources: Optional[Iterable[str]] = None,
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+    ) -> Iterator[dict]:
+        """Yield `{"type": "sources"}` before generation starts, then one `{"type": "token"}` per chunk
+        from the model, and finally `{"type": "done"}` carrying the assembled answer and sources.
+
+        A cached answer arrives as a single token event, with `cached` set on the done event.
+        `sources` restricts retrieval to those files. The wait for the first token has the
+        same deadline and retries as `arun` (`timeout`, `retries`); streams are not hedged.
+        """
+        default_timeout, default_retries, _ = llm_call_policy()
+        timeout = default_timeout if timeout is None else timeout
+        retries = default_retries if retries is None else max(0, int(retries))
+        sources = self._sources(sources)
+        hit, vector = self._cached(question, sources)
+        if hit is not None:
+            yield {"type": "sources", "sources": hit["sources"]}
+            yield {"type": "token", "text": hit["answer"]}
+            yield {"type": "done", "answer": hit["answer"], "sources": hit["sources"], "cached": True}
+            return
+
+        selected_docs, messages = self._prepare(question, sources=sources, vector=vector)
+        yield {"type": "sources", "sources": selected_docs}
+
+        parts = []
+        usage = None
+        started = time.perf_counter()
+        for chunk in self._stream_chunks(messages, timeout, retries):
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            text = chunk.content if hasattr(chunk, "content") else str(chunk)
+            if not text:
+                continue
+            if not parts:
+                observe("llm_first_token", time.perf_counter() - started, model=self._model_name())
+            parts.append(text)
+            yield {"type": "token", "text": text}
+        # Includes time the consumer spent between tokens, i.e. what the user waited.
+        observe("llm", time.perf_counter() - started, model=self._model_name(), streamed=True)
+        answer = "".join(parts)
+        self._record_usage(messages, answer, usage)
+        self._remember(question, answer, selected_docs, vector, sources)
+        yield {"type": "done", "answer": answer, "sources": selected_docs, "cached": False}
 
 
 def build_qa_chain(
     retriever,
     openai_api_key,
     domain,
-    max_source_docs: int = 4,
-    max_context_chars_per_doc: int = 1800,
+    max_source_docs: int = 8,
+    context_token_budget: Optional[int] = None,
+    corpus_id: Optional[str] = None,
+    answer_cache: Optional[AnswerCache] = None,
+    llm=None,
+    sources: Optional[Iterable[str]] = None,
+    rerank: bool = True,
 ):
+    """`corpus_id` (the index fingerprint) enables the shared answer cache unless another is given."""
+    if corpus_id and answer_cache is None:
+        answer_cache = get_answer_cache()
     return SimpleQAChain(
         retriever,
         openai_api_key,
         domain,
         max_source_docs=max_source_docs,
-        max_context_chars_per_doc=max_context_chars_per_doc,
+        context_token_budget=context_token_budget,
+        corpus_id=corpus_id,
+        answer_cache=answer_cache,
+        llm=llm,
+        sources=sources,
+        rerank=rerank,
     )
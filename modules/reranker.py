@@ -0,0 +1,128 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+# Weight on relevance versus novelty; 1.0 keeps the retrieval order.
+MMR_LAMBDA = 0.7
+# Candidates at least this similar (cosine) to an already chosen chunk are dropped outright.
+NEAR_DUPLICATE_SIMILARITY = 0.95
+# Retrieve this many candidates per source slot so there is something to diversify.
+RERANK_CANDIDATES_PER_RESULT = 3
+
+
+def docstore_positions(vectorstore) -> Dict[str, int]:
+    """`{doc_id: row}` for a FAISS store, rebuilt only when its id mapping changes.
+
+    Appends grow the mapping in place and removals replace it, so the same
+    mapping object at the same length means the cached inverse is still valid.
+    The cache holds the mapping itself, so a replaced one can never be mistaken
+    for a new mapping that happens to reuse its `id()`.
+    """
+    mapping = vectorstore.index_to_docstore_id
+    cached = getattr(vectorstore, "docstore_positions", None)
+    if cached is None or cached[0] is not mapping or cached[1] != len(mapping):
+        cached = (mapping, len(mapping), {doc_id: row for row, doc_id in mapping.items()})
+        vectorstore.docstore_positions = cached
+    return cached[2]
+
+
+def stored_vectors(vectorstores, docs: Sequence[Document]) -> Optional[np.ndarray]:
+    """The vectors `vectorstores` already hold for `docs`, one row each, or None if any is missing
+    or the index cannot return them.
+
+    Rows are read back with `reconstruct_batch`, so nothing is re-embedded
+    (IVF-PQ returns its compressed approximation, which is enough to compare chunks).
+    """
+    matrix = None
+    pending = list(range(len(docs)))
+    for vectorstore in vectorstores:
+        positions = docstore_positions(vectorstore)
+        offsets = [offset for offset in pending if docs[offset].id in positions]
+        if not offsets:
+            continue
+        rows = np.fromiter((positions[docs[offset].id] for offset in offsets), dtype=np.int64, count=len(offsets))
+        try:
+            block = vectorstore.index.reconstruct_batch(rows)
+        except RuntimeError:
+            # e.g. an IVF index saved before it kept a direct map
+            return None
+        if matrix is None:
+            matrix = np.empty((len(docs), block.shape[1]), dtype=np.float32)
+        matrix[offsets] = block
+        if len(offsets) == len(pending):
+            return matrix
+        taken = set(offsets)
+        pending = [offset for offset in pending if offset not in taken]
+    return matrix if not pending else None
+
+
+def rank_relevance(count: int) -> np.ndarray:
+    """Relevance for candidates known only by their order: 1.0 for the first, falling linearly."""
+    return 1.0 - np.arange(count, dtype=np.float32) / max(count, 1)
+
+
+def mmr_select(
+    vectors: np.ndarray,
+    relevance: np.ndarray,
+    k: int,
+    lambda_mult: float = MMR_LAMBDA,
+    duplicate_similarity: float = NEAR_DUPLICATE_SIMILARITY,
+) -> Tuple[List[int], List[float]]:
+    """Pick up to `k` rows by maximal marginal relevance; returns their indices and MMR scores.
+
+    `relevance` is scaled to a maximum of 1 so it is comparable with cosine
+    similarity. All pairwise similarities come from one matrix product, and
+    each pick updates the redundancy of every remaining row in one vector step.
+    """
+    count = len(relevance)
+    if count == 0 or k <= 0:
+        return [], []
+    # Cosines from the Gram matrix, so the vectors are read once.
+    gram = vectors @ vectors.T
+    norms = np.sqrt(np.maximum(gram.diagonal(), 1e-24))
+    similarity = gram / np.outer(norms, norms)
+    relevance = np.asarray(relevance, dtype=np.float32)
+    gain = lambda_mult * (relevance / (relevance.max() or 1.0))
+
+    # Highest similarity to anything picked so far; unrelated chunks count as zero.
+    redundancy = np.zeros(count, dtype=similarity.dtype)
+    blocked = np.zeros(count, dtype=bool)
+    picked: List[int] = []
+    scores: List[float] = []
+    while len(picked) < k:
+        mmr = gain - (1.0 - lambda_mult) * redundancy
+        mmr[blocked] = -np.inf
+        best = int(mmr.argmax())
+        if blocked[best]:
+            break
+        picked.append(best)
+        scores.append(float(mmr[best]))
+        blocked[best] = True
+        blocked |= similarity[best] >= duplicate_similarity
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return picked, scores
+
+
+def diversify(
+    docs: Sequence[Document],
+    vectors: np.ndarray,
+    k: int,
+    relevance: Optional[Sequence[float]] = None,
+    lambda_mult: float = MMR_LAMBDA,
+) -> List[Document]:
+    """A diverse top `k` of `docs` (best first), as copies whose metadata carries
+    `relevance_score` (the retriever's score relative to the best candidate, or
+    rank-based without scores) and `mmr_score`.
+    """
+    relevance = np.asarray(relevance, dtype=np.float32) if relevance is not None else rank_relevance(len(docs))
+    relevance = relevance / (relevance.max() or 1.0)
+    picked, scores = mmr_select(vectors, relevance, k, lambda_mult)
+    return [
+        Document(
+            id=docs[index].id,
+            page_content=docs[index].page_content,
+            metadata=dict(docs[index].metadata, relevance_score=round(float(relevance[index]), 6), mmr_score=round(score, 6)),
+        )
+        for index, score in zip(picked, scores)
+    ]
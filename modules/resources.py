@@ -0,0 +1,207 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+import httpx
+
+# Indexes used this recently are kept even over budget; a session is probably still reading them.
+INDEX_IDLE_SECONDS = 60.0
+
+HTTP_MAX_CONNECTIONS = 32
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 16
+HTTP_TIMEOUT_SECONDS = 60.0
+
+
+def index_memory_budget_bytes() -> int:
+    """Resident bytes loaded indexes may hold across all sessions before idle ones are dropped.
+
+    BRAINDOC_INDEX_MEMORY_MB, like BRAINDOC_INDEX_MMAP below, is read when used
+    so a `.env` loaded after this module is imported still applies.
+    """
+    return int(float(os.getenv("BRAINDOC_INDEX_MEMORY_MB", "1024")) * 1024 * 1024)
+
+
+def index_mmap() -> bool:
+    """Memory-map FAISS indexes loaded from the disk cache so every process shares the OS page cache."""
+    return os.getenv("BRAINDOC_INDEX_MMAP", "on").lower() not in ("0", "off", "false", "no")
+
+
+class SharedIndexes:
+    """Process-wide LRU of loaded retrievers keyed by corpus fingerprint, bounded by resident bytes.
+
+    Memory-mapped index files are reported as `mapped_bytes` but not charged to
+    the budget: those pages belong to the OS cache and are shared and reclaimable.
+    Dropping an entry only releases the registry's reference; sessions that
+    still hold the retriever keep working.
+    """
+
+    def __init__(self, budget_bytes: Optional[int] = None, idle_seconds: float = INDEX_IDLE_SECONDS):
+        self.budget_bytes = index_memory_budget_bytes() if budget_bytes is None else budget_bytes
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, fingerprint: str):
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            entry["last_used"] = time.monotonic()
+            self._entries.move_to_end(fingerprint)
+            self.stats["hits"] += 1
+            return entry["value"]
+
+    def put(self, fingerprint: str, value, resident_bytes: int, mapped_bytes: int = 0) -> int:
+        """Share `value` and evict idle entries until under budget; returns how many were evicted."""
+        with self._lock:
+            self._entries[fingerprint] = {
+                "value": value,
+                "resident_bytes": int(resident_bytes),
+                "mapped_bytes": int(mapped_bytes),
+                "last_used": time.monotonic(),
+            }
+            self._entries.move_to_end(fingerprint)
+            return self._evict_locked(keep=fingerprint)
+
+    def discard(self, fingerprint: str) -> None:
+        with self._lock:
+            self._entries.pop(fingerprint, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, fingerprint: str) -> bool:
+        with self._lock:
+            return fingerprint in self._entries
+
+    def _evict_locked(self, keep: Optional[str] = None) -> int:
+        resident = sum(entry["resident_bytes"] for entry in self._entries.values())
+        now = time.monotonic()
+        evicted = 0
+        # Least recently used first; busy entries are skipped rather than pulled from under a session.
+        for fingerprint in list(self._entries):
+            if resident <= self.budget_bytes:
+                break
+            entry = self._entries[fingerprint]
+            if fingerprint == keep or now - entry["last_used"] < self.idle_seconds:
+                continue
+            del self._entries[fingerprint]
+            resident -= entry["resident_bytes"]
+            evicted += 1
+        self.stats["evictions"] += evicted
+        return evicted
+
+    def residency(self) -> Dict[str, int]:
+        """Counts for ops: indexes held, resident and mapped bytes, budget, hits, misses and evictions."""
+        with self._lock:
+            return dict(
+                self.stats,
+                indexes=len(self._entries),
+                resident_bytes=sum(entry["resident_bytes"] for entry in self._entries.values()),
+                mapped_bytes=sum(entry["mapped_bytes"] for entry in self._entries.values()),
+                budget_bytes=self.budget_bytes,
+            )
+
+
+_shared_indexes: Optional[SharedIndexes] = None
+_http_client: Optional[httpx.Client] = None
+_async_http_client: Optional[httpx.AsyncClient] = None
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+_clients: Dict[Hashable, object] = {}
+_registry_lock = threading.Lock()
+
+
+def get_shared_indexes() -> SharedIndexes:
+    global _shared_indexes
+    with _registry_lock:
+        if _shared_indexes is None:
+            _shared_indexes = SharedIndexes()
+        return _shared_indexes
+
+
+def get_http_client() -> httpx.Client:
+    """One pooled, keep-alive HTTP client for every OpenAI call in the process."""
+    global _http_client
+    with _registry_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                ),
+                timeout=HTTP_TIMEOUT_SECONDS,
+            )
+        return _http_client
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Background event loop, started once per process, that owns the async HTTP pool."""
+    global _event_loop
+    with _registry_lock:
+        if _event_loop is None:
+            _event_loop = asyncio.new_event_loop()
+            threading.Thread(target=_event_loop.run_forever, name="braindoc-async", daemon=True).start()
+        return _event_loop
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Async counterpart of `get_http_client`.
+
+    Pooled connections belong to the loop that opened them, so this client is
+    only used on `get_event_loop()`; see `on_shared_loop`.
+    """
+    global _async_http_client
+    with _registry_lock:
+        if _async_http_client is None:
+            _async_http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                ),
+                timeout=HTTP_TIMEOUT_SECONDS,
+            )
+        return _async_http_client
+
+
+async def on_shared_loop(coro: Awaitable):
+    """Await `coro` on the shared loop, hopping over from whatever loop the caller runs on.
+
+    Cancelling the caller cancels the coroutine on the shared loop as well.
+    """
+    loop = get_event_loop()
+    if asyncio.get_running_loop() is loop:
+        return await coro
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+
+def run_on_shared_loop(coro: Awaitable):
+    """Run `coro` on the shared loop from synchronous code and return its result."""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+
+def shared_client(kind: Hashable, openai_api_key: Optional[str], factory: Callable[[], object]):
+    """Build a client once per `(kind, API key)` and hand the same instance to every session.
+
+    Only a digest of the key is kept in the registry.
+    """
+    key_digest = hashlib.sha256((openai_api_key or "").encode("utf-8")).hexdigest()
+    registry_key = (kind, key_digest)
+    with _registry_lock:
+        client = _clients.get(registry_key)
+    if client is not None:
+        return client
+    client = factory()
+    with _registry_lock:
+        # Another thread may have won the race; keep the first so everyone shares one.
+        return _clients.setdefault(registry_key, client)
+
+
+def resource_stats() -> Dict[str, int]:
+    return dict(get_shared_indexes().residency(), clients=len(_clients))
@@ -0,0 +1,247 @@
+import heapq
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple, Union
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_community.vectorstores.faiss import dependable_faiss_import
+from pydantic import ConfigDict
+
+from modules.hybrid_retriever import (
+    DEFAULT_FUSION_WEIGHTS,
+    DOMAIN_FUSION_WEIGHTS,
+    FUSION_CANDIDATES_PER_RESULT,
+    RRF_K,
+    SOURCE_FILTER_FETCH_FACTOR,
+    doc_source,
+    fuse_scored,
+)
+from modules.lexical_index import get_lexical_index
+from modules.reranker import stored_vectors
+
+# Shards searched at once; FAISS releases the GIL while it scans, so threads run truly in parallel.
+SHARD_SEARCH_WORKERS = min(8, os.cpu_count() or 1)
+# Chunks without a source all land in this shard.
+UNKNOWN_SOURCE_SHARD = "(unknown source)"
+
+_shard_pool: Optional[ThreadPoolExecutor] = None
+_shard_pool_lock = threading.Lock()
+
+
+def _get_shard_pool() -> ThreadPoolExecutor:
+    global _shard_pool
+    with _shard_pool_lock:
+        if _shard_pool is None:
+            _shard_pool = ThreadPoolExecutor(max_workers=SHARD_SEARCH_WORKERS, thread_name_prefix="braindoc-shard")
+        return _shard_pool
+
+
+def plan_shards(documents, shard_by: Union[str, int]) -> Dict[str, List[int]]:
+    """Group document positions into shards: one per `metadata["source"]` with `shard_by="source"`,
+    or whole sources packed into shards of at most `shard_by` chunks (larger sources are split).
+    """
+    by_source: Dict[str, List[int]] = {}
+    for position, doc in enumerate(documents):
+        by_source.setdefault(doc_source(doc) or UNKNOWN_SOURCE_SHARD, []).append(position)
+    if shard_by == "source":
+        return by_source
+    if isinstance(shard_by, bool) or not isinstance(shard_by, int) or shard_by < 1:
+        raise ValueError(f"shard_by must be 'source' or a positive chunk count, not {shard_by!r}")
+
+    shards: List[List[int]] = []
+    current: List[int] = []
+    for positions in by_source.values():
+        if current and len(current) + len(positions) > shard_by:
+            shards.append(current)
+            current = []
+        for start in range(0, len(positions), shard_by):
+            piece = positions[start : start + shard_by]
+            if current and len(current) + len(piece) > shard_by:
+                shards.append(current)
+                current = []
+            current.extend(piece)
+    if current:
+        shards.append(current)
+    # Random suffixes keep keys unique when shards are added to an existing set later.
+    return {f"shard-{uuid.uuid4().hex[:8]}": positions for positions in shards}
+
+
+def shard_sources(vectorstore) -> FrozenSet[str]:
+    return frozenset(doc_source(doc) for doc in vectorstore.docstore._dict.values())
+
+
+def _higher_is_better(vectorstore) -> bool:
+    faiss = dependable_faiss_import()
+    return vectorstore.index.metric_type == faiss.METRIC_INNER_PRODUCT
+
+
+def _search_shard(vectorstore, queries: List[str], matrix, candidates: int, weights, sources) -> Tuple[List, List]:
+    """Dense and BM25 hits of every query in one shard as `(score, doc_id, docstore)`, higher scores better.
+
+    Documents are only looked up for the hits that survive the merge, except
+    when `sources` is passed because the shard mixes wanted and unwanted files.
+    """
+    fetch = candidates * SOURCE_FILTER_FETCH_FACTOR if sources else candidates
+    docstore = vectorstore.docstore
+
+    def _wanted(doc_id) -> bool:
+        return not sources or doc_source(docstore.search(doc_id)) in sources
+
+    dense: List[List] = [[] for _ in queries]
+    if weights[0] > 0 and matrix is not None:
+        vectors = matrix
+        if getattr(vectorstore, "_normalize_L2", False):
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        distances, rows = vectorstore.index.search(vectors, min(fetch, vectorstore.index.ntotal))
+        sign = 1.0 if _higher_is_better(vectorstore) else -1.0
+        index_to_id = vectorstore.index_to_docstore_id
+        for position, (row_distances, row_ids) in enumerate(zip(distances, rows)):
+            hits = dense[position]
+            for distance, row in zip(row_distances.tolist(), row_ids.tolist()):
+                doc_id = index_to_id.get(row)
+                if doc_id is not None and _wanted(doc_id):
+                    hits.append((sign * distance, doc_id, docstore))
+                    if len(hits) == candidates:
+                        break
+
+    lexical: List[List] = [[] for _ in queries]
+    index = get_lexical_index(vectorstore)
+    if weights[1] > 0 and index is not None:
+        for position, query in enumerate(queries):
+            hits = lexical[position]
+            for doc_id, score in index.search(query, fetch):
+                if _wanted(doc_id):
+                    hits.append((score, doc_id, docstore))
+                    if len(hits) == candidates:
+                        break
+    return dense, lexical
+
+
+def _best_first(hits: List[Tuple[float, str, Any]], limit: int) -> List[Document]:
+    docs = []
+    for _, doc_id, docstore in heapq.nlargest(limit, hits, key=lambda hit: hit[0]):
+        doc = docstore.search(doc_id)
+        if isinstance(doc, Document):
+            docs.append(doc)
+    return docs
+
+
+class ShardedRetriever(BaseRetriever):
+    """Hybrid retrieval over independent FAISS + BM25 shards, searched in parallel.
+
+    Each shard's dense and BM25 hits are merged by score into one ranking per
+    retriever, and the two rankings are fused with reciprocal rank fusion as in
+    HybridRetriever. BM25 statistics are per shard, so lexical scores are only
+    roughly comparable across shards; fusion only looks at ranks, which keeps
+    that small. A `sources` filter skips shards holding none of those files.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    shards: Dict[str, Any]
+    embedding_function: Any
+    shard_sources: Dict[str, FrozenSet[str]] = {}
+    # How `shards` was planned, so updates add files the same way.
+    shard_by: Union[str, int] = "source"
+    search_kwargs: Dict[str, Any] = {"k": 4}
+    weights: Tuple[float, float] = DEFAULT_FUSION_WEIGHTS
+    rrf_k: int = RRF_K
+
+    def for_domain(self, domain: Optional[str]) -> "ShardedRetriever":
+        """Copy using that domain's fusion weights; the shards are shared."""
+        return self.model_copy(update={"weights": DOMAIN_FUSION_WEIGHTS.get(domain, DEFAULT_FUSION_WEIGHTS)})
+
+    @property
+    def ntotal(self) -> int:
+        return sum(store.index.ntotal for store in self.shards.values())
+
+    def sources(self) -> List[str]:
+        return sorted({source for names in self.shard_sources.values() for source in names if source})
+
+    def _candidates(self, k: int) -> int:
+        return max(k * FUSION_CANDIDATES_PER_RESULT, 20)
+
+    def _targets(self, sources) -> List[Tuple[Any, Optional[set]]]:
+        """`(shard, per-shard filter)` for every shard that may hold a hit."""
+        if not sources:
+            return [(store, None) for store in self.shards.values()]
+        targets = []
+        for key, store in self.shards.items():
+            names = self.shard_sources.get(key) or shard_sources(store)
+            if names <= sources:
+                targets.append((store, None))
+            elif names & sources:
+                targets.append((store, sources))
+        return targets
+
+    def _search(self, queries: List[str], matrix, k: int, sources=None) -> List[List[Tuple[Document, float]]]:
+        candidates = self._candidates(k)
+        targets = self._targets(set(sources) if sources else None)
+        if len(targets) > 1 and SHARD_SEARCH_WORKERS > 1:
+            futures = [
+                _get_shard_pool().submit(_search_shard, store, queries, matrix, candidates, self.weights, shard_filter)
+                for store, shard_filter in targets
+            ]
+            results = [future.result() for future in futures]
+        else:
+            results = [_search_shard(store, queries, matrix, candidates, self.weights, shard_filter) for store, shard_filter in targets]
+
+        fused = []
+        for position in range(len(queries)):
+            dense = _best_first([hit for shard_dense, _ in results for hit in shard_dense[position]], candidates)
+            lexical = _best_first([hit for _, shard_lexical in results for hit in shard_lexical[position]], candidates)
+            fused.append(fuse_scored(dense, lexical, k, self.weights, self.rrf_k))
+        return fused
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun, **kwargs: Any
+    ) -> List[Document]:
+        """`sources` (a collection of `metadata["source"]` values) restricts results to those files."""
+        return [doc for doc, _ in self.search_with_scores(query, kwargs.get("k"), kwargs.get("sources"))]
+
+    def search_with_scores(
+        self, query: str, k: Optional[int] = None, sources=None, vector=None
+    ) -> List[Tuple[Document, float]]:
+        """Like `invoke`, but each document comes with its fused score (higher is better).
+
+        `vector` is the query's embedding if the caller already has it.
+        """
+        k = int(k or self.search_kwargs.get("k", 4))
+        matrix = None
+        if self.weights[0] > 0:
+            if vector is None:
+                vector = self.embedding_function.embed_query(query)
+            matrix = np.asarray([vector], dtype=np.float32)
+        return self._search([query], matrix, k, sources)[0]
+
+    def batch_retrieve(self, queries: List[str], vectors, k: Optional[int] = None) -> List[List[Document]]:
+        """Retrieve for many queries from pre-computed embeddings, one matrix search per shard."""
+        k = int(k or self.search_kwargs.get("k", 4))
+        if not queries:
+            return []
+        matrix = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(queries), -1)
+        return [[doc for doc, _ in hits] for hits in self._search(queries, matrix, k)]
+
+    def stored_vectors(self, docs: List[Document]):
+        """The shards' own vectors for `docs` (see `reranker.stored_vectors`); only shards holding their files are read."""
+        wanted = {doc_source(doc) for doc in docs}
+        stores = [store for key, store in self.shards.items() if wanted & (self.shard_sources.get(key) or shard_sources(store))]
+        return stored_vectors(stores, docs)
+
+
+def as_sharded_retriever(shards: Dict[str, Any], embedding_function, **kwargs) -> Optional[ShardedRetriever]:
+    """Wrap non-empty shards in a retriever, or None when every shard is empty."""
+    shards = {key: store for key, store in shards.items() if store is not None and store.index.ntotal}
+    if not shards:
+        return None
+    return ShardedRetriever(
+        shards=shards,
+        embedding_function=embedding_function,
+        shard_sources={key: shard_sources(store) for key, store in shards.items()},
+        **kwargs,
+    )
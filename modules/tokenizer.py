@@ -0,0 +1,41 @@
+import re
+from typing import Optional
+
+try:
+    import tiktoken
+except ImportError:  # optional; fall back to a character heuristic
+    tiktoken = None
+
+ENCODING_NAME = "cl100k_base"
+# Rough English average used when no BPE encoding is available.
+CHARS_PER_TOKEN = 4
+
+_encoding = None
+_encoding_failed = False
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is not None or _encoding_failed or tiktoken is None:
+        return _encoding
+    try:
+        _encoding = tiktoken.get_encoding(ENCODING_NAME)
+    except Exception:
+        # The BPE file is downloaded on first use; offline hosts use the heuristic.
+        _encoding_failed = True
+    return _encoding
+
+
+def count_tokens(text: Optional[str]) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Collapse whitespace so formatting-only differences hash the same."""
+    return _WHITESPACE_RE.sub(" ", text or "").strip()
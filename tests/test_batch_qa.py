@@ -0,0 +1,93 @@
+import json
+
+from langchain_core.documents import Document
+
+from modules import batch_qa
+from modules.batch_qa import StubChatModel, answer_questions, run_batch
+from modules.embedder import create_vectorstore
+
+
+def _retriever():
+    retriever, _ = create_vectorstore(
+        [
+            Document(page_content="Late assignments lose ten percent per day.", metadata={"source": "syllabus.txt"}),
+            Document(page_content="The final exam is worth forty percent.", metadata={"source": "syllabus.txt"}),
+            Document(page_content="Office hours are held on Tuesday afternoons.", metadata={"source": "notes.txt"}),
+        ],
+        None,
+        embedding_backend="local",
+    )
+    return retriever
+
+
+def test_batch_retrieve_matches_per_question_retrieval():
+    retriever = _retriever().for_domain("Legal")
+    questions = ["late assignments penalty", "final exam worth", "office hours tuesday"]
+    vectors = retriever.vectorstore.embedding_function.embed_documents(questions)
+
+    batched = retriever.batch_retrieve(questions, vectors, k=2)
+
+    for question, docs in zip(questions, batched):
+        assert [doc.id for doc in docs] == [doc.id for doc in retriever.invoke(question, k=2)]
+
+
+def test_answer_questions_embeds_once_and_isolates_failures(monkeypatch):
+    retriever = _retriever()
+    embedding = retriever.vectorstore.embedding_function
+    calls = []
+    original = embedding.embed_documents
+    monkeypatch.setattr(type(embedding), "embed_documents", lambda self, texts: calls.append(len(texts)) or original(texts))
+
+    class _FlakyStub(StubChatModel):
+        def _call(self, messages, stop=None, run_manager=None, **kwargs):
+            if "explode" in str(messages[-1].content):
+                raise RuntimeError("model unavailable")
+            return super()._call(messages, stop, run_manager, **kwargs)
+
+    questions = [
+        {"id": "a", "question": "How much is the final exam worth?"},
+        {"id": "b", "question": "explode please", "domain": "Legal"},
+        {"id": "c", "question": "When are office hours?", "domain": "Legal"},
+    ]
+    results = answer_questions(retriever, questions, llm=_FlakyStub(), max_concurrency=3, max_source_docs=1)
+
+    assert calls == [3]
+    assert [result["id"] for result in results] == ["a", "b", "c"]
+    assert results[0]["answer"] == "The final exam is worth forty percent."
+    assert results[0]["sources"] == [{"source": "syllabus.txt", "content": "The final exam is worth forty percent."}]
+    assert results[1]["error"] == "model unavailable" and results[1]["answer"] is None
+    assert results[2]["domain"] == "Legal" and results[2]["sources"][0]["source"] == "notes.txt"
+
+
+def test_run_batch_reads_directory_and_writes_jsonl(tmp_path):
+    docs = tmp_path / "docs"
+    (docs / "nested").mkdir(parents=True)
+    (docs / "policy.txt").write_text("Refunds are issued within fourteen days.", encoding="utf-8")
+    (docs / "nested" / "hours.txt").write_text("The help desk opens at nine.", encoding="utf-8")
+    (docs / "image.png").write_bytes(b"not a document")
+    questions = tmp_path / "questions.jsonl"
+    questions.write_text('{"question": "When are refunds issued?"}\n\n"When does the help desk open?"\n', encoding="utf-8")
+    output = tmp_path / "answers.jsonl"
+
+    summary = run_batch(str(docs), str(questions), str(output), embedding_backend="local", llm=StubChatModel(), max_source_docs=1)
+
+    records = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert summary["files"] == 2 and summary["load_errors"] == []
+    assert [record["id"] for record in records] == [1, 3]
+    assert records[0]["sources"][0]["source"] == "policy.txt"
+    assert records[1]["answer"] == "The help desk opens at nine."
+    assert records[1]["sources"][0]["source"] == "nested/hours.txt"
+
+
+def test_main_reads_concurrency_from_the_environment_at_run_time(monkeypatch):
+    monkeypatch.setenv("BRAINDOC_BATCH_CONCURRENCY", "3")
+    seen = {}
+
+    def fake_run_batch(documents, questions, output, **kwargs):
+        seen.update(kwargs)
+        return {"files": 0, "chunks": 0, "results": [], "load_errors": [], "embed_errors": []}
+
+    monkeypatch.setattr(batch_qa, "run_batch", fake_run_batch)
+
+    assert batch_qa.main(["docs", "questions.jsonl"]) == 0
+    assert seen["max_concurrency"] == 3
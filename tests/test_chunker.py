@@ -0,0 +1,88 @@
+from types import SimpleNamespace
+
+from modules import file_loader
+from modules.chunker import (
+    FINANCE_CHUNK_PROFILE,
+    LEGAL_CHUNK_PROFILE,
+    chunk_profile,
+    chunk_text,
+    chunking_id,
+)
+from modules.tokenizer import count_tokens
+
+CONTRACT = """SERVICES AGREEMENT
+
+1. DEFINITIONS
+
+1.1 Services. The work described in the statement of work attached to this agreement.
+1.2 Fees. The amounts payable by the customer for the services each calendar month.
+
+2. PAYMENT
+
+2.1 Invoices. The provider invoices monthly in arrears and the customer pays within thirty days.
+2.2 Late Payment. Overdue amounts accrue interest at one percent per month until paid in full.
+"""
+
+REPORT = """BALANCE SHEET
+
+                               2025            2024
+Cash                     $45,200,000     $38,500,000
+Receivables              $52,300,000     $41,200,000
+Inventories               $8,500,000      $6,200,000
+
+Property                $125,400,000    $110,200,000
+Goodwill                 $35,200,000     $35,200,000
+Total Assets            $314,400,000    $279,700,000
+
+Revenue grew on subscription sales.
+"""
+
+
+def test_chunks_record_offsets_and_sections_within_the_token_limit():
+    profile = dict(chunk_profile(), **LEGAL_CHUNK_PROFILE, tokens=40)
+    docs = chunk_text(CONTRACT, {"source": "contract.txt"}, profile)
+
+    for doc in docs:
+        start, end = doc.metadata["start_index"], doc.metadata["end_index"]
+        assert CONTRACT[start:end] == doc.page_content
+        assert count_tokens(doc.page_content) <= 40
+        assert doc.metadata["source"] == "contract.txt"
+    # Clause-aware: chunks start at a clause or heading, and a heading stays with its first clause.
+    assert [doc.page_content.split(" ", 1)[0] for doc in docs] == ["SERVICES", "1.2", "2.", "2.2"]
+    assert docs[1].metadata["section"].startswith("1.2 Fees.")
+
+
+def test_finance_tables_stay_whole_and_repeat_their_header_when_split():
+    finance = dict(chunk_profile(), **FINANCE_CHUNK_PROFILE)
+    whole = chunk_text(REPORT, {}, finance)
+    assert len(whole) == 1
+
+    docs = chunk_text(REPORT, {}, dict(finance, tokens=70))
+    header = "                               2025            2024\n"
+    assert [doc.page_content.count("$") for doc in docs[:2]] == [6, 6]
+    assert docs[1].page_content.startswith(header + "Property")
+    # Offsets cover the chunk's own rows; the repeated header is not part of them.
+    start, end = docs[1].metadata["start_index"], docs[1].metadata["end_index"]
+    assert REPORT[start:end] == docs[1].page_content[len(header):]
+    assert all(doc.metadata["section"] == "BALANCE SHEET" for doc in docs)
+
+
+def test_every_domain_uses_the_default_profile_and_formats_still_vary(monkeypatch):
+    # None of the stricter per-domain profiles beat the default on the chunking benchmark.
+    assert chunk_profile("Legal") == chunk_profile("Unknown") == chunk_profile(None)
+    assert chunk_profile("Legal")["name"] == "default"
+    assert chunk_profile("Finance", ".pdf")["lines"] is False and chunk_profile("Finance", ".txt")["lines"] is True
+    assert chunking_id("Legal") == chunking_id("Finance")
+    # Sizes are read when a profile is looked up, so values loaded from `.env` apply and key the cache.
+    monkeypatch.setenv("BRAINDOC_CHUNK_TOKENS", "128")
+    assert chunk_profile("Legal")["tokens"] == 128 and chunking_id("Legal").endswith(":128/24")
+
+
+def test_load_documents_records_offsets_and_sections():
+    upload = SimpleNamespace(name="contract.txt", read=lambda: CONTRACT.encode())
+
+    docs, errors = file_loader.load_documents([upload], domain="Legal")
+
+    assert errors == []
+    assert docs[0].metadata["start_index"] == 0 and docs[0].metadata["section"] == "SERVICES AGREEMENT"
+    assert all(CONTRACT[doc.metadata["start_index"] : doc.metadata["end_index"]] == doc.page_content for doc in docs)
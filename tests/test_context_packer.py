@@ -0,0 +1,67 @@
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from modules.chunker import chunk_profile, chunk_text
+from modules.context_packer import pack_context, truncate_to_tokens
+from modules.tokenizer import count_tokens
+
+
+def _chunks(source: str, sentences: int):
+    text = " ".join(f"Clause {i} sets out obligation number {i} for the tenant." for i in range(sentences))
+    splitter = RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=60)
+    return text, [Document(page_content=chunk, metadata={"source": source}) for chunk in splitter.split_text(text)]
+
+
+def test_overlapping_neighbours_merge_and_duplicates_drop():
+    text, chunks = _chunks("lease.txt", 12)
+    assert len(chunks) >= 4
+    other = Document(page_content="Rent is due monthly.", metadata={"source": "other.txt"})
+
+    # Ranked out of order, with a neighbour that only connects once the middle chunk arrives.
+    ranked = [chunks[2], other, chunks[0], chunks[1], Document(page_content=chunks[2].page_content, metadata={"source": "lease.txt"})]
+    context, used = pack_context(ranked, token_budget=10_000)
+
+    blocks = context.split("\n\n")
+    assert blocks == [text[: text.index(chunks[2].page_content) + len(chunks[2].page_content)], "Rent is due monthly."]
+    assert used == ranked[:4]
+
+
+def test_neighbouring_chunks_merge_by_offsets():
+    text = " ".join(f"Clause {i} sets out obligation number {i} for the tenant." for i in range(12))
+    chunks = chunk_text(text, {"source": "lease.txt", "page": 0}, dict(chunk_profile(), tokens=30, overlap=0))
+    assert len(chunks) >= 5
+    restated = "Obligations continue after the lease ends."
+    elsewhere = Document(page_content=restated, metadata={"source": "lease.txt", "page": 1, "start_index": 0, "end_index": len(restated)})
+
+    # Structural cuts share no text; their offsets show which chunks adjoin.
+    context, used = pack_context([chunks[2], elsewhere, chunks[0], chunks[4], chunks[1]], token_budget=10_000)
+
+    blocks = context.split("\n\n")
+    start, end = chunks[0].metadata["start_index"], chunks[2].metadata["end_index"]
+    assert blocks == [text[start:end], restated, chunks[4].page_content]
+    assert len(used) == 5
+
+    # Chunks cut mid-paragraph repeat a few sentences; the repeat is packed once.
+    overlapping = chunk_text(text, {"source": "lease.txt"}, dict(chunk_profile(), tokens=30, overlap=14))
+    assert overlapping[1].metadata["start_index"] < overlapping[0].metadata["end_index"]
+    context, _ = pack_context(overlapping[::-1], token_budget=10_000)
+    assert context == text
+
+
+def test_budget_skips_chunks_that_do_not_fit_and_truncates_a_lone_oversized_chunk():
+    big = Document(page_content="word " * 400, metadata={"source": "a.txt"})
+    small = Document(page_content="Short fact one.", metadata={"source": "b.txt"})
+    tiny = Document(page_content="Short fact two.", metadata={"source": "c.txt"})
+
+    context, used = pack_context([small, big, tiny], token_budget=count_tokens("Short fact one.") * 2 + 2)
+    assert used == [small, tiny]
+    assert context == "Short fact one.\n\nShort fact two."
+
+    context, used = pack_context([big], token_budget=50)
+    assert used == [big] and 0 < count_tokens(context) <= 50
+
+
+def test_truncate_prefers_sentence_boundary():
+    text = "First sentence is here. Second sentence is quite a bit longer than the first one."
+    cut = truncate_to_tokens(text, count_tokens("First sentence is here. Second sentence"))
+    assert cut == "First sentence is here."
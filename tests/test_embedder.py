@@ -0,0 +1,105 @@
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import modules.embedder as embedder
+
+
+def _docs(source, count):
+    return [Document(page_content=f"{source} chunk {i}", metadata={"source": source}) for i in range(count)]
+
+
+def _sources(retriever):
+    store = retriever.vectorstore
+    return sorted(store.docstore.search(i).metadata["source"] for i in store.index_to_docstore_id.values())
+
+
+def test_update_vectorstore_applies_file_diff_without_touching_original():
+    retriever, skipped = embedder.create_vectorstore(
+        _docs("a.txt", 2) + _docs("b.txt", 3), None, embedding_backend="local"
+    )
+
+    updated, update_skipped = embedder.update_vectorstore(
+        retriever, _docs("c.txt", 1), ["b.txt"], None, embedding_backend="local"
+    )
+
+    assert skipped == [] and update_skipped == []
+    assert _sources(updated) == ["a.txt", "a.txt", "c.txt"]
+    assert updated.vectorstore.index.ntotal == 3
+    assert retriever.vectorstore.index.ntotal == 5
+
+
+def test_remove_sources_ignores_unknown_source():
+    store, _ = embedder.add_documents(None, _docs("a.txt", 2), DeterministicFakeEmbedding(size=8))
+
+    assert embedder.remove_sources(store, ["missing.txt"]) == 0
+    assert embedder.remove_sources(store, ["a.txt"]) == 2
+    assert store.index.ntotal == 0
+
+
+class FlakyEmbeddings(DeterministicFakeEmbedding):
+    calls: list = []
+    timeouts_left: int = 0
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        if self.timeouts_left:
+            self.timeouts_left -= 1
+            raise TimeoutError("upstream timed out")
+        if any("bad" in text for text in texts):
+            raise ValueError("rejected input")
+        return super().embed_documents(texts)
+
+
+def test_embed_texts_splits_failed_batch_and_keeps_input_order():
+    client = FlakyEmbeddings(size=4, calls=[])
+    texts = [f"text {i}" for i in range(7)] + ["bad text"]
+
+    matrix, failures = embedder.embed_texts(texts, client, batch_size=8, max_concurrency=2)
+
+    # 1 full batch + 3 levels of halving instead of 8 per-text calls.
+    assert len(client.calls) == 1 + 2 + 2 + 2
+    assert failures.keys() == {7}
+    assert matrix.dtype == np.float32
+    assert np.allclose(matrix[:7], DeterministicFakeEmbedding(size=4).embed_documents(texts[:7]))
+    assert not matrix[7].any()
+
+
+def test_embed_texts_retries_transient_errors_before_splitting(monkeypatch):
+    monkeypatch.setattr(embedder, "EMBED_BACKOFF_BASE_SECONDS", 0.0)
+    client = FlakyEmbeddings(size=4, calls=[], timeouts_left=2)
+
+    matrix, failures = embedder.embed_texts(["a", "b"], client, batch_size=2)
+
+    assert failures == {}
+    assert matrix.shape == (2, 4)
+    assert client.calls == [["a", "b"]] * 3
+
+
+def test_add_documents_with_cached_embeddings_builds_searchable_store(tmp_path):
+    from modules.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+    embeddings = CachedEmbeddings(
+        DeterministicFakeEmbedding(size=8), EmbeddingCache(str(tmp_path / "emb.sqlite3")), "fake:8"
+    )
+    docs = _docs("a.txt", 3) + [Document(page_content="a.txt chunk 0", metadata={"source": "copy.txt"})]
+
+    store, skipped = embedder.add_documents(None, docs, embeddings)
+
+    assert skipped == []
+    assert store.index.ntotal == 4
+    assert np.array_equal(store.index.reconstruct(0), store.index.reconstruct(3))
+    assert store.similarity_search("a.txt chunk 2", k=1)[0].page_content == "a.txt chunk 2"
+
+
+def test_add_documents_drops_failed_rows_from_new_index():
+    client = FlakyEmbeddings(size=4, calls=[])
+    docs = _docs("a.txt", 3) + [Document(page_content="bad chunk", metadata={"source": "a.txt"})] + _docs("b.txt", 2)
+
+    store, skipped = embedder.add_documents(None, docs, client)
+
+    assert len(skipped) == 1 and skipped[0].startswith("a.txt:")
+    assert store.index.ntotal == 5
+    for position, doc_id in store.index_to_docstore_id.items():
+        content = store.docstore.search(doc_id).page_content
+        assert np.allclose(store.index.reconstruct(position), client.embed_query(content))
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from modules.embedder import embedding_model_id, get_embeddings
+from modules.embedding_backends import HashingEmbeddings, create_embedding_backend, is_remote
+
+
+def test_local_backend_is_shared_normalized_and_deterministic():
+    backend = create_embedding_backend("local")
+    assert backend is create_embedding_backend("local")
+    assert not is_remote(backend)
+
+    vectors = np.asarray(backend.embed_documents(["Refund policy for orders", "refund  POLICY for orders", ""]))
+    assert vectors.shape == (3, backend.dim)
+    np.testing.assert_allclose(vectors[0], vectors[1])
+    np.testing.assert_allclose(np.linalg.norm(vectors[:2], axis=1), 1.0, rtol=1e-5)
+    assert not vectors[2].any()
+    assert HashingEmbeddings().embed_query("refund policy") == backend.embed_query("refund policy")
+
+
+def test_local_backend_ranks_overlapping_text_closer():
+    backend = create_embedding_backend("local")
+    query = np.asarray(backend.embed_query("termination clause notice period"))
+    related, unrelated = np.asarray(
+        backend.embed_documents(["The termination clause requires a notice period.", "Blood pressure readings were normal."])
+    )
+    assert query @ related > query @ unrelated
+
+
+def test_get_embeddings_records_backend_model_id(monkeypatch):
+    local = get_embeddings(backend="local")
+    assert embedding_model_id(local) == "local-hashing:v1:384"
+    # The default comes from the environment at call time, after `.env` is loaded.
+    monkeypatch.setenv("BRAINDOC_EMBEDDING_BACKEND", "local")
+    assert get_embeddings() is local
+
+    with pytest.raises(ValueError, match="Unknown embedding backend"):
+        get_embeddings(backend="missing")
@@ -0,0 +1,39 @@
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from modules.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    calls: list = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return super().embed_documents(texts)
+
+
+def test_cached_embeddings_dedupes_within_batch_and_across_calls(tmp_path):
+    underlying = CountingEmbeddings(size=8, calls=[])
+    cache = EmbeddingCache(str(tmp_path / "emb.sqlite3"))
+    embeddings = CachedEmbeddings(underlying, cache, "fake:8")
+
+    first = embeddings.embed_documents(["Clause 1.", "Clause  1.", "Clause 2."])
+    second = embeddings.embed_documents(["Clause 2.", "Clause 3."])
+
+    assert underlying.calls == [["Clause 1.", "Clause 2."], ["Clause 3."]]
+    assert first[0] == first[1]
+    assert second[0] == first[2]
+    assert cache.stats["requested"] == 5
+    assert cache.stats["batch_duplicates"] == 1
+    assert cache.stats["hits"] == 1
+    assert cache.stats["misses"] == 3
+    assert cache.stats["tokens_saved"] > 0
+
+
+def test_embedding_cache_persists_per_model(tmp_path):
+    path = str(tmp_path / "emb.sqlite3")
+    EmbeddingCache(path).put_many("model-a", {"k": [0.5, 1.5]})
+
+    reopened = EmbeddingCache(path)
+
+    assert reopened.get_many("model-a", ["k"])["k"].tolist() == [0.5, 1.5]
+    assert reopened.get_many("model-b", ["k"]) == {}
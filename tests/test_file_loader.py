@@ -0,0 +1,102 @@
+import time
+from types import SimpleNamespace
+
+from modules import file_loader
+
+
+def _upload(name: str, content: bytes):
+    return SimpleNamespace(name=name, read=lambda: content)
+
+
+def _slow_load(name, data):
+    if name.startswith("slow"):
+        time.sleep(30)
+    return [name], []
+
+
+def test_load_documents_pool_preserves_upload_order(monkeypatch):
+    monkeypatch.setattr(file_loader, "LOADER_POOL_MIN_BYTES", 0)
+    uploads = [_upload(f"note{i}.txt", f"note number {i}".encode()) for i in range(4)]
+    uploads.insert(2, _upload("table.xlsx", b"data"))
+
+    docs, errors = file_loader.load_documents(uploads, workers=2)
+
+    assert [doc.metadata["source"] for doc in docs] == [f"note{i}.txt" for i in range(4)]
+    assert errors == ["Unsupported file type for table.xlsx"]
+
+
+def test_load_in_pool_times_out_stuck_file_and_finishes_the_rest():
+    items = [("a.txt", b""), ("slow.pdf", b""), ("b.txt", b""), ("c.txt", b"")]
+
+    started = time.monotonic()
+    results = file_loader._load_in_pool(items, workers=2, timeout=2, load_file=_slow_load)
+
+    assert time.monotonic() - started < 25
+    assert [docs for docs, _ in results] == [["a.txt"], [], ["b.txt"], ["c.txt"]]
+    assert "timed out" in results[1][1][0]
+
+
+def _text_pdf(text: str) -> bytes:
+    import pymupdf
+
+    with pymupdf.open() as pdf:
+        pdf.new_page().insert_text((72, 72), text)
+        return pdf.tobytes()
+
+
+def test_scanned_pdf_is_rejected_by_probe_without_running_parsers(monkeypatch):
+    def _fail(path):
+        raise AssertionError("parser should not run for an image-only PDF")
+
+    monkeypatch.setattr(file_loader, "PDF_PARSERS", {name: _fail for name in file_loader.PDF_PARSERS})
+    with open("samples/blank.pdf", "rb") as f:
+        docs, errors = file_loader.load_documents([_upload("blank.pdf", f.read())])
+
+    assert docs == []
+    assert errors == ["blank.pdf: no readable text found; PDF may be scanned/image-only"]
+
+
+def test_text_pdf_records_parser_and_parse_time():
+    data = _text_pdf("Invoice total due within thirty days")
+    assert file_loader.probe_pdf(data) == {"pages": 1, "has_text": True, "encrypted": False}
+
+    docs, errors = file_loader.load_documents([_upload("invoice.pdf", data), _upload("note.txt", b"plain note")])
+
+    assert errors == []
+    assert [doc.metadata["parser"] for doc in docs] == ["pymupdf", "text"]
+    assert docs[0].metadata["source"] == "invoice.pdf" and "file_path" not in docs[0].metadata
+    assert all(doc.metadata["parse_time_ms"] >= 0 for doc in docs)
+
+
+def test_iter_documents_streams_pdf_pages_docx_and_legacy_text_from_memory():
+    import io
+    import pymupdf
+    import zipfile
+
+    with pymupdf.open() as pdf:
+        for number in range(3):
+            pdf.new_page().insert_text((72, 72), f"Clause {number} applies to the tenant")
+        pdf_bytes = pdf.tobytes()
+    docx = io.BytesIO()
+    with zipfile.ZipFile(docx, "w") as archive:
+        archive.writestr(
+            "word/document.xml",
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            "<w:body><w:p><w:r><w:t>Quarterly revenue grew</w:t></w:r></w:p></w:body></w:document>",
+        )
+    uploads = [
+        _upload("lease.pdf", pdf_bytes),
+        _upload("report.docx", docx.getvalue()),
+        _upload("notes.txt", "Café résumé".encode("cp1252")),
+    ]
+
+    errors = []
+    stream = file_loader.iter_documents(uploads, errors)
+    first = next(stream)
+    assert (first.metadata["page"], first.metadata["total_pages"]) == (0, 3)
+
+    rest = list(stream)
+    assert [doc.metadata.get("page") for doc in rest] == [1, 2, None, None]
+    assert rest[2].page_content == "Quarterly revenue grew"
+    assert rest[3].page_content == "Café résumé"
+    assert errors == []
@@ -0,0 +1,77 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.documents import Document
+
+import modules.index_cache as index_cache
+from modules import embedder, resources
+from modules.embedding_backends import create_embedding_backend
+from modules.lexical_index import BM25Index, lexical_terms
+
+TEXTS = [
+    "Section 4.2 limits liability to fees paid in the prior twelve months.",
+    "Liability for indirect damages is excluded under this agreement.",
+    "HbA1c was 7.9% indicating poorly controlled diabetes.",
+    "Blood glucose readings were stable across visits.",
+    "AAPL closed higher after earnings beat estimates.",
+]
+
+
+def _store():
+    docs = [Document(page_content=text, metadata={"source": f"doc{i}.txt"}) for i, text in enumerate(TEXTS)]
+    retriever, _ = embedder.create_vectorstore(docs, None, embedding_backend="local")
+    return retriever
+
+
+def test_lexical_terms_keep_codes_and_their_parts():
+    assert lexical_terms("Clause 4.2 and 10-K, HbA1c") == ["clause", "4.2", "and", "10-k", "hba1c", "4", "2", "10", "k"]
+
+
+def test_bm25_ranks_exact_terms_and_survives_remove_and_round_trip(tmp_path):
+    index = BM25Index.from_texts([f"d{i}" for i in range(len(TEXTS))], TEXTS)
+
+    assert index.search("hba1c", 3)[0][0] == "d2"
+    assert [doc_id for doc_id, _ in index.search("liability 4.2", 2)] == ["d0", "d1"]
+    assert index.search("nonexistent", 3) == []
+
+    assert index.remove(["d0"]) == 1
+    index.add(["d5"], ["Clause 4.2 was amended."])
+    assert index.search("4.2", 1)[0][0] == "d5"
+
+    index.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+    assert loaded.search("liability 4.2", 5) == index.search("liability 4.2", 5)
+
+
+def test_hybrid_retriever_finds_exact_codes_and_tracks_index_updates(monkeypatch, tmp_path):
+    retriever = _store()
+
+    assert retriever.invoke("AAPL", k=1)[0].page_content == TEXTS[4]
+    assert retriever.for_domain("Legal").weights != retriever.for_domain("Education").weights
+    assert retriever.for_domain("Legal").vectorstore is retriever.vectorstore
+
+    updated, _ = embedder.update_vectorstore(
+        retriever, [Document(page_content="TSLA fell on delivery numbers.", metadata={"source": "new.txt"})], ["doc4.txt"], None, embedding_backend="local"
+    )
+    assert updated.invoke("TSLA", k=1)[0].metadata["source"] == "new.txt"
+    assert all(doc.metadata["source"] != "doc4.txt" for doc in updated.invoke("AAPL", k=5))
+    # The original retriever keeps its own copy of both indexes.
+    assert retriever.invoke("AAPL", k=1)[0].page_content == TEXTS[4]
+
+    monkeypatch.setattr(index_cache, "INDEX_CACHE_DIR", str(tmp_path / "indexes"))
+    monkeypatch.setattr(resources, "_shared_indexes", resources.SharedIndexes())
+    index_cache.save_cached_index("fp", updated, {})
+    resources.get_shared_indexes().clear()
+    loaded, _ = index_cache.load_cached_index("fp", create_embedding_backend("local"))
+    assert loaded.vectorstore.lexical_index is not None
+    assert [doc.page_content for doc in loaded.invoke("TSLA", k=2)] == [doc.page_content for doc in updated.invoke("TSLA", k=2)]
+
+
+def test_bm25_concurrent_adds_keep_term_ids_unique():
+    index = BM25Index()
+    batches = [[f"w{t}x{i}" for i in range(200)] for t in range(8)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda t: index.add([f"t{t}d{i}" for i in range(200)], batches[t]), range(8)))
+
+    assert sorted(index.vocab.values()) == list(range(len(index.vocab)))
+    assert index.search("w3x7", 1)[0][0] == "t3d7"
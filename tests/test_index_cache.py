@@ -0,0 +1,78 @@
+import os
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import modules.index_cache as index_cache
+from modules import resources
+
+
+def _use_tmp_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(index_cache, "INDEX_CACHE_DIR", str(tmp_path / "indexes"))
+    monkeypatch.setattr(resources, "_shared_indexes", resources.SharedIndexes())
+    monkeypatch.setattr(index_cache, "_stats", dict.fromkeys(index_cache._stats, 0))
+
+
+def test_corpus_fingerprint_ignores_upload_order():
+    a = index_cache.file_digest(b"first")
+    b = index_cache.file_digest(b"second")
+
+    assert index_cache.corpus_fingerprint([a, b]) == index_cache.corpus_fingerprint([b, a])
+    assert index_cache.corpus_fingerprint([a, b], "m1") != index_cache.corpus_fingerprint([a, b], "m2")
+
+
+def test_index_cache_round_trip_from_disk(monkeypatch, tmp_path):
+    _use_tmp_cache(monkeypatch, tmp_path)
+    embeddings = DeterministicFakeEmbedding(size=8)
+    store = FAISS.from_texts(["alpha", "beta"], embeddings)
+    fingerprint = index_cache.corpus_fingerprint([index_cache.file_digest(b"x")])
+
+    assert index_cache.load_cached_index(fingerprint, embeddings) is None
+    index_cache.save_cached_index(fingerprint, store.as_retriever(), {"chunk_count": 2})
+
+    # Simulate a process restart: only the on-disk copy remains.
+    resources.get_shared_indexes().clear()
+    retriever, manifest = index_cache.load_cached_index(fingerprint, embeddings)
+
+    assert manifest["chunk_count"] == 2
+    assert retriever.vectorstore.index.ntotal == 2
+    assert index_cache.cache_stats()["disk_hits"] == 1
+    assert index_cache.cache_stats()["misses"] == 1
+
+
+def test_index_cache_evicts_by_size(monkeypatch, tmp_path):
+    _use_tmp_cache(monkeypatch, tmp_path)
+    embeddings = DeterministicFakeEmbedding(size=8)
+    for i in range(3):
+        store = FAISS.from_texts([f"text {i}"], embeddings)
+        index_cache.save_cached_index(f"fp{i}", store.as_retriever(), {"chunk_count": 1})
+
+    evicted = index_cache.evict_cached_indexes(max_bytes=0)
+
+    assert evicted == 3
+    assert os.listdir(index_cache.INDEX_CACHE_DIR) == []
+
+
+def test_memory_hits_keep_the_disk_entry_from_aging_out(monkeypatch, tmp_path):
+    _use_tmp_cache(monkeypatch, tmp_path)
+    embeddings = DeterministicFakeEmbedding(size=8)
+    store = FAISS.from_texts(["alpha"], embeddings)
+    index_cache.save_cached_index("fp", store.as_retriever(), {"chunk_count": 1})
+    manifest_path = os.path.join(index_cache.INDEX_CACHE_DIR, "fp", index_cache.MANIFEST_NAME)
+    os.utime(manifest_path, (0, 0))
+
+    assert index_cache.load_cached_index("fp", embeddings) is not None
+    assert index_cache.cache_stats()["memory_hits"] == 1
+
+    assert index_cache.evict_cached_indexes(max_age_seconds=3600) == 0
+    assert os.path.exists(manifest_path)
+
+
+def test_diff_manifest_reports_added_changed_and_removed_files():
+    previous = {"a.txt": "1", "b.txt": "2", "c.txt": "3"}
+    current = {"a.txt": "1", "b.txt": "changed", "d.txt": "4"}
+
+    added, removed = index_cache.diff_manifest(previous, current)
+
+    assert added == ["b.txt", "d.txt"]
+    assert removed == ["b.txt", "c.txt"]
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+import modules.embedder as embedder
+from modules.index_factory import build_index, remove_positions, resolve_index_spec
+
+
+def test_resolve_index_spec_auto_picks_by_corpus_size():
+    assert resolve_index_spec("auto", 1_000, 1536)["type"] == "flat"
+    assert resolve_index_spec("auto", 100_000, 1536)["type"] == "ivf_flat"
+    pq = resolve_index_spec("auto", 1_000_000, 1536)
+    assert pq["type"] == "ivf_pq"
+    assert 1536 % pq["m"] == 0
+
+
+def test_resolve_index_spec_reads_the_default_type_at_call_time(monkeypatch):
+    # `.env` is loaded after the modules are imported, so the setting must not be frozen at import.
+    monkeypatch.setenv("BRAINDOC_INDEX_TYPE", "hnsw")
+    assert resolve_index_spec(None, 1_000, 32)["type"] == "hnsw"
+    monkeypatch.delenv("BRAINDOC_INDEX_TYPE")
+    assert resolve_index_spec(None, 1_000, 32)["type"] == "flat"
+
+
+def test_resolve_index_spec_clamps_to_training_data():
+    spec = resolve_index_spec({"type": "ivf_flat", "nlist": 4096, "nprobe": 64}, 1_000, 32)
+
+    assert spec["nlist"] == 1_000 // 39
+    assert spec["nprobe"] <= spec["nlist"]
+    with pytest.raises(ValueError):
+        resolve_index_spec("annoy", 10, 8)
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "hnsw", "ivf_pq"])
+def test_remove_positions_renumbers_rows_exactly(index_type):
+    matrix = np.random.default_rng(0).standard_normal((2_000, 16)).astype(np.float32)
+    index = build_index(matrix, resolve_index_spec(index_type, len(matrix), 16))
+    third = index.reconstruct(2).copy()
+
+    index = remove_positions(index, [0, 1])
+    index.add(matrix[:1])
+
+    assert index.ntotal == 1_999
+    assert np.allclose(index.reconstruct(0), third)
+    assert index.search(matrix[:1], 1)[1][0, 0] == 1_998
+
+
+def test_remove_sources_on_hnsw_store_keeps_mapping_aligned():
+    docs = [Document(page_content=f"{src} chunk {i}", metadata={"source": src}) for src in ("a", "b") for i in range(20)]
+    embeddings = DeterministicFakeEmbedding(size=8)
+    store, _ = embedder.add_documents(None, docs, embeddings, index_spec="hnsw")
+
+    assert embedder.remove_sources(store, ["a"]) == 20
+    hit = store.similarity_search("b chunk 7", k=1)[0]
+    assert hit.page_content == "b chunk 7"
+    assert store.index.ntotal == len(store.index_to_docstore_id) == 20
@@ -0,0 +1,67 @@
+import time
+from types import SimpleNamespace
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from modules import ingest
+from modules.embedding_backends import create_embedding_backend
+
+
+def _upload(name: str, content: bytes):
+    return SimpleNamespace(name=name, read=lambda: content)
+
+
+class RecordingEmbeddings(DeterministicFakeEmbedding):
+    log: list = []
+
+    def embed_documents(self, texts):
+        self.log.append(("embed", {text.split()[0] for text in texts}))
+        return super().embed_documents(texts)
+
+
+def test_ingest_overlaps_parsing_with_embedding(monkeypatch):
+    embeddings = RecordingEmbeddings(size=8, log=[])
+    log = embeddings.log
+    real_iter = ingest.iter_file_documents
+
+    def slow_iter(name, data, errors, timings=None, domain=None):
+        time.sleep(0.2)
+        yield from real_iter(name, data, errors, timings, domain)
+        log.append(("parsed", name))
+
+    monkeypatch.setattr(ingest, "iter_file_documents", slow_iter)
+    uploads = [_upload(f"f{i}.txt", f"f{i}.txt body text".encode()) for i in range(3)]
+
+    events = []
+    store, load_errors, embed_errors = ingest.ingest_uploads(uploads, embeddings, on_progress=events.append)
+
+    assert store.index.ntotal == 3 and load_errors == [] and embed_errors == []
+    # File 0 is embedded before file 1 has finished parsing.
+    assert log.index(("embed", {"f0.txt"})) < log.index(("parsed", "f1.txt"))
+    assert [(e["file"], e["files_done"], e["files_total"]) for e in events] == [
+        ("f0.txt", 1, 3),
+        ("f1.txt", 2, 3),
+        ("f2.txt", 3, 3),
+    ]
+
+
+def test_ingest_keeps_order_reports_errors_and_extends_existing_store():
+    embeddings = create_embedding_backend("local")
+    uploads = [_upload("a.txt", b"alpha " * 400), _upload("bad.xlsx", b"x"), _upload("b.txt", b"beta")]
+
+    events = []
+    store, load_errors, _ = ingest.ingest_uploads(
+        uploads, embeddings, batch_chunks=2, queue_chunks=1, on_progress=events.append
+    )
+    store, _, _ = ingest.ingest_uploads([_upload("c.txt", b"gamma")], embeddings, vectorstore=store)
+
+    sources = [store.docstore.search(doc_id).metadata["source"] for _, doc_id in sorted(store.index_to_docstore_id.items())]
+    assert sources == ["a.txt"] * (len(sources) - 2) + ["b.txt", "c.txt"]
+    assert len(sources) > 3
+    assert load_errors == ["Unsupported file type for bad.xlsx"]
+    # Each progress event carries only its own file's errors.
+    assert {e["file"]: e["load_errors"] for e in events} == {
+        "a.txt": [],
+        "bad.xlsx": ["Unsupported file type for bad.xlsx"],
+        "b.txt": [],
+    }
@@ -0,0 +1,75 @@
+import logging
+import socket
+import urllib.request
+
+import pytest
+from langchain_core.language_models import FakeListChatModel
+
+from modules import metrics
+from modules.embedder import create_vectorstore
+from modules.file_loader import load_documents
+from modules.metrics import REGISTRY, span
+from modules.qa_chain import build_qa_chain
+
+
+class _Upload:
+    def __init__(self, name: str, content: bytes):
+        self.name = name
+        self._content = content
+
+    def getvalue(self):
+        return self._content
+
+
+@pytest.fixture(autouse=True)
+def _fresh_registry():
+    REGISTRY.reset()
+    yield
+    REGISTRY.reset()
+
+
+def test_pipeline_stages_tokens_and_structured_logs(caplog):
+    caplog.set_level(logging.INFO, logger="braindoc.metrics")
+    docs, _ = load_documents([_Upload("notes.txt", b"The final exam is worth forty percent.")])
+    retriever, _ = create_vectorstore(docs, None, embedding_backend="local")
+    chain = build_qa_chain(retriever, "test-key", "Education", max_source_docs=1)
+    chain.llm = FakeListChatModel(responses=["Forty percent."])
+    chain.run("How much is the final exam worth?")
+
+    snapshot = REGISTRY.snapshot()
+    assert {"parse", "split", "embed", "index_build", "retrieve", "prompt", "llm"} <= set(snapshot["stages"])
+    counters = snapshot["counters"]
+    assert counters["chunks_parsed"] == 1 and counters["chunks_embedded"] == 1
+    assert counters["llm_calls"] == 1 and counters["prompt_tokens"] > counters["completion_tokens"] > 0
+    assert 'braindoc_stage_calls_total{stage="llm"} 1' in REGISTRY.to_prometheus()
+    assert snapshot["stages"]["llm"]["p95_ms"] == snapshot["stages"]["llm"]["max_ms"]
+    assert 'braindoc_stage_seconds{stage="llm",quantile="0.95"}' in REGISTRY.to_prometheus()
+    assert any('"stage": "embed"' in record.getMessage() for record in caplog.records)
+
+
+def test_disabled_metrics_record_nothing(monkeypatch, tmp_path):
+    # Read per call, so a value loaded from .env after import applies.
+    monkeypatch.setenv("BRAINDOC_METRICS", "off")
+    with span("embed", chunks=3) as stage:
+        stage.set(failed=0)
+    metrics.record_llm_usage("gpt-3.5-turbo", 100, 10)
+
+    assert REGISTRY.snapshot() == {"stages": {}, "counters": {}}
+    assert metrics.export_metrics(str(tmp_path / "metrics.prom")) is None
+
+
+def test_cost_estimate_file_export_and_endpoint(tmp_path):
+    metrics.record_llm_usage("gpt-3.5-turbo", 1_000_000, 1_000_000)
+    metrics.record_llm_usage("unknown-model", 1_234_567, 5)
+    assert REGISTRY.snapshot()["counters"]["cost_usd"] == pytest.approx(2.0)
+
+    path = metrics.export_metrics(str(tmp_path / "metrics.prom"))
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = metrics.start_metrics_server(port=port)
+    body = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics").read().decode()
+
+    assert metrics.start_metrics_server(port=port) is server
+    assert body == open(path, encoding="utf-8").read()
+    assert "braindoc_prompt_tokens_total 2234567\n" in body
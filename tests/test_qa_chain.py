@@ -0,0 +1,191 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from modules import qa_chain
+from modules.embedder import create_vectorstore
+from modules.qa_chain import AnswerCache, build_qa_chain
+
+
+def _chain(answer: str, **kwargs):
+    retriever, _ = create_vectorstore(
+        [
+            Document(page_content="Late assignments lose ten percent per day.", metadata={"source": "syllabus.txt"}),
+            Document(page_content="The final exam is worth forty percent.", metadata={"source": "syllabus.txt"}),
+        ],
+        None,
+        embedding_backend="local",
+    )
+    chain = build_qa_chain(retriever, "test-key", "Education", max_source_docs=1, **kwargs)
+    chain.llm = FakeListChatModel(responses=[answer])
+    return chain
+
+
+def test_stream_emits_sources_first_then_tokens_then_assembled_answer():
+    chain = _chain("Ten percent per day.")
+
+    events = list(chain.stream("How much do late assignments lose per day?"))
+
+    assert events[0]["type"] == "sources"
+    assert [doc.page_content for doc in events[0]["sources"]] == ["Late assignments lose ten percent per day."]
+    tokens = [event["text"] for event in events[1:-1]]
+    assert all(event["type"] == "token" for event in events[1:-1]) and len(tokens) > 1
+    assert events[-1] == {"type": "done", "answer": "".join(tokens), "sources": events[0]["sources"], "cached": False}
+    assert events[-1]["answer"] == "Ten percent per day."
+
+
+def test_run_matches_stream_result():
+    assert _chain("Forty percent.").run("How much is the final exam worth?")["answer"] == "Forty percent."
+
+
+class _ScriptedModel:
+    """Answers each call after the next scripted delay, raising when the script says so."""
+
+    model_name = "scripted"
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        delay, outcome = self.script[min(self.calls, len(self.script) - 1)]
+        self.calls += 1
+        await asyncio.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return AIMessage(content=outcome)
+
+    async def astream(self, messages):
+        answer = await self.ainvoke(messages)
+        for word in answer.content.split(" "):
+            yield AIMessageChunk(content=word + " ")
+
+
+def test_arun_retries_past_a_missed_deadline(monkeypatch):
+    monkeypatch.setattr(qa_chain, "LLM_BACKOFF_BASE_SECONDS", 0.0)
+    chain = _chain("unused")
+    chain.llm = _ScriptedModel((5.0, "too late"), (0.0, "Forty percent."))
+
+    result = asyncio.run(chain.arun("How much is the final exam worth?", timeout=0.2, retries=1))
+
+    assert result["answer"] == "Forty percent." and chain.llm.calls == 2
+    chain.llm = _ScriptedModel((5.0, "too late"))
+    with pytest.raises(TimeoutError):
+        chain.run("What about late work?", timeout=0.05, retries=1)
+    chain.llm = _ScriptedModel((0.0, ValueError("bad request")), (0.0, "unreachable"))
+    with pytest.raises(ValueError):
+        chain.run("And office hours?", retries=3)
+    assert chain.llm.calls == 1
+    # Defaults come from the environment when the call is made, after `.env` is loaded.
+    monkeypatch.setenv("BRAINDOC_LLM_TIMEOUT", "0.05")
+    monkeypatch.setenv("BRAINDOC_LLM_RETRIES", "0")
+    chain.llm = _ScriptedModel((5.0, "too late"))
+    with pytest.raises(TimeoutError):
+        chain.run("What is the attendance policy?")
+    assert chain.llm.calls == 1
+
+
+def test_stream_retries_a_missed_first_token_deadline(monkeypatch):
+    monkeypatch.setattr(qa_chain, "LLM_BACKOFF_BASE_SECONDS", 0.0)
+    chain = _chain("unused")
+    chain.llm = _ScriptedModel((5.0, "too late"), (0.0, "Forty percent."))
+
+    events = list(chain.stream("How much is the final exam worth?", timeout=0.2, retries=1))
+
+    assert events[-1]["answer"] == "Forty percent. " and chain.llm.calls == 2
+    chain.llm = _ScriptedModel((5.0, "too late"))
+    with pytest.raises(TimeoutError):
+        list(chain.stream("What about late work?", timeout=0.05, retries=0))
+
+
+def test_hedged_call_takes_the_first_answer(monkeypatch):
+    monkeypatch.setattr(qa_chain, "LLM_HEDGE_DEFAULT_DELAY_SECONDS", 0.05)
+    chain = _chain("unused")
+    chain.llm = _ScriptedModel((5.0, "slow"), (0.0, "Forty percent."))
+    chain.llm.model_name = "scripted-hedge"
+
+    started = time.perf_counter()
+    result = chain.run("How much is the final exam worth?", hedge=True)
+
+    assert result["answer"] == "Forty percent." and chain.llm.calls == 2
+    assert time.perf_counter() - started < 2.0
+    # Only the cancelled first request is timed, at least as long as it ran; not the winning hedge.
+    window = qa_chain.llm_latency("scripted-hedge")
+    for _ in range(100):
+        if len(window):
+            break
+        time.sleep(0.01)
+    assert len(window) == 1 and window.percentile(1.0) >= 0.05
+    for _ in range(qa_chain.LLM_HEDGE_MIN_SAMPLES):
+        window.add(0.3)
+    assert qa_chain.hedge_delay("scripted-hedge") == 0.3
+
+
+def test_answer_cache_hits_exact_and_near_duplicate_questions(tmp_path):
+    # The hashing test backend scores paraphrases lower than a neural model would.
+    cache = AnswerCache(str(tmp_path / "answers.sqlite3"), similarity_threshold=0.9)
+    chain = _chain("Forty percent.", corpus_id="corpus-1", answer_cache=cache)
+    embedded = []
+    embeddings = chain.retriever.vectorstore.embedding_function
+    embed_query = embeddings.embed_query
+    chain.retriever.vectorstore.embedding_function = type(
+        "Counting", (), {"embed_query": lambda self, text: embedded.append(text) or embed_query(text)}
+    )()
+
+    first = chain.run("How much is the final exam worth?")
+    # The vector made for the near-duplicate lookup is reused by retrieval.
+    assert len(embedded) == 1
+    chain.retriever.vectorstore.embedding_function = embeddings
+    chain.llm = FakeListChatModel(responses=["should not be called"])
+    again = chain.run("  how much is the FINAL exam worth ")
+    streamed = list(chain.stream("How much is the final exam worth now?"))
+
+    assert first["cached"] is False and again["cached"] is True
+    assert again["answer"] == "Forty percent."
+    assert [doc.page_content for doc in again["sources"]] == [doc.page_content for doc in first["sources"]]
+    assert streamed[-1]["cached"] is True and streamed[-1]["answer"] == "Forty percent."
+    assert cache.stats == {"hits": 1, "similar_hits": 1, "misses": 1}
+
+    # Another corpus or domain never shares answers; expired entries are ignored.
+    other = _chain("Different.", corpus_id="corpus-2", answer_cache=cache)
+    assert other.run("How much is the final exam worth?")["cached"] is False
+    cache.similarity_threshold = None
+    cache.ttl_seconds = 0
+    assert chain.run("How much is the final exam worth?")["cached"] is False
+
+
+def test_answer_cache_only_reuses_exact_questions_by_default(tmp_path):
+    cache = AnswerCache(str(tmp_path / "answers.sqlite3"))
+    chain = _chain("Sixty days.", corpus_id="corpus-1", answer_cache=cache)
+    tenant, landlord = (
+        "What is the notice period for termination by the tenant?",
+        "What is the notice period for termination by the landlord?",
+    )
+    similarity = np.dot(*chain.retriever.vectorstore.embedding_function.embed_documents([tenant, landlord]))
+    assert similarity > 0.8
+
+    assert chain.run(tenant)["cached"] is False
+    chain.llm = FakeListChatModel(responses=["Thirty days."])
+    result = chain.run(landlord)
+    assert result["cached"] is False and result["answer"] == "Thirty days."
+    assert cache.stats == {"hits": 0, "similar_hits": 0, "misses": 2}
+
+
+def test_answer_cache_persists_and_evicts_least_recently_used(tmp_path):
+    path = str(tmp_path / "answers.sqlite3")
+    cache = AnswerCache(path, max_entries=2)
+    for question in ("q1", "q2"):
+        cache.put("c", "Legal", question, f"answer {question}", [])
+    assert cache.get("c", "Legal", "q1") is not None
+    cache.put("c", "Legal", "q3", "answer q3", [])
+    cache.close()
+
+    reopened = AnswerCache(path, max_entries=2)
+    assert reopened.get("c", "Legal", "q2") is None
+    assert reopened.get("c", "Legal", "Q1?")["answer"] == "answer q1"
+    assert reopened.get("c", "Legal", "q3")["answer"] == "answer q3"
@@ -0,0 +1,33 @@
+from modules.rate_limiter import TokenBucket, backoff_delay
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_token_bucket_waits_for_refill():
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock=clock, sleep=clock.sleep)
+
+    assert bucket.acquire(60) == 0.0
+    waited = bucket.acquire(30)
+
+    assert abs(waited - 30.0) < 1e-6
+
+
+def test_token_bucket_clamps_oversized_requests():
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock=clock, sleep=clock.sleep)
+
+    assert bucket.acquire(1000) == 0.0
+
+
+def test_backoff_delay_is_capped():
+    assert all(0 <= backoff_delay(attempt, 0.5, 2.0) <= 2.0 for attempt in range(10))
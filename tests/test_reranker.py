@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.language_models import FakeListChatModel
+
+from modules import embedder
+from modules.embedding_backends import create_embedding_backend
+from modules.qa_chain import build_qa_chain
+from modules.reranker import docstore_positions, mmr_select
+
+DOCS = [
+    Document(page_content="Late assignments lose ten percent per day.", metadata={"source": "syllabus.txt"}),
+    Document(page_content="Late assignments lose ten percent per day.", metadata={"source": "syllabus-copy.txt"}),
+    Document(page_content="Late assignments are not accepted after one week.", metadata={"source": "policy.txt"}),
+    Document(page_content="The final exam is worth forty percent.", metadata={"source": "syllabus.txt"}),
+]
+
+
+def test_mmr_prefers_novel_rows_and_drops_near_duplicates():
+    vectors = np.array([[1.0, 0.0, 0.0], [1.0, 0.01, 0.0], [0.6, 0.8, 0.0], [0.0, 0.0, 1.0]], dtype=np.float32)
+
+    picked, scores = mmr_select(vectors, np.array([1.0, 0.99, 0.6, 0.5]), k=3)
+
+    # Row 1 duplicates row 0; the unrelated row 3 beats the more relevant but overlapping row 2.
+    assert picked == [0, 3, 2]
+    assert scores == sorted(scores, reverse=True)
+    # Without the novelty term the order is plain relevance, still without the duplicate.
+    assert mmr_select(vectors, np.array([1.0, 0.99, 0.6, 0.5]), k=4, lambda_mult=1.0)[0] == [0, 2, 3]
+
+
+def test_docstore_positions_follow_appends_and_replaced_mappings():
+    store = SimpleNamespace(index_to_docstore_id={0: "a", 1: "b"})
+    assert docstore_positions(store) == {"a": 0, "b": 1}
+
+    store.index_to_docstore_id[2] = "c"
+    assert docstore_positions(store) == {"a": 0, "b": 1, "c": 2}
+
+    # A removal swaps in a new mapping of the same length; the old inverse must not be reused.
+    store.index_to_docstore_id = {0: "b", 1: "c", 2: "d"}
+    assert docstore_positions(store) == {"b": 0, "c": 1, "d": 2}
+
+
+def test_stored_vectors_come_from_the_index_for_single_and_sharded_stores():
+    local = create_embedding_backend("local")
+    expected = np.asarray(local.embed_documents([doc.page_content for doc in DOCS]), dtype=np.float32)
+    for shard_by in (None, "source"):
+        retriever, _ = embedder.create_vectorstore(DOCS, None, embedding_backend="local", shard_by=shard_by)
+        hits = retriever.invoke("late assignments", k=4)
+        rows = [next(i for i, doc in enumerate(DOCS) if doc.metadata == hit.metadata and doc.page_content == hit.page_content) for hit in hits]
+
+        vectors = retriever.stored_vectors(hits)
+
+        assert np.allclose(vectors, expected[rows], atol=1e-5)
+        assert retriever.stored_vectors(hits + [Document(page_content="elsewhere", id="missing")]) is None
+
+
+def test_chain_returns_diverse_scored_sources():
+    retriever, _ = embedder.create_vectorstore(DOCS, None, embedding_backend="local")
+    chain = build_qa_chain(retriever, None, "Education", max_source_docs=2, llm=FakeListChatModel(responses=["Ten percent."]))
+
+    sources = chain.run("What happens to late assignments?")["sources"]
+
+    assert len({doc.page_content for doc in sources}) == len(sources) == 2
+    assert sources[0].metadata["relevance_score"] == 1.0
+    assert all("mmr_score" in doc.metadata for doc in sources)
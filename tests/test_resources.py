@@ -0,0 +1,66 @@
+from langchain_core.documents import Document
+
+import modules.index_cache as index_cache
+from modules import embedder, resources
+from modules.embedding_backends import create_embedding_backend
+from modules.resources import SharedIndexes, shared_client
+
+
+def test_shared_indexes_evict_idle_entries_over_budget():
+    shared = SharedIndexes(budget_bytes=100, idle_seconds=0)
+    shared.put("a", "A", resident_bytes=60)
+    shared.put("b", "B", resident_bytes=30, mapped_bytes=500)
+    assert shared.get("a") == "A"
+
+    # "b" is now least recently used and goes first; mapped bytes are never charged.
+    assert shared.put("c", "C", resident_bytes=30) == 1
+    assert "b" not in shared and shared.get("a") == "A"
+
+    busy = SharedIndexes(budget_bytes=10, idle_seconds=60)
+    busy.put("a", "A", resident_bytes=50)
+    assert busy.put("b", "B", resident_bytes=50) == 0
+    assert busy.residency()["resident_bytes"] == 100
+
+
+def test_shared_index_budget_and_mmap_come_from_the_environment_when_used(monkeypatch):
+    monkeypatch.setenv("BRAINDOC_INDEX_MEMORY_MB", "2")
+    monkeypatch.setenv("BRAINDOC_INDEX_MMAP", "off")
+    assert SharedIndexes().budget_bytes == 2 * 1024 * 1024
+    assert not resources.index_mmap()
+
+
+def test_shared_client_builds_once_per_kind_and_key(monkeypatch):
+    monkeypatch.setattr(resources, "_clients", {})
+    built = []
+
+    def factory():
+        built.append(object())
+        return built[-1]
+
+    first = shared_client("chat", "key-1", factory)
+    assert shared_client("chat", "key-1", factory) is first
+    assert shared_client("chat", "key-2", factory) is not first
+    assert len(built) == 2
+    assert all("key-1" not in str(key) for key in resources._clients)
+
+
+def test_memory_mapped_index_is_shared_and_copied_before_edits(monkeypatch, tmp_path):
+    monkeypatch.setattr(index_cache, "INDEX_CACHE_DIR", str(tmp_path / "indexes"))
+    monkeypatch.setattr(resources, "_shared_indexes", SharedIndexes())
+    monkeypatch.setenv("BRAINDOC_INDEX_MMAP", "on")
+    docs = [Document(page_content=f"Clause {i} covers renewal terms.", metadata={"source": "a.txt"}) for i in range(3)]
+    retriever, _ = embedder.create_vectorstore(docs, None, embedding_backend="local")
+    index_cache.save_cached_index("fp", retriever, {})
+    resources.get_shared_indexes().clear()
+
+    embeddings = create_embedding_backend("local")
+    loaded, _ = index_cache.load_cached_index("fp", embeddings)
+    assert loaded.vectorstore.memory_mapped
+    assert index_cache.load_cached_index("fp", embeddings)[0] is loaded
+    assert resources.resource_stats()["mapped_bytes"] > 0
+
+    updated, _ = embedder.update_vectorstore(
+        loaded, [Document(page_content="Payment is due in thirty days.", metadata={"source": "b.txt"})], [], None, embedding_backend="local"
+    )
+    assert updated.vectorstore.index.ntotal == 4
+    assert loaded.vectorstore.index.ntotal == 3
@@ -0,0 +1,81 @@
+from langchain_core.documents import Document
+from langchain_core.language_models import FakeListChatModel
+
+from modules import embedder
+from modules.qa_chain import AnswerCache, build_qa_chain
+from modules.sharded_retriever import ShardedRetriever, plan_shards
+
+DOCS = [
+    Document(page_content="The licensee may not sublicense the software.", metadata={"source": "license.txt"}),
+    Document(page_content="Liability is limited to fees paid in the prior twelve months.", metadata={"source": "license.txt"}),
+    Document(page_content="The final exam is worth forty percent.", metadata={"source": "syllabus.txt"}),
+    Document(page_content="Late assignments lose ten percent per day.", metadata={"source": "syllabus.txt"}),
+    Document(page_content="Revenue grew twelve percent on subscription sales.", metadata={"source": "report.txt"}),
+]
+
+
+def _ids(docs):
+    return [doc.page_content for doc in docs]
+
+
+def test_plan_shards_by_source_and_by_size():
+    assert list(plan_shards(DOCS, "source").values()) == [[0, 1], [2, 3], [4]]
+    by_size = list(plan_shards(DOCS, 3).values())
+    # Whole files stay together while they fit.
+    assert by_size == [[0, 1], [2, 3, 4]]
+    # A file larger than a shard is split, and the next file starts a new shard.
+    assert list(plan_shards(DOCS[:4] + DOCS[:4], 3).values()) == [[0, 1, 4], [5], [2, 3, 6], [7]]
+
+
+def test_sharded_search_matches_single_index_and_filters_sources():
+    sharded, _ = embedder.create_vectorstore(DOCS, None, embedding_backend="local", shard_by="source")
+    single, _ = embedder.create_vectorstore(DOCS, None, embedding_backend="local")
+    assert isinstance(sharded, ShardedRetriever) and sharded.ntotal == 5
+    assert sharded.sources() == ["license.txt", "report.txt", "syllabus.txt"]
+
+    # Dense scores are comparable across shards, so the merged ranking is the global one.
+    dense_sharded = sharded.model_copy(update={"weights": (1.0, 0.0)})
+    dense_single = single.model_copy(update={"weights": (1.0, 0.0)})
+    for query in ("final exam percent", "software sublicense", "revenue growth"):
+        assert _ids(dense_sharded.invoke(query, k=3)) == _ids(dense_single.invoke(query, k=3))
+
+    queries = ["twelve percent", "exam"]
+    vectors = sharded.embedding_function.embed_documents(queries)
+    batched = sharded.batch_retrieve(queries, vectors, k=2)
+    assert [_ids(docs) for docs in batched] == [_ids(sharded.invoke(query, k=2)) for query in queries]
+
+    for retriever in (sharded, single):
+        hits = retriever.invoke("twelve percent", k=3, sources={"report.txt"})
+        assert {doc.metadata["source"] for doc in hits} == {"report.txt"}
+
+
+def test_update_copies_only_shards_that_change():
+    retriever, _ = embedder.create_vectorstore(DOCS, None, embedding_backend="local", shard_by="source")
+    added = [Document(page_content="Office hours are on Tuesdays.", metadata={"source": "notes.txt"})]
+
+    updated, skipped = embedder.update_vectorstore(
+        retriever, added, ["report.txt"], None, embedding_backend="local"
+    )
+
+    assert skipped == []
+    assert sorted(updated.shards) == ["license.txt", "notes.txt", "syllabus.txt"]
+    assert updated.shards["license.txt"] is retriever.shards["license.txt"]
+    assert "report.txt" in retriever.shards
+    assert updated.invoke("office hours", k=1)[0].metadata["source"] == "notes.txt"
+
+
+def test_chain_restricts_questions_to_selected_sources(tmp_path):
+    retriever, _ = embedder.create_vectorstore(DOCS, None, embedding_backend="local", shard_by="source")
+    cache = AnswerCache(str(tmp_path / "answers.sqlite3"))
+    chain = build_qa_chain(
+        retriever, None, "Legal", max_source_docs=2, corpus_id="c", answer_cache=cache,
+        llm=FakeListChatModel(responses=["Twelve percent.", "Twelve months."]),
+    )
+
+    everywhere = chain.run("What grew twelve percent?")
+    license_only = chain.run("What grew twelve percent?", sources=["license.txt"])
+
+    assert license_only["cached"] is False
+    assert {doc.metadata["source"] for doc in license_only["sources"]} == {"license.txt"}
+    assert everywhere["answer"] == "Twelve percent." and license_only["answer"] == "Twelve months."
+    assert chain.run("What grew twelve percent?", sources=["license.txt"])["cached"] is True
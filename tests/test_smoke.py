@@ -1,4 +1,5 @@
-import os
+import pickle
+import sqlite3
 from types import SimpleNamespace
 import modules.memory_manager as memory_manager
 from modules.domain_prompts import get_domain_prompt
@@ -34,24 +35,58 @@ def test_domain_prompt_defaults_to_education():
     assert "action checklist" in prompt["suffix"].lower()
 
 
-def test_memory_manager_trims_history(tmp_path):
-    original_path = memory_manager.HISTORY_PATH
-    original_max = memory_manager.MAX_HISTORY_ITEMS
-
-    temp_path = tmp_path / "history.pkl"
-    memory_manager.HISTORY_PATH = str(temp_path)
-    memory_manager.MAX_HISTORY_ITEMS = 3
-
-    try:
-        history = [(f"q{i}", f"a{i}") for i in range(5)]
-        memory_manager.save_chat_history(history)
-        loaded = memory_manager.load_chat_history()
-
-        assert len(loaded) == 3
-        assert loaded[0][0] == "q2"
-        assert loaded[-1][0] == "q4"
-    finally:
-        memory_manager.HISTORY_PATH = original_path
-        memory_manager.MAX_HISTORY_ITEMS = original_max
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+def test_memory_manager_loads_recent_history_and_pages_older_turns(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory_manager, "HISTORY_DB_PATH", str(tmp_path / "history.sqlite3"))
+    monkeypatch.setattr(memory_manager, "HISTORY_PATH", str(tmp_path / "history.pkl"))
+    monkeypatch.setattr(memory_manager, "MAX_HISTORY_ITEMS", 3)
+
+    for i in range(5):
+        memory_manager.append_chat_turn(f"q{i}", f"a{i}")
+    memory_manager.append_chat_turn("other", "session", session="user-2")
+    loaded = memory_manager.load_chat_history()
+
+    assert loaded == [("q2", "a2"), ("q3", "a3"), ("q4", "a4")]
+    store = memory_manager.get_history_store()
+    first = store.page(limit=2)
+    older = store.page(limit=2, before_id=first[-1]["id"])
+    assert [turn["question"] for turn in first + older] == ["q4", "q3", "q2", "q1"]
+    assert store.count() == 5 and store.sessions() == ["default", "user-2"]
+    assert memory_manager.load_chat_history("user-2") == [("other", "session")]
+
+
+def test_memory_manager_migrates_pickle_history_once(tmp_path):
+    legacy = tmp_path / "chat_history.pkl"
+    legacy.write_bytes(pickle.dumps([("q0", "a0"), ("bad",), ("q1", "a1")]))
+    store = memory_manager.HistoryStore(str(tmp_path / "history.sqlite3"))
+
+    assert store.import_pickle(str(legacy)) == 2
+    assert not legacy.exists() and (tmp_path / "chat_history.pkl.migrated").exists()
+    # A restored copy of the same file is not imported a second time.
+    legacy.write_bytes(pickle.dumps([("q0", "a0")]))
+    assert store.import_pickle(str(legacy)) == 0
+    assert store.recent() == [("q0", "a0"), ("q1", "a1")]
+
+
+def test_history_search_and_lazy_answers(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    # A store written before search existed gets its questions indexed on open.
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE turns (id INTEGER PRIMARY KEY AUTOINCREMENT, session TEXT NOT NULL,"
+            " question TEXT NOT NULL, answer TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        conn.executemany(
+            "INSERT INTO turns (session, question, answer, created_at) VALUES ('default', ?, ?, 0)",
+            [("What does clause 4.2 say about termination?", "Thirty days notice."), ("What is the HbA1c target?", "Below 7%.")],
+        )
+    conn.close()
+
+    store = memory_manager.HistoryStore(path)
+    store.append("Termination fees?", "None.")
+    matches = store.page(query="terminat", answers=False)
+
+    assert store.full_text
+    assert [turn["question"] for turn in matches] == ["Termination fees?", "What does clause 4.2 say about termination?"]
+    assert "answer" not in matches[0]
+    assert store.get_turn(matches[1]["id"])["answer"] == "Thirty days notice."
+    assert [turn["answer"] for turn in store.page(query="hba1c")] == ["Below 7%."]